@@ -23,7 +23,7 @@ const textToSpeech = require('@google-cloud/text-to-speech');
 
 // Import application cache and helper functions
 const { isCacheValid, defaultLimit, appCache, tts_prefix } = require('./bkds_router_functions_state');
-const { shuffleArray, processMedia, fetchAndTransformInsights, getIconsData, updateIconUrls } = require('./bkds_router_functions');
+const { shuffleArray, processMedia, fetchAndTransformInsights, readFeedPage, getIconsData, updateIconUrls } = require('./bkds_router_functions');
 rootNode= 'http://localhost:3000'
 
 
@@ -463,15 +463,10 @@ router.get(globalEndpoints.imageGrid, async (req, res) => {
     logger.info('Using image-grid type: ', type);
 
     try {
-        // Use BASE_PATHS.images instead of hardcoded path
-        const jsonFilePath = path.join(BASE_PATHS.images, `master_image_${type}_index.json`); 
-        const jsonData = await fs.readFile(jsonFilePath, 'utf8');
-        const allImages = JSON.parse(jsonData);
-
-        // Paginate images
+        // Paginate images, reading only the page shards under BASE_PATHS.images
         const startIndex = (page - 1) * limit;
         const endIndex = page * limit;
-        const paginatedImages = allImages.slice(startIndex, endIndex);
+        const paginatedImages = await readFeedPage(BASE_PATHS.images, `master_image_${type}_index`, startIndex, endIndex);
 
         // Render the '_imageGrid' partial with the images
         res.render('_imageGrid', {
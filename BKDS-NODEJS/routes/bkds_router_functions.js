@@ -88,6 +88,51 @@ function processMedia(mediaData) {
 
 
 
+// Page shards written by the Python feed generators (bkds_Utilities.write_page_shards)
+const PAGE_DIR = "pages"
+
+function pageFileName(prefix, page) {
+  return `${prefix}_page_${String(page).padStart(4, "0")}.json`
+}
+
+// Read records [start, end) of a feed from its page shards, opening only the
+// shards that overlap the range. Falls back to the full `${prefix}.json` file
+// when the feed has no page index yet.
+async function readFeedPage(feedDir, prefix, start, end) {
+  const pagesDir = path.join(feedDir, PAGE_DIR)
+  let pageIndex
+  try {
+    pageIndex = JSON.parse(
+      await fs.readFile(path.join(pagesDir, `${prefix}_pages.json`), "utf8")
+    )
+  } catch (error) {
+    const data = await fs.readFile(path.join(feedDir, `${prefix}.json`), "utf8")
+    return JSON.parse(data).slice(start, end)
+  }
+
+  const { page_size: pageSize, total } = pageIndex
+  const last = Math.min(end, total)
+  if (start >= last) {
+    return []
+  }
+
+  const firstPage = Math.floor(start / pageSize) + 1
+  const lastPage = Math.floor((last - 1) / pageSize) + 1
+  const pageNumbers = []
+  for (let page = firstPage; page <= lastPage; page++) {
+    pageNumbers.push(page)
+  }
+  const shards = await Promise.all(
+    pageNumbers.map(async (page) =>
+      JSON.parse(
+        await fs.readFile(path.join(pagesDir, pageFileName(prefix, page)), "utf8")
+      )
+    )
+  )
+  const offset = start - (firstPage - 1) * pageSize
+  return shards.flat().slice(offset, offset + (last - start))
+}
+
 async function fetchAndTransformInsights(
   filterCategory = "main_feed",
   page = defaultPage,
@@ -105,24 +150,24 @@ async function fetchAndTransformInsights(
     ) {
       //console.log("Updating cache:", cacheKey)
 
-      // Define the file path based on the filter category.
-      const dataFilePath = path.join(
+      // Define the feed folder based on the filter category.
+      const feedDir = path.join(
         process.cwd(),
         "public",
         "data",
         "content_feeds",
-        filterCategory,
-        `${filterCategory}_batch.json`
+        filterCategory
       )
 
-      // Read and parse the data file.
-      const data = await fs.readFile(dataFilePath, "utf8")
-      const parsedData = JSON.parse(data)
-
-      // Implement pagination logic.
+      // Read only the page shards covering the requested page.
       const start = (page - 1) * limit
       const end = start + limit
-      const paginatedData = parsedData.slice(start, end)
+      const paginatedData = await readFeedPage(
+        feedDir,
+        `${filterCategory}_batch`,
+        start,
+        end
+      )
 
       // Transform each insight item and return a simplified structure.
       const transformedData = paginatedData.map(
@@ -227,6 +272,7 @@ module.exports = {
   shuffleArray,
   processMedia,
   fetchAndTransformInsights,
+  readFeedPage,
   getIconsData,
   updateIconUrls,
   tts_prefix
@@ -0,0 +1,322 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
+from bkds_Utilities import log_msg, render_placeholders, render_placeholder_rows, UrlMapper, split_text_into_spans, span_cache
+
+"""
+BKDS Micro-benchmarks
+
+Purpose:
+    Times shared helpers in bkds_Utilities against the implementations they replaced, on synthetic
+    input, and checks that both produce identical output. Nothing touches the database or the network.
+
+Benchmarks:
+    - placeholders: prompt rendering for bkds_backend_llm_ProcessFlow.setup_prompt. Compares the old
+      per-key str.replace loop with the precompiled single-pass renderer, inline and in a process pool.
+    - urls: media URL mapping for bkds_contentPostGen_parallel / bkds_imgMasterIndex. Compares the old
+      process_url (regex compiled per call, pattern scan) with UrlMapper.map_url cold and warm, and map_urls.
+    - spans: sentence spans for bkds_contentPostGen*. Compares the old multi-pass split_text_into_spans with
+      the single-scan version, cold and memoised, on a golden corpus recovered from the published feed
+      JSON (--corpus) plus synthetic edge cases (abbreviations, **headers**, paragraph breaks, stray tags).
+
+Usage:
+    python bkds_Benchmarks.py placeholders [--rows 50000] [--keys 30] [--processes N] [--seed 7]
+    python bkds_Benchmarks.py urls [--urls 200000] [--distinct 40000] [--seed 7]
+    python bkds_Benchmarks.py spans [--corpus DIR] [--texts 3000] [--repeat 3] [--seed 7]
+"""
+
+program_name = os.path.basename(__file__)
+DEFAULT_SPAN_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'BKDS-NODEJS', 'public', 'data', 'content_feeds')
+batch_id = 'BKDS_BENCHMARK'
+
+def logMsg(msg):
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+def parse_arguments():
+    parser = ArgumentParser(description="Run BKDS micro-benchmarks on synthetic data.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    placeholders = subparsers.add_parser("placeholders", help="Prompt placeholder rendering")
+    placeholders.add_argument("--rows", type=int, default=50000, help="Synthetic rows to render")
+    placeholders.add_argument("--keys", type=int, default=30, help="Columns per row")
+    placeholders.add_argument("--processes", type=int, default=cpu_count(), help="Pool size for the pooled run")
+    placeholders.add_argument("--seed", type=int, default=7, help="Random seed for the synthetic rows")
+
+    urls = subparsers.add_parser("urls", help="Media URL mapping")
+    urls.add_argument("--urls", type=int, default=200000, help="URLs in the sample")
+    urls.add_argument("--distinct", type=int, default=40000, help="Distinct URLs; images repeat across insights")
+    urls.add_argument("--seed", type=int, default=7, help="Random seed for the sample")
+
+    spans = subparsers.add_parser("spans", help="Sentence span splitting")
+    spans.add_argument("--corpus", default=DEFAULT_SPAN_CORPUS, help="Folder of published feed JSON for the golden corpus")
+    spans.add_argument("--texts", type=int, default=3000, help="Synthetic texts added to the corpus")
+    spans.add_argument("--repeat", type=int, default=3, help="Times each text is split; repeats hit the memo cache")
+    spans.add_argument("--seed", type=int, default=7, help="Random seed for the synthetic texts")
+    return parser.parse_args()
+
+def time_call(label, func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start_time
+    logMsg(f"{label:<28} {elapsed:8.3f}s")
+    return result, elapsed
+
+######################################################################
+# placeholders
+######################################################################
+
+def legacy_replace_placeholders(template, row_data):
+    """The per-key str.replace implementation previously in bkds_backend_llm_ProcessFlow."""
+    def replace_in_string(s, data):
+        for k, v in data.items():
+            s = s.replace(f"@@_{k}_@@", str(v))
+        return s
+
+    def recursive_replace(data):
+        if isinstance(data, dict):
+            return {k: recursive_replace(v) for k, v in data.items()}
+        elif isinstance(data, list):
+            return [recursive_replace(item) for item in data]
+        elif isinstance(data, str):
+            return replace_in_string(data, row_data)
+        else:
+            return data
+
+    row_data = recursive_replace(row_data)
+    return replace_in_string(template, row_data)
+
+def build_placeholder_rows(row_count, key_count, seed):
+    """Synthetic rows shaped like bkds_llmPromptjGen_source: a few templates, wide rows, one long text column."""
+    rng = random.Random(seed)
+    keys = [f"col_{i}" for i in range(key_count)] + ["url_id", "text_chunk"]
+    templates = []
+    for t in range(4):
+        used = rng.sample(keys, min(len(keys), 12))
+        body = ' '.join(f"Section {i} about @@_{key}_@@ and more context." for i, key in enumerate(used))
+        templates.append(f"Template {t}: {body} Unknown @@_not_a_column_@@ stays.")
+
+    rows = []
+    for i in range(row_count):
+        row = {key: f"value {i} {key} " + "x" * rng.randint(5, 40) for key in keys}
+        row["url_id"] = i
+        row["text_chunk"] = "lorem ipsum " * rng.randint(20, 200)
+        if i % 50 == 0:
+            row["col_0"] = "nested @@_url_id_@@"
+        row["prompt_template_user"] = templates[i % len(templates)]
+        rows.append(row)
+    return rows
+
+def benchmark_placeholders(args):
+    logMsg(f"placeholders: building {args.rows} rows x {args.keys + 2} columns")
+    rows = build_placeholder_rows(args.rows, args.keys, args.seed)
+
+    legacy, legacy_secs = time_call("legacy str.replace", lambda: [legacy_replace_placeholders(row["prompt_template_user"], row) for row in rows])
+    compiled, compiled_secs = time_call("precompiled, inline", lambda: [render_placeholders(row["prompt_template_user"], row) for row in rows])
+    with Pool(args.processes) as pool:
+        pooled, pooled_secs = time_call(f"precompiled, pool({args.processes})", render_placeholder_rows, rows, "prompt_template_user", pool)
+
+    if legacy != compiled or legacy != pooled:
+        mismatches = sum(1 for old, new in zip(legacy, compiled) if old != new)
+        logMsg(f"placeholders: output mismatch on {mismatches} rows")
+        return False
+
+    logMsg(f"placeholders: identical output; speedup {legacy_secs / compiled_secs:.1f}x inline, "
+           f"{legacy_secs / pooled_secs:.1f}x pooled")
+    return True
+
+######################################################################
+# urls
+######################################################################
+
+LEGACY_BASE_PATH = "/data/images/full_size/"
+LEGACY_URL_PATTERNS = {
+    '_yt_': 'youtube',
+    '_youtube_': 'youtube',
+    '_flickr_': 'flickr',
+    '_wiki_': 'wiki'
+}
+
+def legacy_process_url(url):
+    """The process_url implementation previously in bkds_contentPostGen_parallel."""
+    url_regex = re.compile(
+        r'^(?:http|ftp)s?://'
+        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'
+        r'localhost|'
+        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'
+        r'\[?[A-F0-9]*:[A-F0-9:]+\]?)'
+        r'(?::\d+)?'
+        r'(?:/?|[/?]\S+)$', re.IGNORECASE
+    )
+    if re.match(url_regex, url):
+        return url
+    file_name = os.path.basename(url)
+    for pattern, folder in LEGACY_URL_PATTERNS.items():
+        if pattern in url:
+            return os.path.join(LEGACY_BASE_PATH, folder, file_name)
+    return os.path.join(LEGACY_BASE_PATH, file_name)
+
+def build_url_sample(url_count, distinct_count, seed):
+    """Feed-like mix of web URLs and local media paths, skewed so popular images repeat."""
+    rng = random.Random(seed)
+    shapes = [
+        "https://live.staticflickr.com/{a}/{b}_{c}_b.jpg",
+        "https://upload.wikimedia.org/wikipedia/commons/{a}/{b}/File_{c}.jpg",
+        "https://i.ytimg.com/vi/{c}/hqdefault.jpg",
+        "/data/images/full_size/bkds_flickr_{c}_{b}.jpg",
+        "/data/images/full_size/bkds_wiki_{c}.png",
+        "/data/images/full_size/bkds_yt_{c}_thumb.jpg",
+        "/data/images/full_size/misc/{c}.JPG",
+    ]
+    distinct = [rng.choice(shapes).format(a=rng.randint(1, 9999), b=rng.randint(10**6, 10**7), c=rng.randint(10**8, 10**9))
+                for _ in range(distinct_count)]
+    return [distinct[min(int(rng.paretovariate(1.2)) - 1, distinct_count - 1)] if rng.random() < 0.6 else rng.choice(distinct)
+            for _ in range(url_count)]
+
+def benchmark_urls(args):
+    logMsg(f"urls: building {args.urls} URLs ({args.distinct} distinct)")
+    urls = build_url_sample(args.urls, args.distinct, args.seed)
+    per_call = lambda secs: f"{secs * 1e9 / len(urls):.0f} ns/url"
+
+    legacy, legacy_secs = time_call("legacy process_url", lambda: [legacy_process_url(url) for url in urls])
+    mapper = UrlMapper(LEGACY_BASE_PATH, LEGACY_URL_PATTERNS)
+    cold, cold_secs = time_call("map_url, cold cache", lambda: [mapper.map_url(url) for url in urls])
+    warm, warm_secs = time_call("map_url, warm cache", lambda: [mapper.map_url(url) for url in urls])
+    mapper = UrlMapper(LEGACY_BASE_PATH, LEGACY_URL_PATTERNS)
+    batched, batched_secs = time_call("map_urls, cold cache", mapper.map_urls, urls)
+
+    if not (legacy == cold == warm == batched):
+        mismatches = sum(1 for old, new in zip(legacy, cold) if old != new)
+        logMsg(f"urls: output mismatch on {mismatches} URLs")
+        return False
+
+    logMsg(f"urls: identical output; legacy {per_call(legacy_secs)}, cold {per_call(cold_secs)}, "
+           f"warm {per_call(warm_secs)}, map_urls {per_call(batched_secs)} "
+           f"({legacy_secs / cold_secs:.1f}x / {legacy_secs / warm_secs:.1f}x / {legacy_secs / batched_secs:.1f}x)")
+    return True
+
+######################################################################
+# spans
+######################################################################
+
+def legacy_split_text_into_spans(text):
+    """The multi-pass split_text_into_spans implementation previously in bkds_Utilities."""
+    text = re.sub(r'</?[^>]+(>|$)', '', text)
+    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
+    text = re.sub(r'\n\n+', '[NEWPARA]', text)
+    text = re.sub(r'\n', ' ', text)
+
+    abbreviations = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Inc.', 'Ltd.', 'D.C.', 'U.S.']
+    abbreviation_placeholders = {}
+    for i, abbr in enumerate(abbreviations):
+        placeholder = f'__ABBR{i}__'
+        text = re.sub(re.escape(abbr), placeholder, text)
+        abbreviation_placeholders[placeholder] = abbr
+
+    sentences = re.split(r'([.!?])\s+', text)
+    full_sentences = []
+    i = 0
+    while i < len(sentences):
+        sentence = sentences[i].strip()
+        if i + 1 < len(sentences):
+            full_sentence = sentence + sentences[i + 1]
+            i += 2
+        else:
+            full_sentence = sentence
+            i += 1
+        full_sentences.append(full_sentence)
+
+    for i, sentence in enumerate(full_sentences):
+        for placeholder, abbr in abbreviation_placeholders.items():
+            full_sentences[i] = full_sentences[i].replace(placeholder, abbr)
+
+    merged_sentences = ' '.join([
+        f'<span id="chunk-{index}">{sentence}</span>'
+        for index, sentence in enumerate(full_sentences)
+    ])
+    merged_sentences = merged_sentences.replace('[NEWPARA]', '<br><br>')
+    return f'<p>{merged_sentences}</p>'
+
+def load_span_corpus(corpus_dir):
+    """
+    Source-like texts recovered from published feed JSON: text_block.content with the
+    generated markup reversed (<br><br> -> blank line, <strong> -> **), plus the raw HTML.
+    """
+    texts = []
+    for file_path in glob.glob(os.path.join(corpus_dir, '**', '*.json'), recursive=True):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for record in data if isinstance(data, list) else [data]:
+            content = record.get('text_block', {}).get('content') if isinstance(record, dict) else None
+            if not content:
+                continue
+            source = content.replace('<br><br>', '\n\n')
+            source = re.sub(r'</?strong>', '**', source)
+            source = re.sub(r'</?(?:p|span)[^>]*>', '', source)
+            texts.extend([source, content])
+    return texts
+
+def build_span_texts(text_count, seed):
+    """Synthetic LLM-style bodies exercising abbreviations, headers, breaks and stray markup."""
+    rng = random.Random(seed)
+    fragments = [
+        "The Boeing B-17 entered service in 1938.", "Mr. Smith met Dr. Jones in Washington, D.C. last year.",
+        "Mrs. Brown and Ms. Green work for Acme Inc. and Widgets Ltd. respectively!", "Is it true?",
+        "Prof. Lee moved to the U.S. in 1990.", "**A Header**", "Trailing ellipsis...", "Zinc. prices rose.",
+        "<b>bold</b> text with a <a href='x'>link</a>.", "An unclosed <tag", "Odd  spacing .  Here", "DMr. edge",
+        "U.S.", "Wow!!", "Question?!", "[NEWPARA] literal", "** not bold", "",
+    ]
+    separators = [" ", "  ", "\n", "\n\n", "\n\n\n", "\t", ""]
+    texts = []
+    for _ in range(text_count):
+        parts = [rng.choice(fragments) for _ in range(rng.randint(0, 40))]
+        texts.append(''.join(part + rng.choice(separators) for part in parts))
+    return texts
+
+def benchmark_spans(args):
+    corpus = load_span_corpus(args.corpus)
+    texts = corpus + build_span_texts(args.texts, args.seed)
+    logMsg(f"spans: {len(corpus)} golden texts from {args.corpus}, {len(texts) - len(corpus)} synthetic, x{args.repeat}")
+    workload = texts * args.repeat
+
+    legacy, legacy_secs = time_call("legacy multi-pass", lambda: [legacy_split_text_into_spans(text) for text in workload])
+    span_cache.clear()
+    cold, cold_secs = time_call("single scan, first pass", lambda: [split_text_into_spans(text) for text in texts])
+    memo, memo_secs = time_call("single scan, memoised", lambda: [split_text_into_spans(text) for text in workload])
+
+    if legacy != cold * args.repeat or legacy != memo:
+        mismatches = sum(1 for old, new in zip(legacy, cold) if old != new)
+        logMsg(f"spans: output mismatch on {mismatches} texts")
+        return False
+
+    legacy_per_pass = legacy_secs / args.repeat
+    logMsg(f"spans: identical output; single pass {legacy_per_pass / cold_secs:.1f}x, "
+           f"memoised workload {legacy_secs / memo_secs:.1f}x")
+    return True
+
+######################################################################
+# Main Function
+######################################################################
+
+BENCHMARKS = {
+    "placeholders": benchmark_placeholders,
+    "urls": benchmark_urls,
+    "spans": benchmark_spans,
+}
+
+def main():
+    args = parse_arguments()
+    success = BENCHMARKS[args.benchmark](args)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
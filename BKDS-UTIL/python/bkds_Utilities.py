@@ -12,10 +12,29 @@ Functions:
 - genInsightID(search_term, string_id, category): Generates unique hashes for insight identification.
 - getFlickrData(keyword, num_images, api_key): Fetches image URLs from Flickr based on a given keyword.
 - isValidImage(image_url, image_title): Validates if a given image URL meets specific criteria.
+- getDBConn(cursor_type) / closeDB(cursor, conn): Check a connection out of / back into the process-wide pool.
+- db_cursor(cursor_type, commit): Context manager wrapping getDBConn/closeDB.
+- stream_data(query, batch_size): Generator yielding query results in batches from a server-side cursor.
+- TemplateRegistry / sql_templates: Cached, precompiled view of bkds_data_mappings.json used by get_sqlTemplate.
+- db_copy_rows(cursor, target_table, columns, rows): Bulk loads row tuples with COPY ... FROM STDIN.
+- PlaceholderTemplate / render_placeholders(template, row_data): `@@_key_@@` templates tokenised once and rendered in one pass.
+- render_placeholder_rows(rows, template_key, pool): Renders each row's own template, optionally across a process pool.
+- atomic_write(file_path, data) / content_hash(data): Temp-file + rename writes and short content digests.
+- write_page_shards(target_dir, prefix, records, page_size): Fixed-size page shards plus a page index for paginated readers.
+- InsightStore(category_dir): Per-category SQLite copy of the generated insight JSON, indexed on url_id / cluster_id.
+- ContentManifest(file_path): JSON manifest of generated outputs (hash, path, last write) keyed by id.
+- UrlMapper(base_path, patterns, url_regex=WEB_URL_REGEX): Cached web-URL check and local-path-to-production mapping (map_url / map_urls).
+- ImageIndex(root): One-sweep scandir index of an image tree (size/mtime, case-insensitive and base-name lookups).
+- split_text_into_spans(text): Single-scan sentence splitter emitting <span id="chunk-N"> fragments, memoised by content hash.
 
 Environment Variables:
 - BKDS_NODEJS_SUBJGEN: Output directory for generated insights.
 - BKDS_LOGS: Directory for logging messages.
+- BKDS_DB_POOL_MIN / BKDS_DB_POOL_MAX: Connection pool size (default 1 / 8).
+- BKDS_DB_POOL_CHECK_SECS: Idle seconds before a pooled connection is health checked (default 30).
+- BKDS_DB_STREAM_BATCH_SIZE: Default rows per batch for stream_data (default 500).
+- BKDS_SQL_COLUMN_TTL: Seconds to cache information_schema column lists (default 300).
+- BKDS_INSIGHT_STORE: 1 to populate and read the per-category InsightStore (default 0).
 
 Notes:
 - The module ensures efficient handling and logging of data across different components of the subject insights generation pipeline.
@@ -30,13 +49,21 @@ import socket
 import json
 import re
 from datetime import datetime, timezone
+import atexit
+import threading
+from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import uuid
 import inspect
 from collections import OrderedDict
+from functools import lru_cache
 import zipfile
 import time
+import io
+import csv
+import sqlite3
 #####################################################################
 # Main Setup / Variables
 
@@ -51,6 +78,64 @@ conn_params = {
 }
 program_name=os.path.basename(sys.argv[0])
 
+# Connection pool sizing; override per host with BKDS_DB_POOL_MIN / BKDS_DB_POOL_MAX
+db_pool_min = int(os.getenv('BKDS_DB_POOL_MIN', 1))
+db_pool_max = int(os.getenv('BKDS_DB_POOL_MAX', 8))
+# Pooled connections idle longer than this are pinged before reuse
+db_pool_check_secs = int(os.getenv('BKDS_DB_POOL_CHECK_SECS', 30))
+# Seconds information_schema column lists stay cached in TemplateRegistry
+sql_column_ttl = int(os.getenv('BKDS_SQL_COLUMN_TTL', 300))
+# Rows fetched per round trip by stream_data
+db_stream_batch_size = int(os.getenv('BKDS_DB_STREAM_BATCH_SIZE', 500))
+# Per-category InsightStore, populated by the content writers and read by the feed aggregation
+insight_store_enabled = os.getenv('BKDS_INSIGHT_STORE', '0').lower() in ('1', 'true', 'yes')
+
+# NULL marker used by db_copy_rows
+COPY_NULL = '\\N'
+
+# Prompt template placeholders, e.g. @@_url_id_@@
+PLACEHOLDER_PATTERN = re.compile(r'@@_(.+?)_@@')
+PLACEHOLDER_MARKER = '@@_'
+PLACEHOLDER_CHUNK_ROWS = 1000
+
+# Complete web URL (http/https/ftp), compiled once for UrlMapper
+WEB_URL_REGEX = re.compile(
+    r'^(?:http|ftp)s?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # IPv4
+    r'\[?[A-F0-9]*:[A-F0-9:]+\]?)'  # IPv6
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE
+)
+URL_CACHE_SIZE = 262144
+
+# Sentence spans for split_text_into_spans: abbreviations must not end a sentence
+SPAN_ABBREVIATIONS = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Inc.', 'Ltd.', 'D.C.', 'U.S.']
+SPAN_TAG_REGEX = re.compile(r'</?[^>]+(>|$)')
+SPAN_BOLD_REGEX = re.compile(r'\*\*(.+?)\*\*')
+SPAN_NEWLINE_REGEX = re.compile(r'\n\n+|\n')
+SPAN_SCAN_REGEX = re.compile('|'.join(re.escape(abbr) for abbr in SPAN_ABBREVIATIONS) + r'|([.!?])\s+')
+SPAN_CACHE_SIZE = 4096
+
+# Per-category insight store (not *.json, so feed walkers skip it)
+INSIGHT_STORE_FILE = '.bkds_insights.sqlite'
+INSIGHT_STORE_TIMEOUT = 60
+INSIGHT_STORE_QUERY_ROWS = 500
+
+# Paginated feed shards written next to *_batch.json / master_image_*_index.json
+PAGE_DIR = 'pages'
+FEED_PAGE_SIZE = 50
+
+# Image file extensions recognised by ImageIndex.find_equivalent
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+span_cache = OrderedDict()
+
+db_pool = None
+db_pool_pid = None
+db_pool_lock = threading.Lock()
+db_conn_last_used = {}
+
 bkds_util_env = os.getenv('BKDS_UTIL')
 bkds_util_data = os.getenv('BKDS_UTIL_DATA')
 
@@ -60,49 +145,186 @@ def logMsg(msg):
     log_msg(program_name, f'BKDS_UTIL_LOGMSG', msg)
     print(msg)
 
-def getDBConn(cursor_type=None):
+def get_db_pool(minconn=None, maxconn=None):
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    The pool is keyed on the current PID so worker processes forked by
+    multiprocessing build their own pool instead of sharing the parent's sockets.
+
+    Parameters:
+    minconn (int, optional): Minimum pooled connections. Defaults to BKDS_DB_POOL_MIN.
+    maxconn (int, optional): Maximum pooled connections. Defaults to BKDS_DB_POOL_MAX.
+
+    Returns:
+    psycopg2.pool.ThreadedConnectionPool: The shared connection pool.
+    """
+    global db_pool, db_pool_pid
+
+    with db_pool_lock:
+        if db_pool is not None and db_pool_pid != os.getpid():
+            # Inherited from the parent process; drop it without closing the parent's connections
+            db_pool = None
+        if db_pool is None or db_pool.closed:
+            minconn = db_pool_min if minconn is None else minconn
+            maxconn = db_pool_max if maxconn is None else maxconn
+            db_pool = psycopg2.pool.ThreadedConnectionPool(minconn, max(minconn, maxconn), **conn_params)
+            db_pool_pid = os.getpid()
+            db_conn_last_used.clear()
+            logMsg(f"Created DB connection pool (min={minconn}, max={maxconn}) for pid {db_pool_pid}")
+        return db_pool
+
+def close_db_pool():
+    """Close every connection held by the process-wide pool."""
+    global db_pool
+
+    with db_pool_lock:
+        if db_pool is not None and db_pool_pid == os.getpid() and not db_pool.closed:
+            db_pool.closeall()
+        db_pool = None
+        db_conn_last_used.clear()
+
+atexit.register(close_db_pool)
+
+def is_conn_healthy(conn):
+    """
+    Checks that a pooled connection is still usable. Connections idle for longer
+    than db_pool_check_secs are pinged with a lightweight query.
+    """
+    if conn.closed:
+        return False
+
+    last_used = db_conn_last_used.get(id(conn))
+    if last_used is not None and time.time() - last_used < db_pool_check_secs:
+        return True
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+def getDBConn(cursor_type=None, cursor_name=None):
     """
     Returns a cursor to the database. If 'dict' is specified as the cursor_type,
     returns a dictionary cursor.
 
+    The connection is checked out of the process-wide pool; release it with closeDB.
+
     Parameters:
     cursor_type (str, optional): Type of the cursor. If 'dict', returns a DictCursor.
+    cursor_name (str, optional): If given, returns a named (server-side) cursor.
 
     Returns:
     psycopg2.cursor: A cursor to the database.
     """
-      # Replace with your actual connection parameters
-    conn = psycopg2.connect(**conn_params)
+    pool = get_db_pool()
+    conn = pool.getconn()
+
+    if not is_conn_healthy(conn):
+        logMsg("Discarding stale pooled DB connection")
+        pool.putconn(conn, close=True)
+        db_conn_last_used.pop(id(conn), None)
+        conn = pool.getconn()
+
     if cursor_type == 'dict':
-        return conn.cursor(cursor_factory=psycopg2.extras.DictCursor), conn
+        return conn.cursor(name=cursor_name, cursor_factory=psycopg2.extras.DictCursor), conn
     else:
-        return conn.cursor(), conn
+        return conn.cursor(name=cursor_name), conn
 
 def closeDB(cursor, conn):
+    """
+    Closes the cursor and returns the connection to the pool. Any open
+    transaction is rolled back by the pool before the connection is reused.
+    """
     cursor.close()
-    conn.close()
+
+    if db_pool is None or db_pool_pid != os.getpid() or db_pool.closed:
+        conn.close()
+        return
+
+    if conn.closed:
+        db_conn_last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+        return
+
+    db_conn_last_used[id(conn)] = time.time()
+    db_pool.putconn(conn)
+
+@contextmanager
+def db_cursor(cursor_type=None, commit=False, cursor_name=None):
+    """
+    Context manager around getDBConn/closeDB.
+
+    Usage:
+        with db_cursor('dict') as (cursor, conn):
+            cursor.execute(query)
+
+    Parameters:
+    cursor_type (str, optional): Type of the cursor. If 'dict', returns a DictCursor.
+    commit (bool): Commit on a clean exit. Errors always roll back.
+    cursor_name (str, optional): If given, opens a named (server-side) cursor.
+    """
+    cursor, conn = getDBConn(cursor_type, cursor_name)
+    try:
+        yield cursor, conn
+        if commit:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        closeDB(cursor, conn)
 
 def fetch_data(query):
     logMsg(f'fetchData with query: {query}')
     try:
-        # Assuming conn_params is defined somewhere in your code
-        cursor, conn = getDBConn('dict')
-        
-        # Log database connection details
-        db_details = conn.get_dsn_parameters()  # Get details about the connection
-        print(f"Connected to DB with details: {db_details}")
-
-        # Execute query
-        cursor.execute(query)
-        result = cursor.fetchall()
-        result = [dict(row) for row in result]
-        
-        closeDB(cursor, conn)
-        return result
+        with db_cursor('dict') as (cursor, conn):
+            # Execute query
+            cursor.execute(query)
+            result = cursor.fetchall()
+            return [dict(row) for row in result]
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"Database Error: {error}")
         return None
 
+def stream_data(query, batch_size=None):
+    """
+    Generator counterpart to fetch_data. Runs the query on a named server-side
+    cursor and yields lists of up to batch_size dict rows, so callers only ever
+    hold one batch in memory.
+
+    Parameters:
+    query (str): SQL query to execute.
+    batch_size (int, optional): Rows per batch. Defaults to BKDS_DB_STREAM_BATCH_SIZE.
+
+    Yields:
+    list: Up to batch_size rows as dictionaries.
+    """
+    batch_size = batch_size or db_stream_batch_size
+    logMsg(f'stream_data with batch_size {batch_size} and query: {query}')
+    cursor_name = f"bkds_stream_{uuid.uuid4().hex[:12]}"
+    row_count = 0
+
+    try:
+        with db_cursor('dict', cursor_name=cursor_name) as (cursor, conn):
+            cursor.itersize = batch_size
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                row_count += len(rows)
+                yield [dict(row) for row in rows]
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Database Error: {error}")
+        raise
+
+    logMsg(f'stream_data finished after {row_count} rows')
+
 
 def load_and_resolve_config(config_key, config_path=None, config_json=None):
     """
@@ -337,147 +559,279 @@ def flatten_json(data):
 
 
 def db_load_llm_chat(file_name, target_table):
-    # Read data from file
-    with open(file_name, 'r') as file:
-        data_list = json.load(file)
+    """Load a single llm_process output file. See db_load_llm_chat_files."""
+    loaded_files, failed_files, row_count = db_load_llm_chat_files([file_name], target_table)
+    if failed_files:
+        raise ValueError(f"Failed to read {file_name}")
+    return row_count
 
-    # Filter data for "assistant" role
-    assistant_data = [item for item in data_list if item.get('role') == 'assistant']
 
-    cursor, conn = getDBConn()
+def read_llm_chat_file(file_name):
+    """
+    Read the records of an llm_process output file.
 
-    # Gather all unique keys from assistant_data using OrderedDict to preserve order
-    all_keys = OrderedDict()
-    for data in assistant_data:
-        flat_data = flatten_json(data)
-        for key in flat_data:
-            if key not in all_keys:
-                all_keys[key] = infer_data_type(flat_data[key])
+    `.ndjson` segments hold one record per line; a truncated last line from an
+    interrupted writer is skipped. Any other file is read as a JSON document.
+    """
+    if not file_name.endswith('.ndjson'):
+        with open(file_name, 'r') as file:
+            return json.load(file)
 
-    # Dynamically create column definitions based on all possible keys
-    column_definitions = ', '.join([f"{key} {all_keys[key]}" for key in all_keys])
-    column_definitions += ', load_id VARCHAR(255), load_date TIMESTAMP, load_process VARCHAR(255)'
+    records = []
+    with open(file_name, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+                logMsg(f"read_llm_chat_file skipped truncated line {line_number} in {file_name}")
+    return records
+
+
+def db_load_llm_chat_files(file_names, target_table):
+    """
+    Bulk load the assistant records of many llm_process output files.
 
-    # SQL for creating table if it doesn't exist
-    create_table_query = f"CREATE TABLE IF NOT EXISTS {target_table} ({column_definitions});"
-    cursor.execute(create_table_query)
+    All files are read first so their flattened keys can be unioned into one
+    schema. The target table is created if missing and only columns that do not
+    exist yet are added, then every row is loaded with a single COPY over one
+    pooled connection.
 
-    # Process each item for insertion
-    for data in assistant_data:
-        # Flatten the JSON data
-        flat_data = flatten_json(data)
+    Parameters:
+    file_names (list): llm_process output files (.json documents or .ndjson segments).
+    target_table (str): schema.table to load.
 
-        # Prepare insert query
-        insert_columns = ', '.join(all_keys.keys()) + ', load_id, load_date, load_process'
-        placeholders = ', '.join(['%s'] * len(all_keys)) + ', %s, %s, %s'
-        insert_query = f"INSERT INTO {target_table} ({insert_columns}) VALUES ({placeholders});"
+    Returns:
+    tuple: (loaded_files, failed_files, row_count). Files that cannot be read
+           are reported as failed and skipped; database errors are raised.
+    """
+    start_time = time.time()
+    loaded_files = []
+    failed_files = []
+    flat_rows = []
 
-        load_id = str(uuid.uuid4())
-        load_date = datetime.now(timezone.utc)
-        load_process = program_name  # Replace with your process name
-        insert_data = tuple(flat_data.get(key, None) for key in all_keys) + (load_id, load_date, load_process)
+    # Gather all unique keys using OrderedDict to preserve order
+    all_keys = OrderedDict()
+    for file_name in file_names:
+        try:
+            data_list = read_llm_chat_file(file_name)
+        except (OSError, ValueError) as e:
+            logMsg(f"db_load_llm_chat_files could not read {file_name}: {e}")
+            failed_files.append(file_name)
+            continue
+        if not isinstance(data_list, list):
+            logMsg(f"db_load_llm_chat_files expected a list of records in {file_name}")
+            failed_files.append(file_name)
+            continue
+
+        # Filter data for "assistant" role
+        for item in data_list:
+            if item.get('role') != 'assistant':
+                continue
+            flat_data = flatten_json(item)
+            for key in flat_data:
+                if key not in all_keys:
+                    all_keys[key] = infer_data_type(flat_data[key])
+            flat_rows.append(flat_data)
+        loaded_files.append(file_name)
+
+    if not flat_rows:
+        logMsg(f"db_load_llm_chat_files found no assistant records in {len(loaded_files)} files")
+        return loaded_files, failed_files, 0
+
+    maint_columns = OrderedDict([('load_id', 'VARCHAR(255)'), ('load_date', 'TIMESTAMP'), ('load_process', 'VARCHAR(255)')])
+    load_date = datetime.now(timezone.utc)
+    load_process = program_name
+
+    def build_rows():
+        for flat_data in flat_rows:
+            values = []
+            for key in all_keys:
+                value = flat_data.get(key)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+                values.append(value)
+            yield tuple(values) + (str(uuid.uuid4()), load_date, load_process)
+
+    # Pooled connection; commits on success and rolls back on error
+    with db_cursor(commit=True) as (cursor, conn):
+        column_definitions = ', '.join(f"{key} {data_type}" for key, data_type in list(all_keys.items()) + list(maint_columns.items()))
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {target_table} ({column_definitions});")
+
+        # Only add the columns this set of files introduces
+        existing_columns = {column.lower() for column in get_column_names(target_table, cursor, refresh=True)}
+        for key, data_type in list(all_keys.items()) + list(maint_columns.items()):
+            if key.lower() not in existing_columns:
+                logMsg(f"Adding column {key} {data_type} to {target_table}")
+                cursor.execute(f"ALTER TABLE {target_table} ADD COLUMN IF NOT EXISTS {key} {data_type};")
+        sql_templates.column_cache.pop(target_table, None)
+
+        row_count = db_copy_rows(cursor, target_table, list(all_keys) + list(maint_columns), build_rows())
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    logMsg(f"Loaded {row_count} rows from {len(loaded_files)} files into {target_table} in {elapsed:.2f}s ({row_count / elapsed:.0f} rows/sec)")
+    return loaded_files, failed_files, row_count
+
+
+class TemplateRegistry:
+    """
+    Parsed-once view of bkds_data_mappings.json.
 
-        # Execute insert query
-        cursor.execute(insert_query, insert_data)
+    The mappings file (default $BKDS_UTIL_DATA/config/bkds_data_mappings.json,
+    resolved on first use so importing this module does not need BKDS_UTIL_DATA)
+    is loaded on first use and reloaded only when its mtime changes. Templates that name their columns are formatted once at load time;
+    templates without src_columns resolve their column list from
+    information_schema, cached per table for column_ttl seconds.
 
-    # Commit the transaction
-    conn.commit()
-    # Close cursor and connection
-    closeDB(cursor, conn)
+    Usage:
+        sql_query = sql_templates.get('bkds_contentGen_web_feed_master')
+        insert_query = sql_templates.get_insert_query('bkds_subjGen_load_wiki')
+    """
 
+    def __init__(self, file_path=None, column_ttl=None):
+        self.file_path = file_path
+        self.column_ttl = sql_column_ttl if column_ttl is None else column_ttl
+        self.lock = threading.RLock()
+        self.mtime = None
+        self.templates = {}
+        self.compiled_queries = {}
+        self.insert_queries = {}
+        self.column_cache = {}
+
+    def reload_if_changed(self):
+        """Reload and precompile the mappings file if it changed on disk."""
+        if self.file_path is None:
+            self.file_path = os.path.join(bkds_util_data, 'config', 'bkds_data_mappings.json')
+        mtime = os.path.getmtime(self.file_path)
+        if mtime == self.mtime:
+            return
+
+        with self.lock:
+            if mtime == self.mtime:
+                return
+
+            with open(self.file_path, 'r') as file:
+                data = json.load(file)
+            if not isinstance(data, list):
+                raise TypeError("Expected a list in JSON data")
+
+            templates = {}
+            for template_entry in data:
+                templates.update(template_entry)
+
+            compiled_queries = {}
+            insert_queries = {}
+            for key, template in templates.items():
+                if template.get('sql_query') and template.get('src_columns'):
+                    compiled_queries[key] = self.format_query(template, template['src_columns'])
+                if template.get('target_columns'):
+                    target_columns = template['target_columns']
+                    placeholders = ', '.join(['%s'] * len(target_columns))
+                    insert_queries[key] = (f"INSERT INTO {template['target_schema']}.{template['target_table']} "
+                                           f"({', '.join(target_columns)}) VALUES ({placeholders});")
+
+            self.templates = templates
+            self.compiled_queries = compiled_queries
+            self.insert_queries = insert_queries
+            self.mtime = mtime
+            logMsg(f"TemplateRegistry loaded {len(templates)} templates ({len(compiled_queries)} precompiled) from {self.file_path}")
+
+    def format_query(self, template, src_columns, values=None, **params):
+        """Format a template's sql_query with its schema, data, columns and clause."""
+        src_schema = template.get('src_schema', 'default_schema')
+        src_data = template.get('src_data', 'default_data')
+        clause = template.get('clause') or ''
+
+        target_table = params.pop('target_table', None)
+        if clause and target_table:
+            clause = clause.format(src_schema=src_schema, src_obj=target_table)
+
+        format_params = {
+            'src_schema': src_schema,
+            'src_data': src_data,
+            'src_columns': src_columns.strip(),
+            'values': values,
+            'clause': clause,
+        }
+        format_params.update(params)
+        return template['sql_query'].format(**format_params)
+
+    def get(self, query_key, **params):
+        """
+        Return the formatted SQL for query_key.
+
+        Parameters:
+        query_key (str): Template key in bkds_data_mappings.json.
+        **params: Optional overrides for the format fields (src_schema, clause, ...)
+                  and target_table for clauses that reference {src_obj}.
+        """
+        self.reload_if_changed()
+        template = self.templates.get(query_key)
+        if template is None or not template.get('sql_query'):
+            raise ValueError(f"No template found for key: {query_key}")
+
+        if not params and query_key in self.compiled_queries:
+            return self.compiled_queries[query_key]
+
+        if template.get('src_columns'):
+            return self.format_query(template, template['src_columns'], **params)
+
+        src_schema = params.get('src_schema', template.get('src_schema', 'default_schema'))
+        src_data = params.get('src_data', template.get('src_data', 'default_data'))
+        column_names = self.get_column_names(f'{src_schema}.{src_data}')
+        values_placeholder = ', '.join(['%s'] * len(column_names))
+        return self.format_query(template, ', '.join(column_names), values=values_placeholder, **params)
+
+    def get_insert_query(self, mapping_key):
+        """Return the precompiled INSERT statement for a target_columns mapping."""
+        self.reload_if_changed()
+        if mapping_key not in self.insert_queries:
+            raise ValueError(f"No mapping found for key: {mapping_key}")
+        return self.insert_queries[mapping_key]
 
-def get_sqlTemplate(query_key, target_table=None):
-    logMsg(f"starting get_sqlTemplate")
-    #file_path = os.path.join(os.path.dirname(__file__), '../sql/bkds_data_mappings.json')
-    file_path = os.path.join(bkds_util_data, 'config', 'bkds_data_mappings.json')
-
-    cursor, conn = getDBConn()
-
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-        query_templates = data[0]
-
-        template = query_templates[query_key]
-        logMsg(f"found template for {query_key}")
-        # Find the query template based on the query_key
-        for template in query_templates:
-            logMsg(f"checking {query_key} template['query_id'] {template}")
-            if query_key in query_templates:
-                template = query_templates[query_key]
-                logMsg(f"found template for {query_key}")
-                
-                # Process the template as needed
-                src_schema = template.get('src_schema', 'default_schema')
-                src_data = template.get('src_data', 'default_data')
-                src_column_names = template.get('src_columns', 'default_column_names')
-                src_clause = template.get('clause', 'default_clause')
-
-                columns_formatted = None
-                values_placeholder = None
-                clause_formatted = src_clause
-                # Modify the SQL query template
-                sql_query = template['sql_query']
-                
-                #print(f"template[src_columns] {template}")
-                if template['src_columns']:
-                    #print(f'src_column_names {src_column_names}')
-                    src_column_names = src_column_names.split(", ")  # Adjust the delimiter if necessary
-                    print(f'src_column_names {src_column_names}')
-                # print(src_column_names.split(", "))
-
-                    columns_formatted = ', '.join(src_column_names)
-                    print(columns_formatted)
-
-                else:
-                    column_names = get_column_names(f'{src_schema}.{src_data}', cursor)
-                    # Retrieve column names for the table
-                    columns_formatted = ', '.join(column_names)
-
-                    values_placeholder = ', '.join(['%s' for _ in columns_formatted.split(',')])
-
-                if template['clause']:
-                    clause_placeholder = template['clause']
-                    # Format the clause with target_table if provided
-                    if target_table:
-                        clause_formatted = clause_placeholder.format(src_schema=src_schema, src_obj=target_table)
-                    else:
-                        clause_formatted = clause_placeholder.format(src_clause=src_clause)
-                        
-                print(f"\npre src_schema for {src_schema}")
-                print(f"\npre src_data for {src_data}")
-                print(f"\npre values_placeholder for {values_placeholder}")
-                print(f"\npre columns_formatted for {columns_formatted}")
-
-                print(f"src_schema: {src_schema}, src_data: {src_data}, src_columns: {columns_formatted}, values: {values_placeholder}, clause: {clause_formatted}")
-                print(f'sql_query\n {sql_query}')
-                
-                table_name = f"{src_schema}.{src_data}" 
-                formatted_query = sql_query.format(src_schema=src_schema, 
-                                                src_data=src_data, 
-                                                src_columns=columns_formatted, 
-                                                values=values_placeholder, 
-                                                clause=clause_formatted)
-                
-                print(f"\nformatted_query for {formatted_query}")
-                
-                closeDB(cursor, conn)
-                return formatted_query
-            else:
-                raise ValueError(f"No template found for key: {query_key}")   
-    
-    closeDB(cursor, conn)
-    return None
+    def get_load_target(self, mapping_key):
+        """Return (schema.table, target_columns) for a target_columns mapping."""
+        self.reload_if_changed()
+        template = self.templates.get(mapping_key)
+        if template is None or not template.get('target_columns'):
+            raise ValueError(f"No mapping found for key: {mapping_key}")
+        return f"{template['target_schema']}.{template['target_table']}", list(template['target_columns'])
+
+    def get_column_names(self, target_table, cursor=None, refresh=False):
+        """Return the ordered column names of schema.table, cached for column_ttl seconds."""
+        cached = self.column_cache.get(target_table)
+        if cached and cached[0] > time.time() and not refresh:
+            return cached[1]
+
+        schema_name, _, table_name = target_table.rpartition('.')
+        sql_query = ("SELECT column_name FROM information_schema.columns "
+                     "WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position")
+        params = (schema_name or 'public', table_name)
+
+        if cursor is not None:
+            cursor.execute(sql_query, params)
+            column_names = [row[0] for row in cursor.fetchall()]
+        else:
+            with db_cursor() as (cursor, conn):
+                cursor.execute(sql_query, params)
+                column_names = [row[0] for row in cursor.fetchall()]
 
-def get_column_names(target_table, cursor):
-    # Replace the query below with the one suitable for your database system
-    templateKey='select_query_get_column_names'
+        self.column_cache[target_table] = (time.time() + self.column_ttl, column_names)
+        return column_names
 
-    sql_query=get_sqlTemplate(templateKey, target_table)
-    
-    cursor.execute(sql_query)
-    columnList=[row[0] for row in cursor.fetchall()]
+sql_templates = TemplateRegistry()
 
-    return columnList
+def get_sqlTemplate(query_key, target_table=None):
+    logMsg(f"get_sqlTemplate for {query_key}")
+    if target_table:
+        return sql_templates.get(query_key, target_table=target_table)
+    return sql_templates.get(query_key)
+
+def get_column_names(target_table, cursor=None, refresh=False):
+    return sql_templates.get_column_names(target_table, cursor, refresh)
 
 def archiveData(processed_files, directory):
     proc_prefix = 'bkds_SubjGen'
@@ -497,87 +851,481 @@ def archiveData(processed_files, directory):
 
 
 
-def load_column_mappings(mapping_key):
-    mapping_dir = os.path.join(bkds_util_data, 'config', 'bkds_data_mappings.json')
-
-    print(f'load_column_mappings for {mapping_key} from {mapping_dir}')
-    with open(mapping_dir, 'r') as file:
-        data_list = json.load(file)
-
-        if isinstance(data_list, list):
-            print('isinstance')
-            for template_entry in data_list:
-                print('for template_entry in data_list')
-                if mapping_key in template_entry:
-                    template = template_entry[mapping_key]
-                    print(f'mapping_key in template_entry: \n\n{template["target_schema"]}\n\n{template["target_table"]}')
-                    target_schema = template["target_schema"]
-                    target_table = template["target_table"]
-                    target_columns = template["target_columns"]
+def db_copy_rows(cursor, target_table, columns, rows):
+    """
+    Bulk load rows into target_table with COPY ... FROM STDIN.
 
-                    placeholders = ', '.join(['%s'] * len(target_columns))
-                    insert_query = f"INSERT INTO {target_schema}.{target_table} ({', '.join(target_columns)}) VALUES ({placeholders});"
-                    print(f'\n{insert_query}')
-                    return insert_query
-            raise ValueError(f"No mapping found for key: {mapping_key}")
+    The caller owns the transaction; nothing is committed here.
+
+    Parameters:
+    cursor: Open cursor on the target connection.
+    target_table (str): schema.table to load.
+    columns (list): Column names, in the same order as each row tuple.
+    rows (iterable): Row tuples. None values are loaded as NULL.
+
+    Returns:
+    int: Number of rows sent.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    row_count = 0
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+        row_count += 1
+
+    if not row_count:
+        return 0
+
+    buffer.seek(0)
+    copy_query = f"COPY {target_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    cursor.copy_expert(copy_query, buffer)
+    return row_count
+
+class PlaceholderTemplate:
+    """
+    A `@@_key_@@` template split once into literal text and placeholder keys.
+
+    render(row) builds the output in a single pass instead of one str.replace per
+    row key. Placeholders whose key is not in the row are left as they are.
+    """
+    __slots__ = ('literals', 'keys')
+
+    def __init__(self, template):
+        parts = PLACEHOLDER_PATTERN.split(template)
+        self.literals = parts[0::2]
+        self.keys = parts[1::2]
+
+    def render(self, row):
+        if not self.keys:
+            return self.literals[0]
+        output = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            output.append(str(row[key]) if key in row else f'{PLACEHOLDER_MARKER}{key}_@@')
+            output.append(literal)
+        return ''.join(output)
+
+@lru_cache(maxsize=1024)
+def compile_placeholders(template):
+    """Return the cached PlaceholderTemplate for a template string."""
+    return PlaceholderTemplate(template)
+
+def resolve_placeholder_value(value, row_data):
+    """Render placeholders inside a row value (strings, and nested dicts/lists)."""
+    if isinstance(value, str):
+        return compile_placeholders(value).render(row_data) if PLACEHOLDER_MARKER in value else value
+    if isinstance(value, dict):
+        return {k: resolve_placeholder_value(v, row_data) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_placeholder_value(item, row_data) for item in value]
+    return value
+
+def render_placeholders(template, row_data):
+    """
+    Render template against row_data.
+
+    As before, string values in row_data that themselves contain placeholders are
+    rendered against the raw row first; rows without such values are used as is.
+
+    Parameters:
+    template (str): Text containing `@@_key_@@` placeholders.
+    row_data (dict): Values by key.
+
+    Returns:
+    str: The rendered text.
+    """
+    resolved = None
+    for key, value in row_data.items():
+        if isinstance(value, (dict, list)) or (isinstance(value, str) and PLACEHOLDER_MARKER in value):
+            if resolved is None:
+                resolved = dict(row_data)
+            resolved[key] = resolve_placeholder_value(value, row_data)
+    return compile_placeholders(template).render(row_data if resolved is None else resolved)
+
+def render_placeholder_chunk(chunk_args):
+    """Process pool worker for render_placeholder_rows."""
+    rows, template_key = chunk_args
+    return [render_placeholders(row.get(template_key) or '', row) for row in rows]
+
+def render_placeholder_rows(rows, template_key, pool=None, chunk_rows=PLACEHOLDER_CHUNK_ROWS):
+    """
+    Render each row's own template (row[template_key]) against the row.
+
+    Parameters:
+    rows (list): Row dicts.
+    template_key (str): Column holding the template, e.g. prompt_template_user.
+    pool (multiprocessing.Pool, optional): Spread chunks of chunk_rows rows across
+        worker processes; only worth it for very large prompt sets.
+
+    Returns:
+    list: Rendered strings in row order.
+    """
+    if pool is None or len(rows) <= chunk_rows:
+        return render_placeholder_chunk((rows, template_key))
+    chunks = [(rows[i:i + chunk_rows], template_key) for i in range(0, len(rows), chunk_rows)]
+    return [text for rendered in pool.map(render_placeholder_chunk, chunks) for text in rendered]
+
+def content_hash(data):
+    """Short blake2b digest of a str or bytes payload."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def atomic_write(file_path, data):
+    """
+    Write data (str or bytes) to file_path through a temp file in the same
+    directory and os.replace, so readers never see a partial file.
+    """
+    temp_path = f"{file_path}.tmp.{os.getpid()}"
+    try:
+        with open(temp_path, 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def page_file_name(prefix, page):
+    """Shard file name of a 1-based page, e.g. rockets_batch_page_0001.json."""
+    return f"{prefix}_page_{page:04d}.json"
+
+def write_page_shards(target_dir, prefix, records, page_size=FEED_PAGE_SIZE):
+    """
+    Split records, in order, into fixed-size page shards under target_dir/pages and
+    write a small page index ({prefix}_pages.json: page_size, total, pages), so a
+    reader serving one page opens only the shards it covers.
+
+    Unchanged shards are left alone; shards beyond the new page count are removed.
+    The index is written last, each file through atomic_write. Returns the page count.
+    """
+    pages_dir = os.path.join(target_dir, PAGE_DIR)
+    os.makedirs(pages_dir, exist_ok=True)
+    page_size = max(1, page_size)
+    page_count = (len(records) + page_size - 1) // page_size
+    written = 0
+
+    for page in range(1, page_count + 1):
+        page_path = os.path.join(pages_dir, page_file_name(prefix, page))
+        page_data = json.dumps(records[(page - 1) * page_size:page * page_size], separators=(',', ':'))
+        if os.path.exists(page_path):
+            with open(page_path, 'r') as file:
+                if file.read() == page_data:
+                    continue
+        atomic_write(page_path, page_data)
+        written += 1
+
+    page_index = {'page_size': page_size, 'total': len(records), 'pages': page_count}
+    atomic_write(os.path.join(pages_dir, f"{prefix}_pages.json"), json.dumps(page_index, separators=(',', ':')))
+
+    removed = 0
+    for page_path in glob.glob(os.path.join(pages_dir, f"{glob.escape(prefix)}_page_*.json")):
+        page_number = os.path.basename(page_path)[len(prefix) + len('_page_'):-len('.json')]
+        if page_number.isdigit() and int(page_number) > page_count:
+            os.remove(page_path)
+            removed += 1
+
+    logMsg(f"Page shards for {prefix}: {page_count} pages of {page_size}, {written} written, {removed} removed")
+    return page_count
+
+class InsightStore:
+    """
+    SQLite file per content category holding the same minimized JSON as the
+    per-insight files, one row per url_id with an index on cluster_id, so a
+    reader gets a whole category with one open instead of one per file.
+
+    rel_path is the JSON file's path relative to the category folder; the
+    files stay the export view. Several worker processes may write at once
+    (WAL journal, busy timeout of INSIGHT_STORE_TIMEOUT seconds).
+    """
+
+    def __init__(self, category_dir):
+        self.category_dir = category_dir
+        self.db_path = os.path.join(category_dir, INSIGHT_STORE_FILE)
+        os.makedirs(category_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=INSIGHT_STORE_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS insights ("
+            "url_id TEXT PRIMARY KEY, cluster_id TEXT, rel_path TEXT, content_hash TEXT, last_write INTEGER, data TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_insights_cluster_id ON insights (cluster_id)")
+        self.conn.commit()
+
+    @staticmethod
+    def exists(category_dir):
+        return os.path.exists(os.path.join(category_dir, INSIGHT_STORE_FILE))
+
+    def hashes(self, url_ids):
+        """{url_id: content_hash} for the stored url_ids among url_ids."""
+        url_ids = [str(url_id) for url_id in url_ids]
+        stored = {}
+        for start in range(0, len(url_ids), INSIGHT_STORE_QUERY_ROWS):
+            chunk = url_ids[start:start + INSIGHT_STORE_QUERY_ROWS]
+            stored.update(self.conn.execute(
+                f"SELECT url_id, content_hash FROM insights WHERE url_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return stored
+
+    def put_many(self, rows):
+        """Upsert (url_id, cluster_id, rel_path, content_hash, data) rows in one transaction."""
+        if not rows:
+            return
+        now = int(time.time())
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO insights (url_id, cluster_id, rel_path, content_hash, last_write, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(str(url_id), str(cluster_id), rel_path, payload_hash, now, data)
+                 for url_id, cluster_id, rel_path, payload_hash, data in rows]
+            )
+
+    def delete(self, url_ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM insights WHERE url_id = ?", [(str(url_id),) for url_id in url_ids])
+
+    def iter_rows(self, cluster_id=None):
+        """Yield (url_id, cluster_id, rel_path, data), optionally for one cluster."""
+        if cluster_id is None:
+            cursor = self.conn.execute("SELECT url_id, cluster_id, rel_path, data FROM insights")
         else:
-            raise TypeError("Expected a list in JSON data")
+            cursor = self.conn.execute(
+                "SELECT url_id, cluster_id, rel_path, data FROM insights WHERE cluster_id = ?", (str(cluster_id),))
+        yield from cursor
+
+    def close(self):
+        self.conn.close()
+
+class ContentManifest:
+    """
+    JSON manifest of generated output files, keyed by an id (e.g. url_id).
+
+    Each entry is a dict of fields such as output_path, content_hash and
+    last_write. The manifest is loaded once and written back atomically by
+    save(), and only if an entry changed. Worker processes can be handed a
+    subset of entries and send back changed_entries() for the owner to merge().
+    """
+
+    def __init__(self, file_path, entries=None):
+        self.file_path = file_path
+        self.dirty = False
+        self.changed = set()
+        if entries is not None:
+            self.entries = entries
+            return
+        try:
+            with open(file_path, 'r') as file:
+                self.entries = json.load(file)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError as e:
+            logMsg(f"ContentManifest ignoring unreadable {file_path}: {e}")
+            self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(str(key))
+
+    def update(self, key, **fields):
+        entry = self.entries.setdefault(str(key), {})
+        entry.update(fields)
+        self.changed.add(str(key))
+        self.dirty = True
+
+    def changed_entries(self):
+        return {key: self.entries[key] for key in self.changed if key in self.entries}
+
+    def merge(self, entries):
+        for key, fields in entries.items():
+            self.update(key, **fields)
+
+    def remove(self, key):
+        if self.entries.pop(str(key), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        atomic_write(self.file_path, json.dumps(self.entries))
+        self.dirty = False
+
+class UrlMapper:
+    """
+    Maps media URLs for production: complete web URLs are returned as they are,
+    local paths become base_path/<folder>/<file name> for the first pattern (in
+    order) found in the path, or base_path/<file name> otherwise.
+
+    map_url is LRU cached per input URL; map_urls maps a list, resolving each
+    distinct URL once. url_regex decides what counts as a web URL (default
+    WEB_URL_REGEX).
+    """
+
+    def __init__(self, base_path, patterns, cache_size=URL_CACHE_SIZE, url_regex=WEB_URL_REGEX):
+        self.base_path = base_path
+        self.patterns = tuple(patterns.items())
+        self.url_regex = url_regex
+        self.map_url = lru_cache(maxsize=cache_size)(self.resolve_url)
+
+    def resolve_url(self, url):
+        """Uncached mapping of one URL."""
+        if self.url_regex.match(url):
+            return url
+        file_name = os.path.basename(url)
+        for pattern, folder in self.patterns:
+            if pattern in url:
+                return os.path.join(self.base_path, folder, file_name)
+        return os.path.join(self.base_path, file_name)
+
+    def map_urls(self, urls):
+        """Map a list of URLs, preserving order."""
+        mapped = {url: self.map_url(url) for url in set(urls)}
+        return [mapped[url] for url in urls]
+
+class ImageIndex:
+    """
+    Read-only view of the files under root (e.g. images/full_size), built by one
+    recursive os.scandir sweep: path -> (size, mtime), plus per-directory maps of
+    lowercase name -> actual name and lowercase base name -> image file names.
+
+    Build it once per run before forking workers; lookups are dict hits. Paths
+    outside root fall back to the filesystem, and their directory listings are
+    cached on first use.
+    """
+
+    def __init__(self, root, extensions=IMAGE_EXTENSIONS):
+        self.root = os.path.normpath(root)
+        self.extensions = extensions
+        self.files = {}
+        self.names = {}
+        self.base_names = {}
+        self.build()
+
+    def build(self):
+        """Sweep root with os.scandir, breadth first, without following directory symlinks."""
+        start_time = time.time()
+        self.files.clear()
+        self.names.clear()
+        self.base_names.clear()
+        pending = [self.root] if os.path.isdir(self.root) else []
+        while pending:
+            directory = pending.pop()
+            file_names = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            self.files[entry.path] = (stat.st_size, stat.st_mtime)
+                            file_names.append(entry.name)
+            except OSError as e:
+                logMsg(f"ImageIndex: cannot scan {directory}: {e}")
+            self.add_directory(directory, file_names)
+        logMsg(f"ImageIndex: {len(self.files)} files in {len(self.names)} folders under {self.root} "
+               f"({time.time() - start_time:.1f}s)")
+
+    def add_directory(self, directory, file_names):
+        name_map = {}
+        base_map = {}
+        for file_name in file_names:
+            name_map[file_name.lower()] = file_name
+            base_name, ext = os.path.splitext(file_name)
+            if ext.lower() in self.extensions:
+                base_map.setdefault(base_name.lower(), []).append(file_name)
+        self.names[directory] = name_map
+        self.base_names[directory] = base_map
+
+    def covers(self, path):
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def directory_names(self, directory):
+        """Lowercase name map for directory, or None if it does not exist."""
+        directory = os.path.normpath(directory)
+        if directory not in self.names:
+            if self.covers(directory) or not os.path.isdir(directory):
+                return None
+            self.add_directory(directory, [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))])
+        return self.names[directory]
+
+    def isdir(self, directory):
+        return self.directory_names(directory) is not None
+
+    def exists(self, path):
+        if not path:
+            return False
+        path = os.path.normpath(path)
+        if self.covers(path):
+            return path in self.files or path in self.names
+        return os.path.exists(path)
+
+    def stat(self, path):
+        """(size, mtime) of an indexed file, or None."""
+        return self.files.get(os.path.normpath(path))
+
+    def find(self, path):
+        """Actual name of path's file in its directory, matched case-insensitively, or None."""
+        directory, file_name = os.path.split(os.path.normpath(path))
+        name_map = self.directory_names(directory)
+        return name_map.get(file_name.lower()) if name_map else None
+
+    def find_equivalent(self, path):
+        """Image file names sharing path's base name under any image extension."""
+        directory, file_name = os.path.split(os.path.normpath(path))
+        if self.directory_names(directory) is None:
+            return []
+        return self.base_names[directory].get(os.path.splitext(file_name)[0].lower(), [])
+
+    def rename(self, old_path, new_path):
+        """Record a rename done by the caller, keeping this process's view current."""
+        old_path, new_path = os.path.normpath(old_path), os.path.normpath(new_path)
+        directory = os.path.dirname(old_path)
+        if self.directory_names(directory) is None:
+            return
+        file_names = [name for name in self.names[directory].values() if name != os.path.basename(old_path)]
+        file_names.append(os.path.basename(new_path))
+        self.add_directory(directory, file_names)
+        if old_path in self.files:
+            self.files[new_path] = self.files.pop(old_path)
+
+def load_column_mappings(mapping_key):
+    logMsg(f'load_column_mappings for {mapping_key}')
+    return sql_templates.get_insert_query(mapping_key)
 
 def split_text_into_spans(text):
     """
     Splits the input text into sentences, wraps each sentence in a <span> tag,
     and returns the processed HTML string.
 
+    Sentence ends and abbreviations are found in a single scan of SPAN_SCAN_REGEX;
+    results are memoised per process by content hash (SPAN_CACHE_SIZE entries), so
+    bodies repeated across categories are only split once.
+
     :param text: The input text to process.
     :return: Processed HTML string with sentences wrapped in <span> tags.
     """
-    # Remove HTML tags
-    text = re.sub(r'</?[^>]+(>|$)', '', text)
-
-    # Detect Markdown-style headers (**header**) and replace with <strong> tags
-    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
-
-    # Mark `\n\n` with a unique placeholder, e.g., `[NEWPARA]`, to preserve paragraph breaks
-    text = re.sub(r'\n\n+', '[NEWPARA]', text)
+    cache_key = content_hash(text)
+    cached = span_cache.get(cache_key)
+    if cached is not None:
+        span_cache.move_to_end(cache_key)
+        return cached
 
-    # Replace remaining single line breaks with spaces
-    text = re.sub(r'\n', ' ', text)
+    # Remove HTML tags, then turn Markdown-style headers (**header**) into <strong> tags
+    text = SPAN_TAG_REGEX.sub('', text)
+    text = SPAN_BOLD_REGEX.sub(r'<strong>\1</strong>', text)
 
-    # Define abbreviations to avoid splitting in the middle of an abbreviation
-    abbreviations = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Inc.', 'Ltd.', 'D.C.', 'U.S.']
+    # `\n\n` marks a paragraph break ([NEWPARA]); remaining single line breaks become spaces
+    text = SPAN_NEWLINE_REGEX.sub(lambda m: ' ' if len(m.group()) == 1 else '[NEWPARA]', text)
 
-    # Replace abbreviations with placeholders
-    abbreviation_placeholders = {}
-    for i, abbr in enumerate(abbreviations):
-        placeholder = f'__ABBR{i}__'
-        # Escape periods in abbreviations for regex
-        abbr_escaped = re.escape(abbr)
-        text = re.sub(abbr_escaped, placeholder, text)
-        abbreviation_placeholders[placeholder] = abbr
-
-    # Now we can split sentences at punctuation marks
-    # Split sentences based on the regex
-    sentence_end_regex = r'([.!?])\s+'
-    sentences = re.split(sentence_end_regex, text)
-
-    # Reconstruct sentences
+    # One scan: abbreviation matches are skipped, punctuation + whitespace ends a sentence
     full_sentences = []
-    i = 0
-    while i < len(sentences):
-        sentence = sentences[i].strip()
-        if i + 1 < len(sentences):
-            punctuation = sentences[i + 1]
-            full_sentence = sentence + punctuation
-            i += 2
-        else:
-            full_sentence = sentence
-            i += 1
-        full_sentences.append(full_sentence)
-
-    # Restore abbreviations
-    for i, sentence in enumerate(full_sentences):
-        for placeholder, abbr in abbreviation_placeholders.items():
-            full_sentences[i] = full_sentences[i].replace(placeholder, abbr)
+    sentence_start = 0
+    for match in SPAN_SCAN_REGEX.finditer(text):
+        punctuation = match.group(1)
+        if punctuation is None:
+            continue
+        full_sentences.append(text[sentence_start:match.start()].strip() + punctuation)
+        sentence_start = match.end()
+    full_sentences.append(text[sentence_start:].strip())
 
     # Replace `[NEWPARA]` with `<br><br>` for visual line breaks
     merged_sentences = ' '.join([
@@ -587,4 +1335,8 @@ def split_text_into_spans(text):
     merged_sentences = merged_sentences.replace('[NEWPARA]', '<br><br>')
 
     # Wrap the entire output in paragraph tags for structure
-    return f'<p>{merged_sentences}</p>'
\ No newline at end of file
+    result = f'<p>{merged_sentences}</p>'
+    span_cache[cache_key] = result
+    if len(span_cache) > SPAN_CACHE_SIZE:
+        span_cache.popitem(last=False)
+    return result
\ No newline at end of file
@@ -3,33 +3,39 @@
 Script Name: Download Manager
 Description:
     This script processes a batch of image URLs from a database, downloading each image based on its source.
-    For 'wiki' sources, images are downloaded using the curl command; for others, the requests library is used.
+    Downloads run concurrently within per-host budgets (see bkds_backend_imgDownload): each host has a concurrency
+    limit and a request rate, all requests share one keep-alive session, and progress is kept in a state file so
+    an interrupted run resumes where it stopped.
     The script ensures filenames and extensions are in lowercase and standardizes image extensions.
-    It also archives invalid images (zero-byte files, text files, or images containing a "not found" string) before loading valid images into the database.
+    It also archives invalid images (zero-byte files, text files, or images containing a "not found" string) before loading valid images into the database;
+    only files that are new or changed since they were last validated are read (see bkds_backend_imgValidate).
+    Images with identical content under different names are then hardlinked to one copy (see bkds_backend_imgDedupe),
+    with a JSON report of the duplicates and the disk reclaimed written to the archive folder.
 
 Usage:
-    python download_manager.py <query_key> --low <min_sleep_seconds> --high <max_sleep_seconds>
+    python download_manager.py <query_key> --low <min_sleep_seconds> --high <max_sleep_seconds> [--refresh] [--dedupe_report_only] [--near_duplicates]
 
 Arguments:
     query_key: Unique identifier for the batch to be processed.
-    --low: Minimum number of seconds to sleep randomly after each download.
-    --high: Maximum number of seconds to sleep randomly after each download.
+    --low / --high: Request spacing range in seconds for hosts without a budget; they are allowed one request
+                    per (low + high) / 2 seconds on average, as with the former random sleep.
+    --refresh: Revalidate images already in the cache (ETag / Last-Modified) instead of skipping them.
+    --dedupe_report_only: Report content duplicates without hardlinking them.
+    --near_duplicates: Also report perceptually similar images (dHash).
 """
 
 import os
 import hashlib
 import zipfile
-import requests
 import json
-import time
-import random
 import argparse
 import re
-import subprocess
 from datetime import datetime
-from PIL import Image, UnidentifiedImageError
 from bkds_Utilities import log_msg, fetch_data, get_sqlTemplate
 from bkds_backend_imgCacheGen_DBLoad import loadDB
+from bkds_backend_imgDedupe import deduplicate_content
+from bkds_backend_imgDownload import ImageDownloader, DEFAULT_HOST_BUDGET
+from bkds_backend_imgValidate import ImageValidator
 
 #####################################################################
 # Main Setup / Variables
@@ -38,8 +44,11 @@ program_name = os.path.basename(__file__)
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Process a subject given a batch id")
     parser.add_argument("query_key", help="query key")
-    parser.add_argument("--low", type=float, default=1, help="Minimum sleep time in seconds")
-    parser.add_argument("--high", type=float, default=4, help="Maximum sleep time in seconds")
+    parser.add_argument("--low", type=float, default=1, help="Minimum request spacing in seconds for hosts without a budget")
+    parser.add_argument("--high", type=float, default=4, help="Maximum request spacing in seconds for hosts without a budget")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate cached images with conditional requests")
+    parser.add_argument("--dedupe_report_only", action="store_true", help="Report content duplicates without hardlinking them")
+    parser.add_argument("--near_duplicates", action="store_true", help="Also report perceptually similar images")
     return parser.parse_args()
 
 args = parse_arguments()
@@ -53,6 +62,7 @@ content_root = 'image_cache'
 output_dir = os.path.join(util_data, content_root)
 prefix = 'bkds'
 proc_log = f'{prefix}_{program_name}_{query_key}.log'
+download_state = f'.{prefix}_{program_name}_{query_key}.state'
 mapping_file = f'bkds_data_mappings.json'
 mapping_env = os.getenv('BKDS_UTIL_DATA')
 mapping_dir = os.path.join(mapping_env, 'config', mapping_file)
@@ -85,18 +95,6 @@ def sanitize_filename(filename):
     filename = re.sub(r'\s+', '_', filename)
     return filename
 
-def download_with_curl(img_url, file_path):
-    cmd = ['curl', '-s', '-o', file_path, img_url]
-    subprocess.run(cmd)
-
-def enforce_rest_interval(start_time, interval=300):
-    if time.time() - start_time > interval:
-        rest_duration = random.randint(600, 1200)  # Random sleep between 10 to 20 minutes
-        logMsg(f"Pausing for {rest_duration / 60} minutes to avoid overloading servers.")
-        time.sleep(rest_duration)
-        return time.time()  # Reset the start time after the rest
-    return start_time
-
 def determine_src_type(query_key):
     if "yt" in query_key:
         return 'yt'
@@ -106,63 +104,54 @@ def determine_src_type(query_key):
         return 'wiki'
     return 'unknown'
 
-def download_images(image_data, target_folder, src_type, low, high, existing_files):
-    start_time = time.time()  # Track when the script starts downloading images
+def download_images(image_data, target_folder, src_type, low, high, existing_files, refresh=False):
     if not os.path.exists(target_folder):
         os.makedirs(target_folder)
 
+    jobs = []
+    for entry in image_data:
+        img_url = entry['img_url']
+        img_url_id = entry['img_url_id']
+        img_type = entry['img_type']
+        original_filename = img_url.split('/')[-1]
+        hygiened_filename = sanitize_filename(original_filename)
+        filename = f"{img_type}_{src_type}_{img_url_id}_{hygiened_filename}"
+
+        dl_folder = os.path.join(target_folder, img_type)
+        if not os.path.exists(dl_folder):
+            os.makedirs(dl_folder)
+
+        file_path = os.path.join(dl_folder, filename)
+
+        # Skip download if file already exists
+        if file_path in existing_files and not refresh:
+            logMsg(f"File already exists, skipping download: {filename}")
+            continue
+        jobs.append((img_url, file_path))
+
+    # Hosts without a budget keep the average spacing of the former random sleep
+    max_concurrent, _, burst = DEFAULT_HOST_BUDGET
+    default_budget = (max_concurrent, 2 / max(low + high, 0.001), burst)
+    downloader = ImageDownloader(os.path.join(target_folder, download_state), default_budget, refresh,
+                                 program_name=program_name, batch_id=query_key)
+    downloader.download_all(jobs)
+
     log_file_path = os.path.join(target_folder, proc_log)
     with open(log_file_path, 'w') as log_file:
-        for entry in image_data:
-            start_time = enforce_rest_interval(start_time)  # Check if it needs to rest
-
-            img_url = entry['img_url']
-            img_url_id = entry['img_url_id']
-            img_type = entry['img_type']
-            original_filename = img_url.split('/')[-1]
-            hygiened_filename = sanitize_filename(original_filename)
-            filename = f"{img_type}_{src_type}_{img_url_id}_{hygiened_filename}"
-
-            dl_folder = os.path.join(target_folder, img_type)
-            if not os.path.exists(dl_folder):
-                os.makedirs(dl_folder)
-
-            file_path = os.path.join(dl_folder, filename)
-
-            # Skip download if file already exists
-            if file_path in existing_files:
-                logMsg(f"File already exists, skipping download: {filename}")
-                continue
-
-            logMsg(f'Getting: {img_url}')
-            try:
-                time.sleep(random.uniform(low, high))  # Sleep for a random time interval
-                if src_type == 'wiki':
-                    download_with_curl(img_url, file_path)
-                else:
-                    response = requests.get(img_url, stream=True)
-                    if response.status_code == 200:
-                        with open(file_path, 'wb') as f:
-                            for chunk in response.iter_content(1024):
-                                f.write(chunk)
-                        logMsg(f"Downloaded and saved as {filename}")
-                    else:
-                        log_file.write(f"{img_url} resulted in a {response.status_code} error\n")
-                        logMsg(f"Failed to download {img_url}")
-            except Exception as e:
-                log_file.write(f"{img_url} resulted in an error: {str(e)}\n")
-                logMsg(f"Error downloading {img_url}: {str(e)}")
+        for line in downloader.log_lines:
+            log_file.write(f"{line}\n")
 
 def archive_invalid_images(target_directory):
     invalid_files = []
     archive_dir = os.path.join(target_directory, 'archive')
     os.makedirs(archive_dir, exist_ok=True)
 
-    for root, _, files in os.walk(target_directory):
+    rel_paths = []
+    for root, dirs, files in os.walk(target_directory):
+        dirs[:] = [d for d in dirs if d != archive_folder]
         for file in files:
             if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
                 path = os.path.join(root, file)
-                rel_path = os.path.relpath(path, target_directory)
 
                 # Convert filename and extension to lowercase, and .jpeg to .jpg
                 new_filename = sanitize_filename(file)
@@ -171,39 +160,14 @@ def archive_invalid_images(target_directory):
                 if path != new_path:
                     os.rename(path, new_path)
                     path = new_path
+                rel_paths.append(os.path.relpath(path, target_directory))
 
-                try:
-                    # Check if file is zero bytes
-                    if os.path.getsize(path) == 0:
-                        logMsg(f"Zero-byte file found: {rel_path}")
-                        invalid_files.append(path)
-                        continue
-
-                    # Try to open the image to check if it's valid
-                    with Image.open(path) as img:
-                        img.verify()  # Verify that it is, in fact, an image
-                except (UnidentifiedImageError, IOError):
-                    # The file is not a valid image
-                    logMsg(f"Invalid image file (cannot open): {rel_path}")
-                    invalid_files.append(path)
-                    continue
-                except Exception as e:
-                    logMsg(f"Error verifying image {rel_path}: {e}")
-                    invalid_files.append(path)
-                    continue
-
-                # Check if the file contains the string "not found"
-                try:
-                    with open(path, 'rb') as f:
-                        file_content = f.read()
-                        if b'not found' in file_content.lower():
-                            logMsg(f"File contains 'not found' string: {rel_path}")
-                            invalid_files.append(path)
-                            continue
-                except Exception as e:
-                    logMsg(f"Error reading file {rel_path}: {e}")
-                    invalid_files.append(path)
-                    continue
+    # Magic bytes, bounded header/trailer windows and a header-only open, in a thread pool;
+    # files unchanged since they were last accepted are not read again
+    invalid = ImageValidator(target_directory, program_name=program_name, batch_id=query_key).validate(rel_paths)
+    for rel_path, reason in sorted(invalid.items()):
+        logMsg(f"Invalid image file ({reason}): {rel_path}")
+        invalid_files.append(os.path.join(target_directory, rel_path))
 
     if invalid_files:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -215,7 +179,7 @@ def archive_invalid_images(target_directory):
                 os.remove(invalid_file)  # Remove the invalid file after adding it to the zip
         logMsg(f"Archived invalid images to {archive_path}")
 
-def deduplicate_images(target_directory):
+def deduplicate_images(target_directory, report_only=False, near_duplicates=False):
     filename_table = {}
     duplicates = []
     archive_dir = os.path.join(target_directory, 'archive')
@@ -242,6 +206,11 @@ def deduplicate_images(target_directory):
                 os.remove(dup)  # Remove the duplicate file after adding it to the zip
         logMsg(f"Archived duplicate images to {archive_path}")
 
+    # Same content under different names: hardlink the copies to one file
+    report_path = os.path.join(archive_dir, f'{dup_file}.json')
+    deduplicate_content(target_directory, report_only=report_only, near_duplicates=near_duplicates, report_path=report_path,
+                        program_name=program_name, batch_id=query_key)
+
 def main():
     logMsg(f"Starting main for {query_key} from {program_name}")
 
@@ -252,13 +221,13 @@ def main():
     sql_query = get_sqlTemplate(query_key)
     image_data = fetch_data(sql_query)  # Fetch data using the SQL query
 
-    download_images(image_data, poc_dir, src_type, args.low, args.high, existing_files)
+    download_images(image_data, poc_dir, src_type, args.low, args.high, existing_files, args.refresh)
 
     # Archive invalid images before loading to the database
     archive_invalid_images(poc_dir)
 
     # Deduplicate images
-    deduplicate_images(poc_dir)
+    deduplicate_images(poc_dir, args.dedupe_report_only, args.near_duplicates)
 
     # Load valid images into the database
     loadDB(query_key, poc_dir)
@@ -1,9 +1,11 @@
 import os
+import math
 import hashlib
 import time
 import argparse
 import psycopg2
 from datetime import datetime
+from multiprocessing import Pool, cpu_count
 from PIL import Image
 from bkds_Utilities import log_msg, getDBConn, closeDB, get_sqlTemplate, fetch_data
 
@@ -21,6 +23,9 @@ image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
 sizes = ['PIL_480', 'PIL_720', 'PIL_1080']
 valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
 thumb_dir = 'thumbnail'
+# JPEG sources are decoded at no less than draft_gap x the largest thumbnail edge
+draft_gap = 2
+thumbnail_chunk_size = 8
 mapping_source_type = 'img_cache'
 
 ########################################################################
@@ -40,15 +45,38 @@ def generate_md5_hash(*args):
     hash_obj.update(combined_string)
     return hash_obj.hexdigest()
 
-def generate_thumbnails(source_directory):
-    generated_count = 0
-    skipped_count = 0
-
-    # Gather all files in the directory that do not have _PIL_ in the name
-    base_files = [f for f in os.listdir(source_directory) if os.path.isfile(os.path.join(source_directory, f)) and "_PIL_" not in f]
+def thumbnail_edge(size):
+    """Longest edge in pixels for a size label such as 'PIL_480'."""
+    return int(size.split('_')[1])
+
+def thumbnail_size(source_size, edge):
+    """Size Image.thumbnail((edge, edge)) gives a source_size image; pyramid levels keep the source's rounding."""
+    width, height = source_size
+    if width <= edge and height <= edge:
+        return width, height
+    aspect = width / height
+    if aspect <= 1:
+        x = edge * aspect
+        return max(min(math.floor(x), math.ceil(x), key=lambda n: abs(aspect - n / edge)), 1), edge
+    y = edge / aspect
+    return edge, max(min(math.floor(y), math.ceil(y), key=lambda n: 0 if n == 0 else abs(aspect - edge / n)), 1)
+
+def plan_thumbnails(source_directory):
+    """
+    One scandir of source_directory; returns the base images as (base_file, [sizes to build])
+    with only the sizes whose output is missing or older than the source, and the skip counts.
+    """
+    entries = {}
+    with os.scandir(source_directory) as it:
+        for entry in it:
+            if entry.is_file():
+                entries[entry.name] = entry.stat().st_mtime
 
+    base_files = [f for f in entries if "_PIL_" not in f]
     print(f"Found {len(base_files)} base files to process.")
 
+    tasks = []
+    skipped_count = 0
     for base_file in base_files:
         base_name, ext = os.path.splitext(base_file)
 
@@ -57,30 +85,71 @@ def generate_thumbnails(source_directory):
             print(f"Skipping non-image file: {base_file}")
             continue
 
+        source_mtime = entries[base_file]
+        pending = []
         for size in sizes:
-            suffix = f"_{size}.jpg"
-            pil_version = base_name + suffix
-            pil_path = os.path.join(source_directory, pil_version)
-
-            # If the _PIL_ version does not exist, create it
-            if not os.path.exists(pil_path):
-                img_path = os.path.join(source_directory, base_file)
-                
-                try:
-                    with Image.open(img_path) as img:
-                        img_copy = img.copy()
-                        img_copy.thumbnail((int(size.split('_')[1]), int(size.split('_')[1])), Image.LANCZOS)
-                        img_copy.save(pil_path)
-                        print(f"Created {pil_path}")
-                        generated_count += 1
-                except Exception as e:
-                    print(f"Failed to create {pil_path}: {e}")
-            else:
-                print(f"Skipped existing file: {pil_path}")
+            output_mtime = entries.get(f"{base_name}_{size}.jpg")
+            if output_mtime is not None and output_mtime >= source_mtime:
                 skipped_count += 1
+            else:
+                pending.append(size)
+        if pending:
+            tasks.append((os.path.join(source_directory, base_file), pending))
+    return tasks, skipped_count
+
+def render_thumbnails(task):
+    """
+    Decode one source once and write each pending size from a single pyramid, largest first.
+    JPEG sources are drafted (downscaled by libjpeg on decode) to at least draft_gap times the
+    largest edge; each smaller size is resampled from the previous level, sized from the
+    source dimensions so the outputs match a full-resolution Image.thumbnail.
+    Returns (img_path, [created paths], error).
+    """
+    img_path, pending = task
+    base_name = os.path.splitext(img_path)[0]
+    created = []
+    try:
+        with Image.open(img_path) as img:
+            source_size = img.size
+            largest = max(thumbnail_edge(size) for size in pending)
+            img.draft('RGB', (largest * draft_gap, largest * draft_gap))
+            level = img.convert('RGB') if img.mode not in ('RGB', 'L') else img.copy()
+
+        for size in sorted(pending, key=thumbnail_edge, reverse=True):
+            target = thumbnail_size(source_size, thumbnail_edge(size))
+            if level.size != target:
+                level = level.resize(target, Image.LANCZOS)
+            pil_path = f"{base_name}_{size}.jpg"
+            tmp_path = f"{pil_path}.tmp"
+            level.save(tmp_path, 'JPEG')
+            os.replace(tmp_path, pil_path)
+            created.append(pil_path)
+    except Exception as e:
+        return img_path, created, e
+    return img_path, created, None
 
+def generate_thumbnails(source_directory, processes=None):
+    start_time = time.time()
+    tasks, skipped_count = plan_thumbnails(source_directory)
+    generated_count = 0
+    failed_count = 0
+
+    processes = processes or cpu_count()
+    with Pool(processes) as pool:
+        for img_path, created, error in pool.imap_unordered(render_thumbnails, tasks, chunksize=thumbnail_chunk_size):
+            for pil_path in created:
+                print(f"Created {pil_path}")
+            generated_count += len(created)
+            if error:
+                print(f"Failed to create thumbnails for {img_path}: {error}")
+                failed_count += 1
+
+    elapsed = time.time() - start_time
+    rate = len(tasks) / elapsed if elapsed > 0 else 0
     print(f"Total files generated: {generated_count}")
     print(f"Total files skipped: {skipped_count}")
+    print(f"Total sources failed: {failed_count}")
+    print(f"Processed {len(tasks)} sources in {elapsed:.1f}s ({rate:.1f} images/sec, {processes} processes)")
 
 def build_insert_statements(target_directory, batch_id):
     data_to_insert = []
@@ -173,10 +242,11 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description="Process a subject given a batch id")
     parser.add_argument("batch_id", help="Batch ID")
     parser.add_argument("target_directory", help="Target directory")
+    parser.add_argument("--processes", type=int, default=cpu_count(), help="Processes used to generate thumbnails")
     return parser.parse_args()
 
 # Allow the script to be run standalone
 if __name__ == "__main__":
     args = parse_arguments()
     loadDB(args.batch_id, args.target_directory)
-    generate_thumbnails(args.target_directory)
+    generate_thumbnails(args.target_directory, args.processes)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Image Cache Content Deduplication
+
+This module finds images in the image cache that have the same content under different
+names (e.g. one Wikimedia file fetched for several img_url_ids) and replaces the copies
+with hardlinks to one file, so the bytes are stored once while every path the database
+loads still exists.
+
+Functionality:
+- Scan the cache once (archive folders skipped) and bucket the images by file size;
+  only files sharing a size with another file are read
+- Hash the first 64KB of each candidate, then the whole file for candidates whose heads
+  match (blake2b), in a thread pool
+- Keep the hashes in a persistent index (.bkds_image_hashes.manifest, a ContentManifest
+  keyed by relative path) and reuse them while a file's size and mtime are unchanged,
+  so a rerun only reads new or changed files
+- Keep the oldest file of each group and hardlink the others to it (temp link + rename);
+  paths that already share an inode are left alone and count as reclaimed already
+- Optionally compute a 64-bit difference hash (dHash) of every image and report pairs
+  within a Hamming distance as near-duplicates; these are reported only, never linked
+- Write a JSON report of the groups, the near-duplicate pairs and the bytes reclaimed
+
+Usage:
+- As a library: deduplicate_content(target_directory) from bkds_backend_imgCacheGenGet
+- As a script: python bkds_backend_imgDedupe.py <target_directory> [--report_only]
+  [--near_duplicates] [--distance 4] [--workers 8] [--report report.json]
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from bkds_Utilities import log_msg, ContentManifest
+
+PROGRAM_NAME = os.path.basename(__file__)
+BATCH_ID = 'BKDS_IMG_DEDUPE'
+
+def logMsg(msg, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """Log a message to the console and using a logging system, under the caller's program name and batch id."""
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+##################################
+# Setup and global variables
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+skip_dirs = {'archive'}
+
+HASH_INDEX_FILE = '.bkds_image_hashes.manifest'  # not an image extension, so scans skip it
+HEAD_BYTES = 64 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+HASH_WORKERS = 8
+DHASH_SIZE = 8
+NEAR_DUPLICATE_DISTANCE = 4
+LINK_SUFFIX = '.dedupe'
+
+##################################
+# Main logic and functions
+
+def scan_images(directory):
+    """One walk of directory; returns rel_path -> (size, mtime, (st_dev, st_ino)) for every image."""
+    images = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        for file in files:
+            if file.lower().endswith(image_extensions):
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                images[os.path.relpath(path, directory)] = (stat.st_size, stat.st_mtime, (stat.st_dev, stat.st_ino))
+    return images
+
+def file_digest(path, limit=None):
+    """blake2b of the first limit bytes of path (the whole file if limit is None)."""
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            block = f.read(HASH_BLOCK_SIZE if remaining is None else min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest.hexdigest()
+
+def difference_hash(path):
+    """64-bit dHash of an image as a hex string: brightness gradients of a 9x8 grayscale thumbnail."""
+    with Image.open(path) as img:
+        img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+        pixels = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+class ImageHashIndex:
+    """
+    Persistent hashes of the images under a directory, keyed by relative path.
+
+    Entries hold size and mtime plus whichever of head, hash and dhash were computed;
+    a field is reused only while size and mtime still match the file.
+    """
+
+    def __init__(self, directory, workers=HASH_WORKERS, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+        self.directory = directory
+        self.workers = workers
+        self.program_name = program_name
+        self.batch_id = batch_id
+        self.manifest = ContentManifest(os.path.join(directory, HASH_INDEX_FILE))
+        self.computed = 0
+
+    def cached(self, rel_path, field, size, mtime):
+        entry = self.manifest.get(rel_path)
+        if entry and entry.get('size') == size and entry.get('mtime') == mtime:
+            return entry.get(field)
+        return None
+
+    def lookup(self, images, rel_paths, field, compute):
+        """Return rel_path -> field value, computing the missing ones in the thread pool."""
+        values = {}
+        missing = []
+        for rel_path in rel_paths:
+            size, mtime, _ = images[rel_path]
+            value = self.cached(rel_path, field, size, mtime)
+            if value is None:
+                missing.append(rel_path)
+            else:
+                values[rel_path] = value
+
+        def compute_one(rel_path):
+            try:
+                return rel_path, compute(os.path.join(self.directory, rel_path))
+            except Exception as e:
+                logMsg(f"Could not compute {field} of {rel_path}: {e}", self.program_name, self.batch_id)
+                return rel_path, None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for rel_path, value in executor.map(compute_one, missing):
+                if value is None:
+                    continue
+                size, mtime, _ = images[rel_path]
+                entry = self.manifest.get(rel_path)
+                if not entry or entry.get('size') != size or entry.get('mtime') != mtime:
+                    self.manifest.entries[rel_path] = {'size': size, 'mtime': mtime}
+                self.manifest.update(rel_path, **{field: value})
+                values[rel_path] = value
+                self.computed += 1
+        return values
+
+    def prune(self, images):
+        """Drop entries for files that no longer exist."""
+        for rel_path in [key for key in self.manifest.entries if key not in images]:
+            self.manifest.remove(rel_path)
+
+    def save(self):
+        self.manifest.save()
+
+def group_by(rel_paths, values):
+    groups = {}
+    for rel_path in rel_paths:
+        if rel_path in values:
+            groups.setdefault(values[rel_path], []).append(rel_path)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(images, index):
+    """
+    Groups of rel_paths with identical content. Files are bucketed by size, then by the
+    hash of their first HEAD_BYTES, and only files still colliding are hashed in full.
+    Paths sharing an inode are represented once.
+    """
+    by_inode = {}
+    for rel_path in sorted(images):
+        by_inode.setdefault(images[rel_path][2], rel_path)
+    candidates = [rel_path for rel_path in by_inode.values() if images[rel_path][0] > 0]
+
+    by_size = {}
+    for rel_path in candidates:
+        by_size.setdefault(images[rel_path][0], []).append(rel_path)
+    sized = [rel_path for group in by_size.values() if len(group) > 1 for rel_path in group]
+
+    heads = index.lookup(images, sized, 'head', lambda path: file_digest(path, HEAD_BYTES))
+    headed = [rel_path for size_group in by_size.values() if len(size_group) > 1
+              for group in group_by(size_group, heads) for rel_path in group]
+
+    # Files no longer than HEAD_BYTES were hashed in full already
+    full = {rel_path: heads[rel_path] for rel_path in headed if images[rel_path][0] <= HEAD_BYTES}
+    full.update(index.lookup(images, [rel_path for rel_path in headed if rel_path not in full], 'hash', file_digest))
+
+    groups = []
+    for size_group in by_size.values():
+        for head_group in group_by(size_group, heads):
+            groups.extend(group_by(head_group, full))
+    return groups
+
+def find_near_duplicates(images, index, canonical_of=None, distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Pairs (rel_path, rel_path, distance) whose dHashes differ in at most distance bits.
+    Paths sharing an inode, and the members of each exact duplicate group (canonical_of:
+    rel_path -> the group's kept path), are represented once, so a near-duplicate is
+    reported once however many copies it has. The 64 bits are split into distance + 1 bands; two hashes within distance bits agree
+    on at least one band, so only paths sharing a band value are compared.
+    """
+    canonical_of = canonical_of or {}
+    by_inode = {}
+    for rel_path in sorted(images):
+        by_inode.setdefault(images[rel_path][2], rel_path)
+    representatives = sorted({canonical_of.get(rel_path, rel_path) for rel_path in by_inode.values()})
+    dhashes = index.lookup(images, representatives, 'dhash', difference_hash)
+    values = {rel_path: int(value, 16) for rel_path, value in dhashes.items()}
+
+    hash_bits = DHASH_SIZE * DHASH_SIZE
+    band_count = distance + 1
+    band_width = -(-hash_bits // band_count)
+    band_mask = (1 << band_width) - 1
+    bands = {}
+    for rel_path, value in values.items():
+        for band in range(band_count):
+            bands.setdefault((band, (value >> (band * band_width)) & band_mask), []).append(rel_path)
+
+    pairs = {}
+    for members in bands.values():
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                key = (first, second) if first < second else (second, first)
+                if key in pairs:
+                    continue
+                bits = bin(values[first] ^ values[second]).count('1')
+                if bits <= distance:
+                    pairs[key] = bits
+    return [(first, second, bits) for (first, second), bits in sorted(pairs.items())]
+
+def link_duplicates(directory, images, groups, report_only=False, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """
+    Replace every file of each group with a hardlink to the group's oldest file.
+    Returns (canonical rel_path, [linked rel_paths], bytes reclaimed) per group.
+    """
+    results = []
+    for group in groups:
+        canonical = min(group, key=lambda rel_path: (images[rel_path][1], rel_path))
+        canonical_path = os.path.join(directory, canonical)
+        linked = []
+        reclaimed = 0
+        for rel_path in sorted(group):
+            if rel_path == canonical:
+                continue
+            if not report_only:
+                path = os.path.join(directory, rel_path)
+                temp_path = path + LINK_SUFFIX
+                try:
+                    os.link(canonical_path, temp_path)
+                    os.replace(temp_path, path)
+                except OSError as e:
+                    logMsg(f"Could not link {rel_path} to {canonical}: {e}", program_name, batch_id)
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    continue
+            linked.append(rel_path)
+            reclaimed += images[rel_path][0]
+        results.append((canonical, linked, reclaimed))
+    return results
+
+def deduplicate_content(target_directory, report_only=False, near_duplicates=False,
+                        distance=NEAR_DUPLICATE_DISTANCE, workers=HASH_WORKERS, report_path=None,
+                        program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """
+    Find identical images under target_directory, hardlink the copies (unless report_only)
+    and return a report dict; written as JSON to report_path when given. Messages are
+    logged under program_name and batch_id (the caller's).
+    """
+    start_time = time.time()
+    images = scan_images(target_directory)
+    index = ImageHashIndex(target_directory, workers, program_name, batch_id)
+    index.prune(images)
+
+    groups = find_duplicates(images, index)
+    linked = link_duplicates(target_directory, images, groups, report_only, program_name, batch_id)
+    canonical_of = {rel_path: canonical for (canonical, _, _), group in zip(linked, groups) for rel_path in group}
+    near = find_near_duplicates(images, index, canonical_of, distance) if near_duplicates else []
+
+    index.save()
+
+    already_linked = len(images) - len({inode for _, _, inode in images.values()})
+    reclaimed = sum(bytes_reclaimed for _, _, bytes_reclaimed in linked)
+    report = {
+        'directory': target_directory,
+        'images': len(images),
+        'hashed': index.computed,
+        'report_only': report_only,
+        'duplicate_groups': [{'keep': canonical, 'linked': rel_paths, 'bytes': bytes_reclaimed}
+                             for canonical, rel_paths, bytes_reclaimed in linked],
+        'already_linked': already_linked,
+        'bytes_reclaimed': reclaimed,
+        'near_duplicates': [{'first': first, 'second': second, 'distance': bits} for first, second, bits in near],
+    }
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    action = "Reclaimable" if report_only else "Reclaimed"
+    logMsg(f"Dedupe: {len(images)} images, {index.computed} hashed, {len(groups)} duplicate groups, "
+           f"{sum(len(rel_paths) for _, rel_paths, _ in linked)} copies, {len(near)} near-duplicate pairs. "
+           f"{action} {reclaimed / (1024 * 1024):.1f}MB ({time.time() - start_time:.1f}s)", program_name, batch_id)
+    return report
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Hardlink images with identical content in the image cache.")
+    parser.add_argument("target_directory", help="Image cache directory to deduplicate")
+    parser.add_argument("--report_only", action="store_true", help="Report duplicates without linking them")
+    parser.add_argument("--near_duplicates", action="store_true", help="Also report perceptually similar images")
+    parser.add_argument("--distance", type=int, default=NEAR_DUPLICATE_DISTANCE, help="Maximum dHash bit distance for near-duplicates")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="Threads used for hashing")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    deduplicate_content(args.target_directory, args.report_only, args.near_duplicates,
+                        args.distance, args.workers, args.report)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Image Cache Download Engine
+
+This module downloads image URLs concurrently while staying within a budget per host:
+each host has a concurrency limit and a token-bucket request rate, so wiki, flickr and
+youtube thumbnails are fetched in parallel with each other while no single server sees
+more than its share. It replaces the serial download loop of bkds_backend_imgCacheGenGet,
+its random sleep after every file, the curl subprocess for wiki sources and the 10-20
+minute pause of the whole job every 5 minutes.
+
+Functionality:
+- One keep-alive requests.Session for all hosts, with a descriptive User-Agent
+- Per host: max_concurrent worker threads draining that host's queue and a token bucket
+  (rate requests/sec, burst) shared by them; 429/503 responses with Retry-After (or the
+  retry backoff) push the host's bucket back, not the whole job
+- Each response is streamed to <file>.part and renamed into place once complete, so a
+  half written image never carries the final name
+- Resumable state (a ContentManifest keyed by URL) records status, ETag, Last-Modified
+  and size per URL and is saved every STATE_SAVE_EVERY results; a rerun skips completed
+  and permanently failed URLs and continues interrupted .part files with a Range request
+  (If-Range on the validator), starting over if the server sends the full body
+- With refresh, files that already exist are revalidated with If-None-Match /
+  If-Modified-Since and only rewritten when the server has a new version
+
+Usage:
+- As a library:
+      downloader = ImageDownloader(state_path)
+      results = downloader.download_all([(img_url, file_path), ...])
+- As a script (e.g. against a local HTTP stub):
+      python bkds_backend_imgDownload.py <url_list_file> <target_directory> [--refresh] [--rate 1.0] [--concurrent 2]
+"""
+
+import os
+import time
+import argparse
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bkds_Utilities import log_msg, ContentManifest
+
+PROGRAM_NAME = os.path.basename(__file__)
+BATCH_ID = 'BKDS_IMG_DOWNLOAD'
+
+def logMsg(msg, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """Log a message to the console and using a logging system, under the caller's program name and batch id."""
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+##################################
+# Setup and global variables
+
+USER_AGENT = 'bkds-image-cache/1.0 (image cache refresh; python-requests)'
+REQUEST_TIMEOUT = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5  # seconds, doubled per attempt unless the server sends Retry-After
+STATE_SAVE_EVERY = 50
+
+# Host budgets as (max_concurrent, requests per second, burst), matched on the host name
+# suffix; other hosts get the default budget passed to ImageDownloader
+HOST_BUDGETS = {
+    'wikimedia.org': (2, 1.0, 2),
+    'wikipedia.org': (2, 1.0, 2),
+    'staticflickr.com': (4, 4.0, 4),
+    'flickr.com': (2, 2.0, 2),
+    'ytimg.com': (6, 8.0, 8),
+    'youtube.com': (2, 2.0, 2),
+}
+DEFAULT_HOST_BUDGET = (2, 0.5, 1)
+
+# Result statuses
+DONE = 'done'
+NOT_MODIFIED = 'not_modified'
+EXISTS = 'exists'
+FAILED = 'failed'
+GONE = 'gone'
+PERMANENT_STATUS_CODES = {400, 401, 403, 404, 410, 451}
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+##################################
+# Main logic and functions
+
+class TokenBucket:
+    """
+    Request rate limiter: rate tokens per second up to burst. acquire() reserves a token
+    and sleeps until it is due, so concurrent callers are spaced out in arrival order.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def defer(self, seconds):
+        """Hold back every caller of this bucket for at least seconds."""
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+def host_budget(host, default_budget=DEFAULT_HOST_BUDGET):
+    for suffix, budget in HOST_BUDGETS.items():
+        if host == suffix or host.endswith('.' + suffix):
+            return budget
+    return default_budget
+
+def retry_after_seconds(response, attempt):
+    """Seconds to wait before retrying: the Retry-After header if present, else the backoff."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return RETRY_BACKOFF * (2 ** attempt)
+
+class ImageDownloader:
+    """
+    Downloads (url, file_path) jobs with per-host concurrency and rate limits over one
+    keep-alive session, keeping resumable per-URL state in state_path. Messages are
+    logged under program_name and batch_id (the caller's).
+    """
+
+    def __init__(self, state_path, default_budget=DEFAULT_HOST_BUDGET, refresh=False, timeout=REQUEST_TIMEOUT,
+                 program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+        self.default_budget = default_budget
+        self.program_name = program_name
+        self.batch_id = batch_id
+        self.refresh = refresh
+        self.timeout = timeout
+        self.state = ContentManifest(state_path)
+        self.state_lock = threading.Lock()
+        self.results_since_save = 0
+        self.buckets = {}
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.log_lines = []
+
+    def mount_adapter(self, connections):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(1, len(self.buckets)), pool_maxsize=max(1, connections))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def record(self, url, **fields):
+        with self.state_lock:
+            self.state.update(url, **fields)
+            self.results_since_save += 1
+            if self.results_since_save >= STATE_SAVE_EVERY:
+                self.state.save()
+                self.results_since_save = 0
+
+    def request_headers(self, entry, file_path, part_path):
+        """Conditional or ranged request headers; returns (headers, resume_offset)."""
+        validator = entry.get('etag') or entry.get('last_modified')
+        if os.path.exists(file_path):
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers, 0
+        if validator and entry.get('accept_ranges') and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+            if offset:
+                return {'Range': f'bytes={offset}-', 'If-Range': validator}, offset
+        return {}, 0
+
+    def fetch(self, url, file_path, bucket):
+        """Download one URL (with retries) and return its status."""
+        entry = dict(self.state.get(url) or {})
+        if os.path.exists(file_path) and not self.refresh:
+            return EXISTS
+        if entry.get('status') == GONE and not self.refresh:
+            return GONE
+
+        part_path = file_path + PART_SUFFIX
+        for attempt in range(MAX_ATTEMPTS):
+            headers, offset = self.request_headers(entry, file_path, part_path)
+            bucket.acquire()
+            response = None
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 304:
+                        self.record(url, status=NOT_MODIFIED, http_status=304, checked=time.time())
+                        return NOT_MODIFIED
+                    if response.status_code in (200, 206):
+                        fields = {
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'accept_ranges': response.headers.get('Accept-Ranges') == 'bytes',
+                        }
+                        # Record validators first so an interrupted body can be resumed
+                        self.record(url, status='partial', file=file_path, **fields)
+                        entry.update(fields)
+                        append = response.status_code == 206 and offset > 0
+                        with open(part_path, 'ab' if append else 'wb') as f:
+                            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                                f.write(chunk)
+                        os.replace(part_path, file_path)
+                        self.record(url, status=DONE, http_status=response.status_code,
+                                    bytes=os.path.getsize(file_path), checked=time.time())
+                        logMsg(f"Downloaded and saved as {os.path.basename(file_path)}", self.program_name, self.batch_id)
+                        return DONE
+                    if response.status_code == 416 and os.path.exists(part_path):
+                        # The stored range no longer applies; start the file over
+                        os.remove(part_path)
+                        continue
+                    if response.status_code in PERMANENT_STATUS_CODES:
+                        self.record(url, status=GONE, http_status=response.status_code, checked=time.time())
+                        self.log_lines.append(f"{url} resulted in a {response.status_code} error")
+                        return GONE
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        break
+            except requests.RequestException as e:
+                self.log_lines.append(f"{url} resulted in an error: {e}")
+                logMsg(f"Error downloading {url}: {e}", self.program_name, self.batch_id)
+                response = None
+            except OSError as e:
+                self.log_lines.append(f"{url} could not be written: {e}")
+                logMsg(f"Error writing {file_path}: {e}", self.program_name, self.batch_id)
+                break
+            if attempt + 1 < MAX_ATTEMPTS:
+                bucket.defer(retry_after_seconds(response, attempt))
+
+        status_code = response.status_code if response is not None else None
+        if status_code is not None:
+            self.log_lines.append(f"{url} resulted in a {status_code} error")
+        self.record(url, status=FAILED, http_status=status_code, checked=time.time())
+        logMsg(f"Failed to download {url}", self.program_name, self.batch_id)
+        return FAILED
+
+    def host_worker(self, queue, bucket, results):
+        while True:
+            try:
+                url, file_path = queue.popleft()
+            except IndexError:
+                return
+            results[url] = self.fetch(url, file_path, bucket)
+
+    def download_all(self, jobs):
+        """
+        Download (url, file_path) jobs; every host drains its own queue with up to its
+        max_concurrent threads. Returns {url: status}.
+        """
+        start_time = time.time()
+        queues = {}
+        for url, file_path in jobs:
+            queues.setdefault(urlparse(url).netloc.lower(), deque()).append((url, file_path))
+
+        workers = []
+        for host, queue in queues.items():
+            max_concurrent, rate, burst = host_budget(host, self.default_budget)
+            self.buckets[host] = TokenBucket(rate, burst)
+            workers.extend((queue, self.buckets[host]) for _ in range(min(max_concurrent, len(queue))))
+        self.mount_adapter(len(workers))
+
+        results = {}
+        if workers:
+            with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+                futures = [executor.submit(self.host_worker, queue, bucket, results) for queue, bucket in workers]
+                for future in futures:
+                    future.result()
+        with self.state_lock:
+            self.state.save()
+
+        counts = {}
+        for status in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        elapsed = time.time() - start_time
+        logMsg(f"Downloads: {len(jobs)} URLs over {len(queues)} hosts in {elapsed:.1f}s "
+               f"({', '.join(f'{status} {count}' for status, count in sorted(counts.items()))})",
+               self.program_name, self.batch_id)
+        return results
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Download a list of image URLs within per-host budgets.")
+    parser.add_argument("url_list_file", help="File with one URL per line")
+    parser.add_argument("target_directory", help="Directory to save the images in")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate files that already exist")
+    parser.add_argument("--rate", type=float, default=DEFAULT_HOST_BUDGET[1], help="Requests per second for hosts without a budget")
+    parser.add_argument("--concurrent", type=int, default=DEFAULT_HOST_BUDGET[0], help="Concurrent requests for hosts without a budget")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    os.makedirs(args.target_directory, exist_ok=True)
+    with open(args.url_list_file) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    jobs = [(url, os.path.join(args.target_directory, os.path.basename(urlparse(url).path) or 'index')) for url in urls]
+    downloader = ImageDownloader(os.path.join(args.target_directory, '.bkds_downloads.state'),
+                                 (args.concurrent, args.rate, max(1, int(args.rate))), args.refresh)
+    downloader.download_all(jobs)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Image Cache Validation
+
+This module decides which files in the image cache are not usable images (zero bytes,
+error pages saved under an image name, files PIL cannot identify) without reading
+whole files, and remembers the files it has already accepted so a rerun only looks at
+new or changed ones.
+
+Functionality:
+- Check the magic bytes at the start of each file against the JPEG, PNG, GIF, BMP and
+  WEBP signatures
+- Search a bounded header and trailer window (HEADER_WINDOW / TRAILER_WINDOW bytes) for
+  'not found' instead of the lowercased whole file
+- PNG and GIF files must end with their trailer (IEND chunk / ';'), ignoring trailing
+  NUL padding; JPEGs are not held to an EOI marker since some carry large appended data
+- Open the image header with PIL (the pixel data is not decoded)
+- Cache accepted files in a ContentManifest (.bkds_image_validation.manifest) keyed by
+  relative path with size and mtime; a file is rechecked only when either changes
+- Check the remaining files in a thread pool
+
+Usage:
+- As a library: ImageValidator(target_directory).validate(rel_paths) from
+  bkds_backend_imgCacheGenGet.archive_invalid_images
+- As a script: python bkds_backend_imgValidate.py <target_directory> [--workers 8] [--no_cache]
+  lists the invalid images without moving them
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
+from bkds_Utilities import log_msg, ContentManifest
+
+PROGRAM_NAME = os.path.basename(__file__)
+BATCH_ID = 'BKDS_IMG_VALIDATE'
+
+def logMsg(msg, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """Log a message to the console and using a logging system, under the caller's program name and batch id."""
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+##################################
+# Setup and global variables
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+skip_dirs = {'archive'}
+
+VALIDATION_INDEX_FILE = '.bkds_image_validation.manifest'  # not an image extension, so scans skip it
+HEADER_WINDOW = 64 * 1024
+TRAILER_WINDOW = 64 * 1024
+VALIDATE_WORKERS = 8
+NOT_FOUND_MARKER = b'not found'
+
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+]
+# Bytes each format must end with (trailing NUL padding ignored)
+IMAGE_TRAILERS = {
+    'png': b'IEND\xaeB`\x82',
+    'gif': b';',
+}
+
+##################################
+# Main logic and functions
+
+def image_kind(header):
+    """Format named by the file's magic bytes, or None."""
+    for signature, kind in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def check_image(path, size=None):
+    """Return the reason path is not a valid image, or None if it is."""
+    size = os.path.getsize(path) if size is None else size
+    if size == 0:
+        return "zero-byte file"
+
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_WINDOW)
+        if size > HEADER_WINDOW:
+            f.seek(max(HEADER_WINDOW, size - TRAILER_WINDOW))
+            trailer = f.read(TRAILER_WINDOW)
+        else:
+            trailer = header
+
+    kind = image_kind(header)
+    if kind is None:
+        return "unknown signature"
+    if NOT_FOUND_MARKER in header.lower() or NOT_FOUND_MARKER in trailer.lower():
+        return "contains 'not found'"
+    end_marker = IMAGE_TRAILERS.get(kind)
+    if end_marker and not trailer.rstrip(b'\x00').endswith(end_marker):
+        return f"truncated {kind} (no end marker)"
+
+    try:
+        with Image.open(path) as img:
+            img.size  # header parse only
+    except (UnidentifiedImageError, OSError) as e:
+        return f"cannot open: {e}"
+    return None
+
+class ImageValidator:
+    """
+    Validates image files under directory, skipping files accepted before with the same
+    size and mtime. Messages are logged under program_name and batch_id (the caller's).
+    """
+
+    def __init__(self, directory, workers=VALIDATE_WORKERS, use_cache=True, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+        self.directory = directory
+        self.program_name = program_name
+        self.batch_id = batch_id
+        self.workers = workers
+        self.use_cache = use_cache
+        self.manifest = ContentManifest(os.path.join(directory, VALIDATION_INDEX_FILE))
+        self.checked = 0
+        self.cached = 0
+
+    def validate_one(self, rel_path):
+        path = os.path.join(self.directory, rel_path)
+        try:
+            stat = os.stat(path)
+            return rel_path, stat.st_size, stat.st_mtime, check_image(path, stat.st_size)
+        except OSError as e:
+            return rel_path, None, None, f"error reading file: {e}"
+
+    def validate(self, rel_paths):
+        """Return {rel_path: reason} for the invalid files among rel_paths."""
+        start_time = time.time()
+        pending = []
+        for rel_path in rel_paths:
+            entry = self.manifest.get(rel_path) if self.use_cache else None
+            if entry:
+                try:
+                    stat = os.stat(os.path.join(self.directory, rel_path))
+                except OSError:
+                    stat = None
+                if stat and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                    self.cached += 1
+                    continue
+            pending.append(rel_path)
+
+        invalid = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for rel_path, size, mtime, reason in executor.map(self.validate_one, pending):
+                self.checked += 1
+                if reason:
+                    invalid[rel_path] = reason
+                    self.manifest.remove(rel_path)
+                else:
+                    self.manifest.update(rel_path, size=size, mtime=mtime)
+
+        # Forget files that are gone
+        current = set(rel_paths)
+        for rel_path in [key for key in self.manifest.entries if key not in current]:
+            self.manifest.remove(rel_path)
+        self.manifest.save()
+
+        logMsg(f"Validation: {len(rel_paths)} images, {self.cached} unchanged since last run, "
+               f"{self.checked} checked, {len(invalid)} invalid ({time.time() - start_time:.1f}s)",
+               self.program_name, self.batch_id)
+        return invalid
+
+def scan_images(directory):
+    """Relative paths of the image files under directory, archive folders skipped."""
+    rel_paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        for file in files:
+            if file.lower().endswith(image_extensions):
+                rel_paths.append(os.path.relpath(os.path.join(root, file), directory))
+    return rel_paths
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="List the invalid images in an image cache directory.")
+    parser.add_argument("target_directory", help="Image cache directory to validate")
+    parser.add_argument("--workers", type=int, default=VALIDATE_WORKERS, help="Threads used for validation")
+    parser.add_argument("--no_cache", action="store_true", help="Recheck every file, ignoring earlier results")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    validator = ImageValidator(args.target_directory, args.workers, not args.no_cache)
+    for rel_path, reason in sorted(validator.validate(scan_images(args.target_directory)).items()):
+        logMsg(f"{rel_path}: {reason}")
@@ -8,16 +8,27 @@ This script scans a directory to analyze and conditionally resize image files
 to meet defined requirements. Optionally, it outputs a report with detailed file size 
 categories.
 
+Resizing runs in a process pool. Each worker probes dimensions from the image header,
+scales images wider than min_intrinsic down to that width and, with resize_flag Y,
+re-encodes files still over min_size_mb (JPEG quality steps, then smaller scales) until
+they fit. A result replaces the original only if it is smaller: the original is kept
+under images_backup (same relative path) and the new file is swapped in atomically.
+The report adds resized/skipped/failed counts and bytes saved per file type.
+
 Usage:
-    ./image_size_analyzer.py <batch_id> <min_size_mb> <min_intrinsic> <resize_flag>
+    ./image_size_analyzer.py <batch_id> <min_size_mb> <min_intrinsic> <resize_flag> [--processes N]
 """
 
 import os
+import io
+import time
+import shutil
 import argparse
 from collections import defaultdict
+from multiprocessing import Pool, cpu_count
 from PIL import Image, ImageFile
 import warnings
-from bkds_Utilities import log_msg
+from bkds_Utilities import log_msg, atomic_write
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 #####################################################################
@@ -29,6 +40,7 @@ def parse_arguments():
     parser.add_argument("min_size_mb", type=int, help="Minimum file size in MB for resizing")
     parser.add_argument("min_intrinsic", type=int, help="Minimum intrinsic width for resizing")
     parser.add_argument("resize_flag", choices=["Y", "N"], help="Whether to resize for file size reduction (Y/N)")
+    parser.add_argument("--processes", type=int, default=cpu_count(), help="Processes used for resizing")
     return parser.parse_args()
 
 args = parse_arguments()
@@ -36,6 +48,7 @@ BATCH_ID = args.batch_id
 MIN_SIZE_BYTES = args.min_size_mb * 1024 * 1024  # Convert MB to bytes
 MIN_INTRINSIC_WIDTH = args.min_intrinsic
 RESIZE_FOR_SIZE = args.resize_flag == "Y"
+PROCESSES = args.processes
 
 #####################################################################
 # Configuration and Constants
@@ -59,9 +72,21 @@ SIZE_CATEGORIES = [
 # Initialize counters (to be used in the main thread)
 file_counts = defaultdict(lambda: defaultdict(int))
 resize_counts = {"resized": 0, "skipped": 0, "failed": 0}
+bytes_saved = defaultdict(int)
 
 NODEJS_DATA = os.getenv('BKDS_NODEJS_DATA', '/default/path/for/nodejs_data')
 IMG_DATA = os.path.join(NODEJS_DATA, 'images')
+BACKUP_DATA = os.path.join(NODEJS_DATA, 'images_backup')
+
+# Re-encoding: JPEG quality steps tried in order, then the image is scaled by
+# SIZE_SCALE_STEP (at most SIZE_SCALE_ATTEMPTS times) until it fits MIN_SIZE_BYTES
+JPEG_QUALITY_STEPS = [85, 75, 65, 55]
+SIZE_SCALE_STEP = 0.75
+SIZE_SCALE_ATTEMPTS = 3
+RESIZE_CHUNK_FILES = 16
+IMAGE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG'}
+
+warnings.simplefilter('ignore', Image.DecompressionBombWarning)
 PROGRAM_NAME = os.path.basename(__file__)
 
 def logMsg(msg):
@@ -91,19 +116,119 @@ def scan_directory(directory):
                 image_files.append((file_path, file_size))
     return image_files
 
+def probe_dimensions(file_path):
+    """Image size from the file header; the pixel data is not decoded."""
+    with Image.open(file_path) as img:
+        return img.size
+
+def encode_image(img, image_format, quality, exif, icc_profile=None):
+    """Encode img in memory; JPEG uses quality and keeps the source EXIF; both keep the ICC profile."""
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True, exif=exif, icc_profile=icc_profile)
+    else:
+        img.save(buffer, 'PNG', optimize=True, icc_profile=icc_profile)
+    return buffer.getvalue()
+
+def shrink_image(file_path, width, height):
+    """
+    Decode file_path once (JPEGs drafted to the target width), scale it to MIN_INTRINSIC_WIDTH
+    and, with RESIZE_FOR_SIZE, step quality and scale down until it fits MIN_SIZE_BYTES.
+    Returns the encoded bytes, or None if there is nothing to gain. When the size target
+    cannot be met, only the width reduction is kept, so reruns do not keep shrinking
+    images that will never fit.
+    """
+    target_width = min(width, MIN_INTRINSIC_WIDTH)
+    target_height = max(1, round(height * target_width / width))
+    with Image.open(file_path) as img:
+        image_format = img.format
+        exif = img.info.get('exif', b'')
+        icc_profile = img.info.get('icc_profile')
+        img.draft(None, (target_width, target_height))
+        img.load()
+        if image_format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+            img = img.convert('RGB')
+        if img.size != (target_width, target_height):
+            img = img.resize((target_width, target_height), Image.LANCZOS)
+
+    qualities = JPEG_QUALITY_STEPS if image_format == 'JPEG' else [None]
+    width_only = encode_image(img, image_format, qualities[0], exif, icc_profile) if width > target_width else None
+    if not RESIZE_FOR_SIZE or (width_only is not None and len(width_only) <= MIN_SIZE_BYTES):
+        return width_only
+
+    for attempt in range(SIZE_SCALE_ATTEMPTS + 1):
+        for quality in qualities:
+            data = encode_image(img, image_format, quality, exif, icc_profile)
+            if len(data) <= MIN_SIZE_BYTES:
+                return data
+        scaled = (max(1, int(img.width * SIZE_SCALE_STEP)), max(1, int(img.height * SIZE_SCALE_STEP)))
+        img = img.resize(scaled, Image.LANCZOS)
+    return width_only
+
+def backup_path_for(file_path):
+    """Backup location of file_path: the same relative path under BACKUP_DATA."""
+    return os.path.join(BACKUP_DATA, os.path.relpath(file_path, IMG_DATA))
+
+def replace_image(file_path, data):
+    """Keep the original under BACKUP_DATA (first backup wins), then swap data in atomically."""
+    backup_path = backup_path_for(file_path)
+    if not os.path.exists(backup_path):
+        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+        try:
+            os.link(file_path, backup_path)
+        except OSError:
+            shutil.copy2(file_path, backup_path)
+    atomic_write(file_path, data)
+
+def resize_image(file_path, file_size):
+    """
+    Resize one image if it is over MIN_INTRINSIC_WIDTH, or over MIN_SIZE_BYTES with RESIZE_FOR_SIZE.
+    Returns (status, new_size); status is None for images that need no change.
+    """
+    width, height = probe_dimensions(file_path)
+    too_wide = width > MIN_INTRINSIC_WIDTH
+    too_large = RESIZE_FOR_SIZE and file_size > MIN_SIZE_BYTES
+    if not too_wide and not too_large:
+        return None, file_size
+    if file_path.lower().split('.')[-1] not in IMAGE_FORMATS:
+        return "skipped", file_size
+
+    data = shrink_image(file_path, width, height)
+    if data is None or len(data) >= file_size:
+        return "skipped", file_size
+    replace_image(file_path, data)
+    return "resized", len(data)
+
 def process_chunk(chunk_files, reporting_only=False):
-    """Process a chunk of image files or gather report data."""
+    """
+    Process a chunk of image files or gather report data. Returns the size category
+    counts (after any resize), the resize status counts and the bytes saved per type.
+    """
     thread_file_counts = defaultdict(lambda: defaultdict(int))
-    if reporting_only:
-        for file_path, file_size in chunk_files:
-            ext = os.path.splitext(file_path)[1].lower().lstrip('.')
-            size_category = categorize_file_size(file_size)
-            thread_file_counts[ext][size_category] += 1
-    else:
-        # Actual resizing logic goes here for non-reporting mode
-        pass
+    thread_resize_counts = defaultdict(int)
+    thread_bytes_saved = defaultdict(int)
+    for file_path, file_size in chunk_files:
+        ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+        if not reporting_only:
+            try:
+                status, new_size = resize_image(file_path, file_size)
+            except Exception as e:
+                print(f"Failed to resize {file_path}: {e}")
+                status, new_size = "failed", file_size
+            if status:
+                thread_resize_counts[status] += 1
+                thread_bytes_saved[ext] += file_size - new_size
+            file_size = new_size
+        size_category = categorize_file_size(file_size)
+        thread_file_counts[ext][size_category] += 1
 
-    return thread_file_counts
+    # Plain dicts: the result is pickled back from the pool workers
+    return ({ext: dict(counts) for ext, counts in thread_file_counts.items()},
+            dict(thread_resize_counts), dict(thread_bytes_saved))
+
+def split_every(lst, size):
+    """Split lst into consecutive chunks of at most size items."""
+    return [lst[i:i + size] for i in range(0, len(lst), size)]
 
 def split_list(lst, n):
     """Split lst into n approximately equal chunks."""
@@ -124,13 +249,27 @@ def merge_counts(global_counts, thread_counts):
         else:
             global_counts[key] += value
 
+def format_bytes(num_bytes):
+    """Human readable byte count."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return f"{num_bytes:.1f}{unit}" if unit != "B" else f"{num_bytes}B"
+        num_bytes /= 1024
+
 def print_report():
     """Print a summary report of the file counts by type and size category."""
     print("\n\nImage File Size Report:")
     for file_type, sizes in file_counts.items():
         print(f"\n{file_type.upper()} Files:")
-        for size_category, count in sizes.items():
-            print(f"  {size_category}: {count} files")
+        for _, size_category in SIZE_CATEGORIES:
+            if size_category in sizes:
+                print(f"  {size_category}: {sizes[size_category]} files")
+        if file_type in bytes_saved:
+            print(f"  Saved: {format_bytes(bytes_saved[file_type])}")
+
+    if any(resize_counts.values()):
+        print(f"\nResized: {resize_counts['resized']}, skipped: {resize_counts['skipped']}, "
+              f"failed: {resize_counts['failed']}, saved: {format_bytes(sum(bytes_saved.values()))}")
 
 #####################################################################
 # Main Execution
@@ -152,22 +291,21 @@ if __name__ == "__main__":
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = [executor.submit(process_chunk, chunk, reporting_only=True) for chunk in chunks]
             for future in as_completed(futures):
-                thread_file_counts = future.result()
+                thread_file_counts, _, _ = future.result()
                 merge_counts(file_counts, thread_file_counts)
         print_report()
     else:
-        # Non-reporting mode: filter and process images based on size and intrinsic width
-        filtered_files = [
-            (file_path, size) for file_path, size in all_image_files 
-            if size > MIN_SIZE_BYTES or Image.open(file_path).size[0] > MIN_INTRINSIC_WIDTH
-        ]
-        
-        # Split filtered files into chunks
-        chunks = split_list(filtered_files, 10)
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [executor.submit(process_chunk, chunk, reporting_only=False) for chunk in chunks]
-            for future in as_completed(futures):
-                thread_file_counts = future.result()
+        # Non-reporting mode: workers probe each header and resize the images over
+        # the intrinsic width or file size limits
+        start_time = time.time()
+        logMsg(f"Resizing {len(all_image_files)} images with {PROCESSES} processes")
+        chunks = split_every(all_image_files, RESIZE_CHUNK_FILES)
+        with Pool(PROCESSES) as pool:
+            for thread_file_counts, thread_resize_counts, thread_bytes_saved in pool.imap_unordered(process_chunk, chunks):
                 merge_counts(file_counts, thread_file_counts)
+                merge_counts(resize_counts, thread_resize_counts)
+                merge_counts(bytes_saved, thread_bytes_saved)
 
+        logMsg(f"Resized {resize_counts['resized']} images, saved {format_bytes(sum(bytes_saved.values()))} "
+               f"in {time.time() - start_time:.1f}s")
         print_report()
@@ -5,7 +5,7 @@ import os
 import sys
 import zipfile
 from datetime import datetime
-from bkds_Utilities import log_msg, db_load_llm_chat, load_and_resolve_config
+from bkds_Utilities import log_msg, db_load_llm_chat_files, load_and_resolve_config
 
 """
 BKDS LLM Data Loader and Archiver
@@ -20,7 +20,9 @@ Logical Flow:
     1. **Argument Parsing**: Gathers runtime parameters including batch ID, configuration path, and config key.
     2. **Configuration Loading**: Dynamically loads and resolves configurations from a JSON file to define file paths,
        database schema, and other runtime behaviors.
-    3. **Data Loading**: Matches and reads JSON files based on predefined patterns, then inserts the data into a target database.
+    3. **Data Loading**: Matches and reads JSON files and sealed NDJSON segments based on predefined patterns, unions
+       their schemas, adds any new columns, and bulk loads all rows into the target table with COPY in one transaction.
+       bkds_backend_llm_ProcessFlow seals segments while it runs, so partial output can be loaded early.
     4. **Archiving**: Archives successfully processed files into a ZIP format to free up workspace and ensure data integrity.
     5. **Error Handling**: Logs and gracefully handles file, database, or configuration-related errors.
 
@@ -86,6 +88,7 @@ TARGET_SCHEMA_KEY = "target_schema"
 # Default values
 DEFAULT_PREFIX = "bkds_llm"
 DEFAULT_OUT_TYPE = "json"
+SEGMENT_TYPE = "ndjson"
 DEFAULT_TARGET_SCHEMA = "dev"
 DEFAULT_DATE_FORMAT = "%Y%m%d_%H%M%S"
 TARGET_TABLE = "stg_llm_processed_contents"
@@ -112,6 +115,8 @@ OUT_TYPE = config.get(OUT_TYPE_KEY, DEFAULT_OUT_TYPE)
 TIMESTAMP_FORMAT = config.get(TIMESTAMP_FORMAT_KEY, DEFAULT_DATE_FORMAT)
 TARGET_SCHEMA = config.get(TARGET_SCHEMA_KEY, DEFAULT_TARGET_SCHEMA)
 file_pattern = f"{OUT_FILE_PREFIX}_{batch_id}_*.{OUT_TYPE}"
+# Sealed checkpoint segments; in-progress .ndjson.part segments are left to the writer
+segment_pattern = f"{OUT_FILE_PREFIX}_{batch_id}_*.{SEGMENT_TYPE}"
 
 ######################################################################
 # Utility Functions
@@ -125,12 +130,12 @@ def logMsg(msg):
 logMsg(f"{program_name} begins.")
 
 def find_json_files_recursively(base_path, exclude_folder=ARCHIVE_FOLDER):
-    """Find JSON files matching the file pattern, excluding a specified folder."""
+    """Find JSON files and NDJSON segments matching the file patterns, excluding a specified folder."""
     matched_files = []
     for root, dirs, files in os.walk(base_path):
         dirs[:] = [d for d in dirs if d != exclude_folder]  # Exclude specific folder
         for file in files:
-            if glob.fnmatch.fnmatch(file, file_pattern):
+            if glob.fnmatch.fnmatch(file, file_pattern) or glob.fnmatch.fnmatch(file, segment_pattern):
                 matched_files.append(os.path.join(root, file))
     return matched_files
 
@@ -157,23 +162,21 @@ def run_data_loader(config_key):
     json_files = find_json_files_recursively(out_folder)
 
     if not json_files:
-        logMsg(f"No JSON files found matching pattern: {file_pattern}")
+        logMsg(f"No JSON files found matching patterns: {file_pattern}, {segment_pattern}")
         return False
 
-    success = True
-    processed_files = []
-    failed_files = []
-
-    for file_name in json_files:
-        try:
-            logMsg(f"Processing file: {file_name}")
-            db_load_llm_chat(file_name, f"{TARGET_SCHEMA}.{TARGET_OBJECT}")
-            logMsg(f"Successfully loaded data from: {file_name}")
-            processed_files.append(file_name)
-        except Exception as e:
-            logMsg(f"Error processing file {file_name}: {e}")
-            failed_files.append(file_name)
-            success = False
+    # Load every pending file in one pass over a single pooled connection
+    try:
+        logMsg(f"Processing {len(json_files)} files")
+        processed_files, failed_files, row_count = db_load_llm_chat_files(json_files, f"{TARGET_SCHEMA}.{TARGET_OBJECT}")
+        logMsg(f"Successfully loaded {row_count} rows from {len(processed_files)} files")
+    except Exception as e:
+        # Nothing was committed; leave the files in place for the next run
+        logMsg(f"Error loading files: {e}")
+        processed_files, failed_files = [], []
+        success = False
+    else:
+        success = not failed_files
 
     # Archive processed and failed files separately
     if processed_files:
@@ -2,11 +2,20 @@ import os
 import sys
 import json
 import time
+import itertools
+import tempfile
+import shutil
 from datetime import datetime
 from argparse import ArgumentParser
-from bkds_Utilities import log_msg, fetch_data, get_sqlTemplate, getHash, load_and_resolve_config
+from bkds_Utilities import log_msg, stream_data, get_sqlTemplate, getHash, load_and_resolve_config, render_placeholders, render_placeholder_rows, PLACEHOLDER_CHUNK_ROWS
+from multiprocessing import Pool
 import requests
 import random
+import threading
+import hashlib
+import fnmatch
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
 ##################################
 # BKDS LLM Base Prompt and Enrichment Processor
@@ -34,6 +43,39 @@ Usage:
     - `--batch_id_process`: Identifies the process flow configuration in the JSON file.
     - `--batch_id_api`: Identifies the API configuration in the JSON file.
     - `--config_path`: Path to the JSON configuration file containing runtime settings.
+    - `--exec_mode`: Optional `serial`, `concurrent` or `batch`; overrides `exec_mode` from the process configuration.
+    - `--fresh`: Discard the checkpoint of an interrupted run instead of resuming it.
+
+Concurrent mode:
+    Prompts are sent from a bounded thread pool (`max_concurrency`) and paced by a token bucket
+    (`requests_per_min`, `tokens_per_min`) from the API configuration instead of random sleeps.
+    429/5xx responses are retried with jittered exponential backoff. Concurrent mode is opt-in, per flow
+    (`"exec_mode": "concurrent"`) or with `--exec_mode concurrent`. By default (`chain_history` true) each
+    group's turns are replayed in order as the serial loop does, and only separate groups run in parallel;
+    set `"chain_history": false` for flows whose prompts are independent to send every prompt on its own.
+
+Batch mode:
+    Prompts are written to a batch-request JSONL file, submitted through the batch client named by
+    `batch_client` in the API configuration, polled every `batch_poll_secs` and mapped back through
+    summarize_results into the usual output. Batch requests carry no earlier turns, so the flow must set
+    `"chain_history": false`. `batch_api_base` can point the client at a local stand-in server, and
+    `"batch_client": "local"` runs the whole path offline with canned responses. The submitted batch is
+    recorded in `<prefix>_<batch_id>.batch_state` so a restarted run resumes polling instead of submitting
+    again; `batch_timeout_hours` bounds the polling of each run.
+
+Response cache:
+    Responses are cached in SQLite under `$BKDS_UTIL_DATA/cache`, keyed on a hash of messages, model and
+    temperature (`cache_max_entries`, `cache_max_age_days`). `--cache_mode use` (default) serves cached
+    responses, `refresh` always calls the API and overwrites, `off` bypasses the cache.
+
+Checkpointing:
+    Results are appended to NDJSON segments in the output folder as each prompt completes. A segment is
+    written as `<prefix>_<batch_id>_<timestamp>_<seq>.ndjson.part` and renamed to `.ndjson` once it holds
+    `checkpoint_segment_records` records, so bkds_backend_llm_DBload_Hygiene can load finished segments while
+    the flow is still running. Completed (url_id, prompt_id, persona_id) keys are appended to
+    `<prefix>_<batch_id>.checkpoint`; a restarted run skips those prompts and seals any leftover `.part`
+    segments. The checkpoint is removed when a run completes. Set `checkpoint_output` to false to write a
+    single JSON file at the end instead.
 
 Example:
     python bkds_llm_processor.py --batch_id_process BKDS_LLM_PROCESS_SUBJGEN_FLOW --batch_id_api BKDS_LLM_API_CONFIG --config_path /path/to/config.json
@@ -64,12 +106,18 @@ def parse_arguments():
     parser.add_argument("--batch_id_process", required=True, help="Batch ID for process flow")
     parser.add_argument("--batch_id_api", required=True, help="Batch ID for API configuration")
     parser.add_argument("--config_path", required=True, help="Path to the JSON configuration file")
+    parser.add_argument("--exec_mode", choices=["serial", "concurrent", "batch"], help="Override the configured exec_mode")
+    parser.add_argument("--cache_mode", choices=["use", "refresh", "off"], default="use",
+                        help="use: serve cached responses; refresh: always call the API and overwrite the cache; off: bypass the cache")
+    parser.add_argument("--fresh", action="store_true", help="Discard the checkpoint of an interrupted run and start over")
     return parser.parse_args()
 
 args = parse_arguments()
 batch_id_process = args.batch_id_process
 batch_id_api = args.batch_id_api
 config_path = args.config_path
+cache_mode = args.cache_mode
+fresh_run = args.fresh
 
 # JSON Key Constants
 TIMESTAMP_FORMAT = "timestamp_format"
@@ -113,6 +161,29 @@ PERSONA_ID="persona_id"
 PROMPT_TEMPLATE_USER='prompt_template_user'
 PROMPT_TEMPLATE_SYSTEM='prompt_template_system'
 SLEEP_DURATION='sleep_duration'
+STREAM_BATCH_SIZE='stream_batch_size'
+EXEC_MODE='exec_mode'
+CHAIN_HISTORY='chain_history'
+REQUESTS_PER_MIN='requests_per_min'
+TOKENS_PER_MIN='tokens_per_min'
+MAX_CONCURRENCY='max_concurrency'
+MAX_RETRIES='max_retries'
+RETRY_BACKOFF='retry_backoff_base'
+COMPLETION_TOKEN_ESTIMATE='completion_token_estimate'
+REQUEST_TIMEOUT='request_timeout'
+CACHE_SUBFOLDER='cache_subfolder'
+CACHE_FILE='cache_file'
+CACHE_MAX_ENTRIES='cache_max_entries'
+CACHE_MAX_AGE_DAYS='cache_max_age_days'
+CHECKPOINT_OUTPUT='checkpoint_output'
+CHECKPOINT_SEGMENT_RECORDS='checkpoint_segment_records'
+RENDER_PROCESSES='render_processes'
+BATCH_CLIENT='batch_client'
+BATCH_API_BASE='batch_api_base'
+BATCH_ENDPOINT='batch_endpoint'
+BATCH_COMPLETION_WINDOW='batch_completion_window'
+BATCH_POLL_SECS='batch_poll_secs'
+BATCH_TIMEOUT_HOURS='batch_timeout_hours'
 
 QUERY_KEY = "query_key"
 OUT_FILE_PREFIX = "out_file_prefix"
@@ -128,6 +199,39 @@ OPENAI_API_KEY = "OPENAI_API_KEY"
 
 DEFAULT_SLEEP_MIN=3
 DEFAULT_SLEEP_MAX=9
+DEFAULT_STREAM_BATCH_SIZE=500
+DEFAULT_EXEC_MODE="serial"
+DEFAULT_CHAIN_HISTORY=True
+DEFAULT_REQUESTS_PER_MIN=60
+DEFAULT_TOKENS_PER_MIN=40000
+DEFAULT_MAX_CONCURRENCY=4
+DEFAULT_MAX_RETRIES=5
+DEFAULT_RETRY_BACKOFF=2
+DEFAULT_COMPLETION_TOKEN_ESTIMATE=500
+DEFAULT_REQUEST_TIMEOUT=120
+CHARS_PER_TOKEN=4
+RETRY_STATUS_CODES={429, 500, 502, 503, 504}
+DEFAULT_CACHE_SUBFOLDER="cache"
+DEFAULT_CACHE_FILE="bkds_llm_response_cache.sqlite"
+DEFAULT_CACHE_MAX_ENTRIES=50000
+DEFAULT_CACHE_MAX_AGE_DAYS=30
+DEFAULT_CHECKPOINT_SEGMENT_RECORDS=500
+CHECKPOINT_TYPE="checkpoint"
+SEGMENT_TYPE="ndjson"
+PART_SUFFIX=".part"
+DEFAULT_RENDER_PROCESSES=0
+DEFAULT_BATCH_CLIENT="openai"
+DEFAULT_BATCH_API_BASE="https://api.openai.com/v1"
+DEFAULT_BATCH_ENDPOINT="/v1/chat/completions"
+DEFAULT_BATCH_COMPLETION_WINDOW="24h"
+DEFAULT_BATCH_POLL_SECS=60
+DEFAULT_BATCH_TIMEOUT_HOURS=26
+BATCH_INPUT_TYPE="batch_input.jsonl"
+BATCH_STATE_TYPE="batch_state"
+BATCH_DONE_STATUSES={"completed", "failed", "expired", "cancelled"}
+LOCAL_BATCH_POLLS='local_batch_polls'
+DEFAULT_LOCAL_BATCH_POLLS=1
+LOCAL_BATCH_SUBFOLDER="local_batches"
 
 DEFAULT_LLM_URL = "https://api.openai.com/v1/chat/completions"
 DEFAULT_LLM_TYPE = "application/json"
@@ -141,8 +245,6 @@ LLM_ERROR = "Failed to get llm_responses"
 
 time_unit='second'
 
-PLACEHOLDER_TEMPLATE= "@@_{key}_@@"
-
 OS_UTIL_ENV='BKDS_UTIL_DATA'
 OS_DEFAULT_ENV='.'
 
@@ -171,6 +273,7 @@ out_file_prefix = config_process.get(OUT_FILE_PREFIX, DEFAULT_OUT_FILE_PREFIX)
 out_type = config_process.get(OUT_TYPE, DEFAULT_OUT_TYPE)
 output_subfolder = config_process.get(OUTPUT_SUBFOLDER, DEFAULT_OUTPUT_SUBFOLDER)
 process_subfolder = config_process.get(PROCESS_SUBFOLDER, DEFAULT_PROCESS_SUBFOLDER)
+exec_mode = args.exec_mode or config_process.get(EXEC_MODE, DEFAULT_EXEC_MODE)
 
 # Prepare output folder
 out_path = os.environ.get(OS_UTIL_ENV, OS_DEFAULT_ENV )
@@ -198,15 +301,167 @@ def get_active_model(config_process, config_api):
     return default_model  # Return the default model
 
 
-def handle_chat(messages, api_key, config_api, active_model):
+class RateLimiter:
+    """
+    Token bucket shared by all request threads, limiting both requests/min and
+    tokens/min as configured in config_api.
+    """
+    def __init__(self, requests_per_min, tokens_per_min):
+        self.requests_per_min = float(requests_per_min)
+        self.tokens_per_min = float(tokens_per_min)
+        self.request_level = self.requests_per_min
+        self.token_level = self.tokens_per_min
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed_min = (now - self.updated) / 60
+        self.request_level = min(self.requests_per_min, self.request_level + elapsed_min * self.requests_per_min)
+        self.token_level = min(self.tokens_per_min, self.token_level + elapsed_min * self.tokens_per_min)
+        self.updated = now
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens are available, then take them."""
+        tokens = min(tokens, self.tokens_per_min)
+        while True:
+            with self.lock:
+                self.refill()
+                if self.request_level >= 1 and self.token_level >= tokens:
+                    self.request_level -= 1
+                    self.token_level -= tokens
+                    return
+                wait_min = max((1 - self.request_level) / self.requests_per_min,
+                               (tokens - self.token_level) / self.tokens_per_min)
+            time.sleep(max(wait_min * 60, 0.05))
+
+    def adjust(self, tokens):
+        """Correct the bucket once the real token usage of a request is known."""
+        with self.lock:
+            self.token_level -= tokens
+
+
+class ResponseCache:
+    """
+    Content-addressed SQLite cache of LLM responses.
+
+    Entries are keyed on a SHA-256 of the messages, model and temperature and are
+    evicted by age (max_age_days) and then by least recent use (max_entries).
+    """
+    def __init__(self, db_path, max_entries, max_age_days):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_secs = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+            "cache_key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_response_cache (last_used)")
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(messages, model, temperature):
+        payload = json.dumps({MESSAGES: messages, MODEL: model, TEMP: temperature}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created FROM llm_response_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.max_age_secs:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE llm_response_cache SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, cache_key, model, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (cache_key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, model, json.dumps(response), now, now)
+            )
+            self.conn.commit()
+            self.stats["stores"] += 1
+
+    def evict(self):
+        with self.lock:
+            expired = self.conn.execute(
+                "DELETE FROM llm_response_cache WHERE created < ?", (time.time() - self.max_age_secs,)
+            ).rowcount
+            overflow = self.conn.execute(
+                "DELETE FROM llm_response_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self.conn.commit()
+        if expired or overflow:
+            logMsg(f"Response cache evicted {expired} expired and {overflow} least recently used entries")
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.conn.close()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = 100 * self.stats["hits"] / lookups if lookups else 0
+        logMsg(f"Response cache stats: {self.stats['hits']} hits, {self.stats['misses']} misses "
+               f"({hit_rate:.1f}% hit rate), {self.stats['stores']} stores")
+
+
+def open_response_cache(config_process):
+    """Open the response cache under BKDS_UTIL_DATA unless --cache_mode off."""
+    if cache_mode == "off":
+        return None
+    cache_path = os.path.join(out_path, config_process.get(CACHE_SUBFOLDER, DEFAULT_CACHE_SUBFOLDER),
+                              config_process.get(CACHE_FILE, DEFAULT_CACHE_FILE))
+    logMsg(f"Using response cache {cache_path} in mode {cache_mode}")
+    return ResponseCache(cache_path,
+                         config_process.get(CACHE_MAX_ENTRIES, DEFAULT_CACHE_MAX_ENTRIES),
+                         config_process.get(CACHE_MAX_AGE_DAYS, DEFAULT_CACHE_MAX_AGE_DAYS))
+
+response_cache = None
+
+
+http_sessions = threading.local()
+
+def get_http_session():
+    """Return this thread's keep-alive HTTP session."""
+    if not hasattr(http_sessions, 'session'):
+        http_sessions.session = requests.Session()
+    return http_sessions.session
+
+def get_rate_limiter(config_api):
+    return RateLimiter(config_api.get(REQUESTS_PER_MIN, DEFAULT_REQUESTS_PER_MIN),
+                       config_api.get(TOKENS_PER_MIN, DEFAULT_TOKENS_PER_MIN))
+
+def estimate_tokens(messages, config_api):
+    """Rough prompt + completion token estimate used to debit the rate limiter."""
+    prompt_chars = sum(len(str(message.get(CONTENT, ''))) for message in messages)
+    return prompt_chars // CHARS_PER_TOKEN + config_api.get(COMPLETION_TOKEN_ESTIMATE, DEFAULT_COMPLETION_TOKEN_ESTIMATE)
+
+
+def handle_chat(messages, api_key, config_api, active_model, rate_limiter=None):
     """
     Send chat data to OpenAI API and handle responses.
     Now includes dynamically determined `active_model`.
+    Requests go through a persistent session, honour the optional rate limiter and
+    are retried with jittered exponential backoff on 429/5xx and connection errors.
     """
-    timestamp_format = config_api.get(TIMESTAMP_FORMAT, DEFAULT_TIMESTAMP_FORMAT)
     llm_temp = config_api.get(LLM_TEMP, LLM_DEFAULT_TEMP)
     llm_endpoint = config_api.get(LLM_ENDPOINT, DEFAULT_LLM_URL)
     llm_content_type = config_api.get(LLM_CONTENT_TYPE, DEFAULT_LLM_TYPE)
+    max_retries = config_api.get(MAX_RETRIES, DEFAULT_MAX_RETRIES)
+    backoff_base = config_api.get(RETRY_BACKOFF, DEFAULT_RETRY_BACKOFF)
+    request_timeout = config_api.get(REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT)
     headers = {
         HEADER_CONTENT_TYPE: llm_content_type,
         HEADER_AUTHORIZATION: f"Bearer {api_key}"
@@ -218,20 +473,58 @@ def handle_chat(messages, api_key, config_api, active_model):
         MESSAGES: messages,
         TEMP: llm_temp
     }
-
-    try:
-        response = requests.post(llm_endpoint, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logMsg(f"{active_model} error: {str(e)}")
-        return None
-
-
-def llm_handle_prompts(json_data, batch_id, config_process, config_api):
+    token_estimate = estimate_tokens(messages, config_api)
+
+    cache_key = None
+    if response_cache:
+        cache_key = ResponseCache.make_key(messages, active_model, llm_temp)
+        if cache_mode == "use":
+            cached_response = response_cache.get(cache_key)
+            if cached_response is not None:
+                logMsg(f'handle_chat cache hit {cache_key[:12]}')
+                return cached_response
+
+    for attempt in range(max_retries + 1):
+        if rate_limiter:
+            rate_limiter.acquire(token_estimate)
+        retry_after = None
+        try:
+            response = get_http_session().post(llm_endpoint, headers=headers, json=data, timeout=request_timeout)
+            if response.status_code in RETRY_STATUS_CODES:
+                retry_after = response.headers.get('Retry-After')
+                raise requests.exceptions.HTTPError(f"{response.status_code} from {llm_endpoint}", response=response)
+            response.raise_for_status()
+            llm_response = response.json()
+            if rate_limiter:
+                used_tokens = llm_response.get(USAGE, {}).get(TOTAL_TOKENS)
+                if used_tokens is not None:
+                    rate_limiter.adjust(used_tokens - token_estimate)
+            if cache_key and llm_response.get(CHOICES):
+                response_cache.put(cache_key, active_model, llm_response)
+            return llm_response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            status_code = getattr(e.response, 'status_code', None) if isinstance(e, requests.exceptions.HTTPError) else None
+            if (status_code is not None and status_code not in RETRY_STATUS_CODES) or attempt == max_retries:
+                logMsg(f"{active_model} error: {str(e)}")
+                return None
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = backoff_base ** attempt
+            delay += random.uniform(0, delay)
+            logMsg(f"{active_model} retry {attempt + 1}/{max_retries} in {delay:.1f}s after: {str(e)}")
+            time.sleep(delay)
+        except requests.exceptions.RequestException as e:
+            logMsg(f"{active_model} error: {str(e)}")
+            return None
+
+
+def llm_handle_prompts(json_data, batch_id, config_process, config_api, checkpoint=None):
     """
     Process prompts for LLM interactions.
     Dynamically determine the active model based on `model_vary`.
+    Each completed prompt is also appended to `checkpoint` when one is given; the records of a
+    prompt are then dropped once written, keeping only the system record, and the return value is empty.
     """
     api_key = os.getenv(OPENAI_API_KEY)
     logMsg(f'llm_handle_prompts begins for batch_id={batch_id}')
@@ -276,11 +569,13 @@ def llm_handle_prompts(json_data, batch_id, config_process, config_api):
             logMsg(f'MSG APPENDED TO RESULT LOG BY ROLE: {msg_role}')
         elif msg_role == USER:
             logMsg(f'LLM_ROLE == {msg_role}')
+            prompt_start = len(results)
             messages.append({ROLE: USER, CONTENT: msg_content})
             logMsg(f'MSG APPENDED BY ROLE: {msg_role}')
             timestamp = datetime.now().strftime(timestamp_format)
             results.append({ROLE: msg_role, CONTENT: msg_content, MSG_META: msg_meta, LLM_DATE: timestamp})
             logMsg(f'MSG APPENDED TO RESULT LOG BY ROLE: {msg_role}')
+            cache_hits = response_cache.stats["hits"] if response_cache else 0
             llm_responses = handle_chat(messages, api_key, config_api, active_model)
             logMsg(f'LLM RESPONSE HANDLING BEGINS: {msg_role} @ {datetime.now().strftime(timestamp_format)}')
 
@@ -298,9 +593,15 @@ def llm_handle_prompts(json_data, batch_id, config_process, config_api):
                     LLM_DATE: timestamp
                 })
                 logMsg(f'LLM RESPONSE APPENDED BY ROLE: {ASSISTANT} @ {timestamp}')
+                if checkpoint:
+                    checkpoint.write_prompt(results[0], results[prompt_start:], msg_meta)
             else:
                 messages.append({ERROR: LLM_ERROR})
-            
+            if checkpoint:
+                del results[prompt_start:]  # written to the checkpoint (or retried on the next run)
+
+            if response_cache and response_cache.stats["hits"] > cache_hits:
+                continue  # served from cache, no API call to pace
             sleep_time = random.randint(sleep_duration_min, sleep_duration_max)
             logMsg(f"Pausing for {sleep_time} {time_unit}s...")
             time.sleep(sleep_time)
@@ -309,6 +610,358 @@ def llm_handle_prompts(json_data, batch_id, config_process, config_api):
     return summarize_results(results, config_process)
 
 
+def group_prompts(json_data, db_ref_keys):
+    """Split the prompt list into (system message, [user messages]) conversation groups."""
+    groups = []
+    for message in json_data:
+        msg_meta = {key: message.get(key, '') for key in db_ref_keys}
+        entry = {ROLE: message.get(ROLE), CONTENT: message.get(CONTENT), MSG_META: msg_meta}
+        if entry[ROLE] == SYSTEM:
+            groups.append((entry, []))
+        elif entry[ROLE] == USER:
+            if not groups:
+                groups.append((None, []))
+            groups[-1][1].append(entry)
+    return groups
+
+
+def run_conversation(system_entry, user_entries, chain_history, api_key, config_api, active_model, rate_limiter, timestamp_format, checkpoint=None):
+    """
+    Send the user prompts of one group and return their result records in order.
+    With chain_history each prompt also carries the earlier turns of the group,
+    as the serial loop does; otherwise each prompt is sent with the system message only.
+    `system_entry` is the group's system result record; completed prompts are appended to `checkpoint`.
+    """
+    results = []
+    history = [{ROLE: SYSTEM, CONTENT: system_entry[CONTENT]}] if system_entry else []
+
+    for entry in user_entries:
+        user_message = {ROLE: USER, CONTENT: entry[CONTENT]}
+        messages = history + [user_message]
+        results.append({ROLE: USER, CONTENT: entry[CONTENT], MSG_META: entry[MSG_META], LLM_DATE: datetime.now().strftime(timestamp_format)})
+
+        llm_responses = handle_chat(messages, api_key, config_api, active_model, rate_limiter)
+        if llm_responses and CHOICES in llm_responses and llm_responses[CHOICES]:
+            assistant_content = llm_responses[CHOICES][0][MESSAGE][CONTENT]
+            results.append({
+                ROLE: ASSISTANT,
+                CONTENT: llm_responses,  # Store full API response here
+                MSG_META: entry[MSG_META],
+                LLM_DATE: datetime.now().strftime(timestamp_format)
+            })
+            if checkpoint:
+                checkpoint.write_prompt(system_entry, results[-2:], entry[MSG_META])
+            if chain_history:
+                history = messages + [{ROLE: ASSISTANT, CONTENT: assistant_content}]
+        else:
+            logMsg(f"{LLM_ERROR} for {entry[MSG_META]}")
+    return results
+
+
+def llm_handle_prompts_concurrent(json_data, batch_id, config_process, config_api, checkpoint=None):
+    """
+    Concurrent counterpart to llm_handle_prompts.
+
+    Requests run on a bounded thread pool and are paced by a shared token bucket
+    (requests_per_min / tokens_per_min in config_api) rather than fixed sleeps.
+    Results keep the per-system-prompt grouping of the serial loop: each group's
+    system record is followed by its user/assistant records in prompt order.
+    Each completed prompt is also appended to `checkpoint` when one is given.
+    """
+    api_key = os.getenv(OPENAI_API_KEY)
+    logMsg(f'llm_handle_prompts_concurrent begins for batch_id={batch_id}')
+
+    if not api_key:
+        raise EnvironmentError(f"{OPENAI_API_KEY} environment variable is not set.")
+
+    if isinstance(json_data, str):
+        try:
+            json_data = json.loads(json_data)
+        except json.JSONDecodeError:
+            logMsg("Error decoding JSON data")
+            return []
+
+    timestamp_format = config_process.get(TIMESTAMP_FORMAT, DEFAULT_TIMESTAMP_FORMAT)
+    db_ref_keys = config_process.get(DB_REF_KEYS, [URL_ID, PROMPT_ID, PERSONA_ID, PAGE_URL])
+    chain_history = config_process.get(CHAIN_HISTORY, DEFAULT_CHAIN_HISTORY)
+    max_concurrency = config_api.get(MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)
+    active_model = get_active_model(config_process, config_api)
+    rate_limiter = get_rate_limiter(config_api)
+
+    groups = group_prompts(json_data, db_ref_keys)
+    prompt_count = sum(len(user_entries) for _, user_entries in groups)
+    logMsg(f"Sending {prompt_count} prompts in {len(groups)} groups with max_concurrency={max_concurrency}, chain_history={chain_history}")
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        group_futures = []
+        for system_entry, user_entries in groups:
+            if system_entry:
+                system_entry = {**system_entry, LLM_DATE: datetime.now().strftime(timestamp_format)}
+            if chain_history:
+                # Turns depend on each other; the whole group is one task
+                tasks = [executor.submit(run_conversation, system_entry, user_entries, True, api_key,
+                                         config_api, active_model, rate_limiter, timestamp_format, checkpoint)]
+            else:
+                tasks = [executor.submit(run_conversation, system_entry, [entry], False, api_key,
+                                         config_api, active_model, rate_limiter, timestamp_format, checkpoint)
+                         for entry in user_entries]
+            group_futures.append((system_entry, tasks))
+
+        results = []
+        for system_entry, tasks in group_futures:
+            if system_entry:
+                results.append(system_entry)
+            for task in tasks:
+                results.extend(task.result())
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    logMsg(f"Completed {prompt_count} prompts in {elapsed:.1f}s ({prompt_count * 60 / elapsed:.1f} prompts/min)")
+    logMsg(f'Returning summarized results')
+    return summarize_results(results, config_process)
+
+
+class OpenAIBatchClient:
+    """
+    Batch client for the OpenAI Batch API (/files and /batches).
+
+    Any class with the same submit/status/results methods can be registered in
+    BATCH_CLIENTS and selected with `batch_client` in the API configuration.
+    """
+    def __init__(self, api_key, config_api):
+        self.api_base = config_api.get(BATCH_API_BASE, DEFAULT_BATCH_API_BASE).rstrip('/')
+        self.endpoint = config_api.get(BATCH_ENDPOINT, DEFAULT_BATCH_ENDPOINT)
+        self.completion_window = config_api.get(BATCH_COMPLETION_WINDOW, DEFAULT_BATCH_COMPLETION_WINDOW)
+        self.timeout = config_api.get(REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT)
+        self.headers = {HEADER_AUTHORIZATION: f"Bearer {api_key}"}
+
+    def submit(self, input_path):
+        """Upload the request file, create the batch and return its provider batch id."""
+        session = get_http_session()
+        with open(input_path, 'rb') as input_file:
+            response = session.post(f"{self.api_base}/files", headers=self.headers, data={"purpose": "batch"},
+                                    files={"file": (os.path.basename(input_path), input_file)}, timeout=self.timeout)
+        response.raise_for_status()
+        input_file_id = response.json()[ID]
+
+        response = session.post(f"{self.api_base}/batches", headers=self.headers, timeout=self.timeout,
+                                json={"input_file_id": input_file_id, "endpoint": self.endpoint,
+                                      "completion_window": self.completion_window})
+        response.raise_for_status()
+        return response.json()[ID]
+
+    def status(self, provider_batch_id):
+        """Return the provider's batch object (status, request_counts, output_file_id, error_file_id)."""
+        response = get_http_session().get(f"{self.api_base}/batches/{provider_batch_id}", headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def results(self, batch_info):
+        """Yield the result lines ({custom_id, response, error}) of a finished batch."""
+        for file_key in ("output_file_id", "error_file_id"):
+            file_id = batch_info.get(file_key)
+            if not file_id:
+                continue
+            response = get_http_session().get(f"{self.api_base}/files/{file_id}/content", headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            for line in response.text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+class LocalBatchClient:
+    """
+    Offline stand-in for OpenAIBatchClient, selected with `"batch_client": "local"`.
+
+    Submitted request files are kept under `<out_folder>/local_batches` (so a restarted
+    run can resume polling them), report `in_progress` for `local_batch_polls` status
+    calls and then complete with a canned chat completion per request that echoes its
+    prompt. Nothing is sent over the network, so submit, polling, resume and result
+    mapping can be run end to end for testing.
+    """
+    def __init__(self, api_key, config_api):
+        self.endpoint = config_api.get(BATCH_ENDPOINT, DEFAULT_BATCH_ENDPOINT)
+        self.pending_polls = config_api.get(LOCAL_BATCH_POLLS, DEFAULT_LOCAL_BATCH_POLLS)
+        self.folder = os.path.join(out_folder, LOCAL_BATCH_SUBFOLDER)
+        self.polls = {}
+
+    def batch_path(self, provider_batch_id):
+        return os.path.join(self.folder, f"{provider_batch_id}.jsonl")
+
+    def submit(self, input_path):
+        os.makedirs(self.folder, exist_ok=True)
+        provider_batch_id = f"local_batch_{getHash(input_path + str(time.time()))[:12]}"
+        shutil.copyfile(input_path, self.batch_path(provider_batch_id))
+        return provider_batch_id
+
+    def status(self, provider_batch_id):
+        if not os.path.exists(self.batch_path(provider_batch_id)):
+            return {ID: provider_batch_id, "status": "expired"}
+        self.polls[provider_batch_id] = self.polls.get(provider_batch_id, 0) + 1
+        if self.polls[provider_batch_id] <= self.pending_polls:
+            return {ID: provider_batch_id, "status": "in_progress"}
+        return {ID: provider_batch_id, "status": "completed", "output_file_id": provider_batch_id}
+
+    def results(self, batch_info):
+        file_id = batch_info.get("output_file_id")
+        if not file_id:
+            return
+        with open(self.batch_path(file_id), 'r') as batch_file:
+            for line in batch_file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                body = request["body"]
+                prompt = body[MESSAGES][-1][CONTENT]
+                prompt_tokens = sum(len(message[CONTENT].split()) for message in body[MESSAGES])
+                completion = f"[local batch] {prompt}"
+                yield {"custom_id": request["custom_id"], ERROR: None, "response": {"status_code": 200, "body": {
+                    ID: f"{file_id}-{request['custom_id']}", OBJECT: "chat.completion", CREATED: int(time.time()),
+                    MODEL: body[MODEL],
+                    CHOICES: [{"index": 0, MESSAGE: {ROLE: ASSISTANT, CONTENT: completion}, FINISH_REASON: "stop"}],
+                    USAGE: {PROMPT_TOKENS: prompt_tokens, COMPLETION_TOKENS: len(completion.split()),
+                            TOTAL_TOKENS: prompt_tokens + len(completion.split())}}}}
+
+BATCH_CLIENTS = {
+    "openai": OpenAIBatchClient,
+    "local": LocalBatchClient,
+}
+
+
+def llm_handle_prompts_batch(json_data, batch_id, config_process, config_api, checkpoint=None):
+    """
+    Batch counterpart to llm_handle_prompts.
+
+    Every user prompt becomes one request (system message + prompt) in a batch-request
+    JSONL file that is submitted through the configured batch client and polled until
+    it finishes. Responses are mapped back to their prompts and summarized into the
+    same records as the other modes; prompts with a cached response are not submitted.
+    """
+    api_key = os.getenv(OPENAI_API_KEY)
+    logMsg(f'llm_handle_prompts_batch begins for batch_id={batch_id}')
+
+    if not api_key:
+        raise EnvironmentError(f"{OPENAI_API_KEY} environment variable is not set.")
+
+    if isinstance(json_data, str):
+        try:
+            json_data = json.loads(json_data)
+        except json.JSONDecodeError:
+            logMsg("Error decoding JSON data")
+            return []
+
+    timestamp_format = config_process.get(TIMESTAMP_FORMAT, DEFAULT_TIMESTAMP_FORMAT)
+    db_ref_keys = config_process.get(DB_REF_KEYS, [URL_ID, PROMPT_ID, PERSONA_ID, PAGE_URL])
+    llm_temp = config_api.get(LLM_TEMP, LLM_DEFAULT_TEMP)
+    poll_secs = config_api.get(BATCH_POLL_SECS, DEFAULT_BATCH_POLL_SECS)
+    timeout_secs = config_api.get(BATCH_TIMEOUT_HOURS, DEFAULT_BATCH_TIMEOUT_HOURS) * 3600
+    if config_process.get(CHAIN_HISTORY, DEFAULT_CHAIN_HISTORY):
+        raise ValueError('Batch mode sends each prompt with its system message only; '
+                         'set "chain_history": false in the process configuration to use it')
+    client_name = config_api.get(BATCH_CLIENT, DEFAULT_BATCH_CLIENT)
+    if client_name not in BATCH_CLIENTS:
+        raise ValueError(f"Unknown batch_client: {client_name}")
+    client = BATCH_CLIENTS[client_name](api_key, config_api)
+
+    results = []
+    state_path = os.path.join(out_folder, f"{out_file_prefix}_{batch_id}.{BATCH_STATE_TYPE}")
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as state_file:
+            state = json.load(state_file)
+        logMsg(f"Resuming batch {state['provider_batch_id']} from {state_path}")
+    else:
+        active_model = get_active_model(config_process, config_api)
+        timestamp = datetime.now().strftime(timestamp_format)
+        state = {"model": active_model, "systems": [], "requests": {}}
+        cached_results = []
+        input_path = os.path.join(out_folder, f"{out_file_prefix}_{batch_id}_{timestamp}.{BATCH_INPUT_TYPE}")
+        with open(input_path, 'w') as input_file:
+            for group_index, (system_entry, user_entries) in enumerate(group_prompts(json_data, db_ref_keys)):
+                system_record = {**system_entry, LLM_DATE: timestamp} if system_entry else None
+                state["systems"].append(system_record)
+                history = [{ROLE: SYSTEM, CONTENT: system_entry[CONTENT]}] if system_entry else []
+                for entry in user_entries:
+                    messages = history + [{ROLE: USER, CONTENT: entry[CONTENT]}]
+                    if response_cache and cache_mode == "use":
+                        cached_response = response_cache.get(ResponseCache.make_key(messages, active_model, llm_temp))
+                        if cached_response is not None:
+                            cached_results.append((group_index, entry, cached_response))
+                            continue
+                    custom_id = f"req-{len(state['requests'])}"
+                    state["requests"][custom_id] = [group_index, entry]
+                    input_file.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": client.endpoint,
+                                                 "body": {MODEL: active_model, MESSAGES: messages, TEMP: llm_temp}}) + '\n')
+
+        map_batch_results(cached_results, state, results, timestamp_format, checkpoint)
+        if not state["requests"]:
+            os.remove(input_path)
+            logMsg(f"All {len(cached_results)} prompts served from the response cache")
+            return summarize_results(results, config_process)
+
+        state["provider_batch_id"] = client.submit(input_path)
+        state["submitted"] = time.time()
+        with open(state_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.remove(input_path)
+        logMsg(f"Submitted batch {state['provider_batch_id']} with {len(state['requests'])} requests "
+               f"({len(cached_results)} served from cache)")
+
+    # Poll until the provider finishes the batch; the timeout applies to this run's polling
+    poll_deadline = time.time() + timeout_secs
+    while True:
+        batch_info = client.status(state["provider_batch_id"])
+        status = batch_info.get("status")
+        logMsg(f"Batch {state['provider_batch_id']} status: {status} {batch_info.get('request_counts', '')}")
+        if status in BATCH_DONE_STATUSES:
+            break
+        if time.time() > poll_deadline:
+            raise TimeoutError(f"Batch {state['provider_batch_id']} not finished after {timeout_secs / 3600:.0f}h; rerun to keep polling")
+        time.sleep(poll_secs)
+
+    batch_results = []
+    failed = 0
+    for line in client.results(batch_info):
+        request = state["requests"].get(line.get("custom_id"))
+        response = line.get("response") or {}
+        body = response.get("body")
+        if request is None:
+            continue
+        if response.get("status_code") != 200 or not body or not body.get(CHOICES):
+            failed += 1
+            logMsg(f"{LLM_ERROR} for {request[1][MSG_META]}: {line.get(ERROR) or body}")
+            continue
+        group_index, entry = request
+        if response_cache:
+            messages = ([{ROLE: SYSTEM, CONTENT: state["systems"][group_index][CONTENT]}] if state["systems"][group_index] else []) + \
+                       [{ROLE: USER, CONTENT: entry[CONTENT]}]
+            response_cache.put(ResponseCache.make_key(messages, state["model"], llm_temp), state["model"], body)
+        batch_results.append((group_index, entry, body))
+
+    map_batch_results(batch_results, state, results, timestamp_format, checkpoint)
+    os.remove(state_path)
+    logMsg(f"Batch {state['provider_batch_id']} finished with status {status}: "
+           f"{len(batch_results)} responses, {failed} failed, {len(state['requests']) - len(batch_results) - failed} missing")
+    logMsg(f'Returning summarized results')
+    return summarize_results(results, config_process)
+
+
+def map_batch_results(batch_results, state, results, timestamp_format, checkpoint=None):
+    """Append (group_index, entry, response) tuples to results as user/assistant records, system record first."""
+    written_systems = {id(record) for record in results}
+    for group_index, entry, llm_response in sorted(batch_results, key=lambda item: item[0]):
+        system_record = state["systems"][group_index]
+        if system_record and id(system_record) not in written_systems:
+            written_systems.add(id(system_record))
+            results.append(system_record)
+        timestamp = datetime.now().strftime(timestamp_format)
+        prompt_records = [
+            {ROLE: USER, CONTENT: entry[CONTENT], MSG_META: entry[MSG_META], LLM_DATE: timestamp},
+            {ROLE: ASSISTANT, CONTENT: llm_response, MSG_META: entry[MSG_META], LLM_DATE: timestamp},
+        ]
+        results.extend(prompt_records)
+        if checkpoint:
+            checkpoint.write_prompt(system_record, prompt_records, entry[MSG_META])
+
+
 def summarize_results(json_data, config_process):
     """Summarize and structure results for output."""
     logMsg(f'summarize_results @ {datetime.now().strftime(config_process.get(TIMESTAMP_FORMAT, DEFAULT_TIMESTAMP_FORMAT))}')
@@ -346,36 +999,49 @@ def summarize_results(json_data, config_process):
     return results
 
 def replace_placeholders(template, row_data):
-    """Recursively replace placeholders in the template and in row_data values."""
-    def replace_in_string(s, data):
-        for k, v in data.items():
-            placeholder = PLACEHOLDER_TEMPLATE.format(key=k)  # Use the constant template
-            s = s.replace(placeholder, str(v))
-        return s
-
-    def recursive_replace(data):
-        if isinstance(data, dict):
-            return {k: recursive_replace(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [recursive_replace(item) for item in data]
-        elif isinstance(data, str):
-            return replace_in_string(data, row_data)
-        else:
-            return data
+    """Replace @@_key_@@ placeholders in the template (and in row_data values) using the precompiled renderer."""
+    return render_placeholders(template, row_data)
 
-    row_data = recursive_replace(row_data)
-    return replace_in_string(template, row_data)
+def spool_rows(batches):
+    """
+    Copy the streamed query rows to a temporary NDJSON file and yield them back from it.
+    The first row is only yielded once the cursor is exhausted, so the database transaction
+    is closed before any LLM call while the rows are still never all held in memory.
+    """
+    with tempfile.TemporaryFile('w+') as spool:
+        row_count = 0
+        for batch in batches:
+            for row in batch:
+                spool.write(json.dumps(row, default=str) + '\n')
+                row_count += 1
+        logMsg(f"Spooled {row_count} rows")
+        spool.seek(0)
+        for line in spool:
+            yield json.loads(line)
+
+def peek_iter(iterable):
+    """Return an iterator over iterable, or None if it is empty."""
+    items = iter(iterable)
+    first = next(items, None)
+    if first is None:
+        return None
+    return itertools.chain([first], items)
 
 def setup_prompt(raw_prompt, config):
     """
-    Process the raw_prompt and return them as a JSON string,
-    with each message in `llm_messages` wrapped in metadata.
+    Process the raw_prompt and yield its messages: the system message, then each
+    user prompt wrapped in metadata.
+    `raw_prompt` may be a list or any iterable of rows (e.g. a stream_data generator);
+    rows are pulled and rendered one chunk at a time, so only the chunk in progress is held.
+    Set `render_processes` > 1 to render the chunks in a process pool.
     """
-    prompt_data = []
     sleep_duration = config.get(SLEEP_DURATION, DEFAULT_SLEEP_MIN)
+    render_processes = config.get(RENDER_PROCESSES, DEFAULT_RENDER_PROCESSES)
 
-    if raw_prompt:
-        first_row = raw_prompt[0]
+    rows = iter(raw_prompt or [])
+    first_row = next(rows, None)
+
+    if first_row is not None:
         llm_global_prompt = replace_placeholders(
             first_row.get(PROMPT_TEMPLATE_SYSTEM, ''),
             first_row
@@ -384,25 +1050,148 @@ def setup_prompt(raw_prompt, config):
         time.sleep(sleep_duration)
         global_message = {ROLE: SYSTEM, CONTENT: llm_global_prompt}
         logMsg(f'CURRENT_ROLE: {USER} GLOBAL_MESSAGE: \n\n {global_message} \n')
-        prompt_data.append(global_message)
+        yield global_message
+
+        rows = itertools.chain([first_row], rows)
+        pool = Pool(render_processes) if render_processes > 1 else None
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, PLACEHOLDER_CHUNK_ROWS * max(render_processes, 1)))
+                if not chunk:
+                    break
+                for row, llm_subj_prompt in zip(chunk, render_placeholder_rows(chunk, PROMPT_TEMPLATE_USER, pool)):
+                    metadata = {
+                        URL_ID: row.get(URL_ID, ''),
+                        PROMPT_ID: row.get(PROMPT_ID, ''),
+                        PERSONA_ID: row.get(PERSONA_ID, ''),
+                        PAGE_URL: row.get(PAGE_URL, '')
+                    }
+                    subj_prompt = {**metadata, ROLE: USER, CONTENT: llm_subj_prompt}
+                    logMsg(f'CURRENT_ROLE: {USER}\nsubj_prompt:\n{subj_prompt}\n')
+                    yield subj_prompt
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+class CheckpointWriter:
+    """
+    Append-only NDJSON output with a checkpoint index of completed prompts.
+
+    Records are appended to a `.part` segment that is renamed to `.ndjson` every
+    segment_records records, so only whole segments are visible to the loader.
+    A prompt's (url_id, prompt_id, persona_id) key is appended to the index after
+    its records are flushed; restarted runs skip those keys.
+    """
+    def __init__(self, folder, prefix, batch_id, timestamp, config_process, fresh=False):
+        self.folder = folder
+        self.segment_prefix = f"{prefix}_{batch_id}_{timestamp}"
+        self.orphan_pattern = f"{prefix}_{batch_id}_*.{SEGMENT_TYPE}{PART_SUFFIX}"
+        self.index_path = os.path.join(folder, f"{prefix}_{batch_id}.{CHECKPOINT_TYPE}")
+        self.segment_records = config_process.get(CHECKPOINT_SEGMENT_RECORDS, DEFAULT_CHECKPOINT_SEGMENT_RECORDS)
+        self.config_process = config_process
+        self.lock = threading.Lock()
+        self.system_ids = set()
+        self.segment_file = None
+        self.segment_path = None
+        self.segment_count = 0
+        self.segment_seq = 0
+        self.record_count = 0
+
+        if fresh and os.path.exists(self.index_path):
+            logMsg(f"Discarding checkpoint {self.index_path}")
+            os.remove(self.index_path)
+        self.seal_orphans()
+        self.completed = self.load_index()
+        self.index_file = open(self.index_path, 'a')
+
+    @staticmethod
+    def prompt_key(msg_meta):
+        return '\t'.join(str(msg_meta.get(key, '')) for key in (URL_ID, PROMPT_ID, PERSONA_ID))
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return set()
+        with open(self.index_path, 'r') as index_file:
+            completed = {line.rstrip('\n') for line in index_file if line.endswith('\n')}
+        logMsg(f"Resuming from checkpoint {self.index_path} with {len(completed)} completed prompts")
+        return completed
+
+    def seal_orphans(self):
+        """Publish .part segments left behind by an interrupted run."""
+        for file_name in os.listdir(self.folder):
+            if fnmatch.fnmatch(file_name, self.orphan_pattern):
+                part_path = os.path.join(self.folder, file_name)
+                os.rename(part_path, part_path[:-len(PART_SUFFIX)])
+                logMsg(f"Sealed interrupted segment {part_path[:-len(PART_SUFFIX)]}")
+
+    def pending_prompts(self, json_data):
+        """Yield the prompts not in the checkpoint, dropping system messages left without prompts."""
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        if not self.completed:
+            yield from json_data
+            return
+
+        system_message = None
+        for message in json_data:
+            if message.get(ROLE) == SYSTEM:
+                system_message = message
+            elif self.prompt_key(message) not in self.completed:
+                if system_message is not None:
+                    yield system_message
+                    system_message = None
+                yield message
+
+    def open_segment(self):
+        self.segment_seq += 1
+        self.segment_path = os.path.join(self.folder, f"{self.segment_prefix}_{self.segment_seq:04d}.{SEGMENT_TYPE}{PART_SUFFIX}")
+        self.segment_file = open(self.segment_path, 'w')
+        self.segment_count = 0
+
+    def seal_segment(self):
+        if not self.segment_file:
+            return
+        self.segment_file.flush()
+        os.fsync(self.segment_file.fileno())
+        self.segment_file.close()
+        self.segment_file = None
+        os.rename(self.segment_path, self.segment_path[:-len(PART_SUFFIX)])
+        logMsg(f"Segment written to: {self.segment_path[:-len(PART_SUFFIX)]} ({self.segment_count} records)")
+
+    def write_prompt(self, system_record, prompt_records, msg_meta):
+        """Append one completed prompt (and its group's system record, once) and checkpoint its key."""
+        with self.lock:
+            records = prompt_records
+            if system_record is not None and id(system_record) not in self.system_ids:
+                self.system_ids.add(id(system_record))
+                records = [system_record] + list(prompt_records)
+
+            if not self.segment_file:
+                self.open_segment()
+            for record in summarize_results(records, self.config_process):
+                self.segment_file.write(json.dumps(record) + '\n')
+                self.segment_count += 1
+                self.record_count += 1
+            self.segment_file.flush()
+
+            key = self.prompt_key(msg_meta)
+            self.index_file.write(key + '\n')
+            self.index_file.flush()
+            self.completed.add(key)
+
+            if self.segment_count >= self.segment_records:
+                self.seal_segment()
+
+    def close(self, completed=False):
+        """Seal the open segment; a completed run also drops its checkpoint index."""
+        with self.lock:
+            self.seal_segment()
+            self.index_file.close()
+            if completed:
+                os.remove(self.index_path)
+        logMsg(f"Checkpoint wrote {self.record_count} records; {'run complete' if completed else 'resumable from ' + self.index_path}")
 
-        for row in raw_prompt:
-            llm_subj_prompt = replace_placeholders(
-                row.get(PROMPT_TEMPLATE_USER, ''),
-                row
-            )
-            metadata = {
-                URL_ID: row.get(URL_ID, ''),
-                PROMPT_ID: row.get(PROMPT_ID, ''),
-                PERSONA_ID: row.get(PERSONA_ID, ''),
-                PAGE_URL: row.get(PAGE_URL, '')
-            }
-            subj_prompt = {**metadata, ROLE: USER, CONTENT: llm_subj_prompt}
-            logMsg(f'CURRENT_ROLE: {USER}\nsubj_prompt:\n{subj_prompt}\n')
-            prompt_data.append(subj_prompt)
-
-        return json.dumps(prompt_data, indent=4)
-    return None
 
 def write_output_file(data, folder, prefix, file_type, batch_id, timestamp):
     """Write data to an output file."""
@@ -413,6 +1202,7 @@ def write_output_file(data, folder, prefix, file_type, batch_id, timestamp):
     return file_path
 
 def main():
+    global response_cache
     logMsg("Starting BKDS LLM Process Flow", batch_id_process)
 
     os.makedirs(out_folder, exist_ok=True)
@@ -420,21 +1210,48 @@ def main():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
     # Fetch data and process prompts
+    response_cache = open_response_cache(config_process)
+    checkpoint = None
     try:
         sql_query = get_sqlTemplate(query_key)
-        raw_prompt = fetch_data(sql_query)
+        batch_size = config_process.get(STREAM_BATCH_SIZE, DEFAULT_STREAM_BATCH_SIZE)
+        raw_prompt = spool_rows(stream_data(sql_query, batch_size))
 
-        if not raw_prompt:
+        # Rows are spooled to disk (closing the DB cursor) and prompts stay a generator,
+        # so the serial handler renders and sends them one at a time
+        llm_prompt = peek_iter(setup_prompt(raw_prompt, config_process))
+        if not llm_prompt:
             logMsg("No data fetched for the query.", batch_id_process)
             sys.exit(0)
 
-        llm_prompt = setup_prompt(raw_prompt, config_process)
-        llm_results = llm_handle_prompts(llm_prompt, batch_id_process, config_process, config_api)
+        if config_process.get(CHECKPOINT_OUTPUT, True):
+            checkpoint = CheckpointWriter(out_folder, out_file_prefix, batch_id_process, timestamp, config_process, fresh_run)
+            llm_prompt = peek_iter(checkpoint.pending_prompts(llm_prompt))
+            if not llm_prompt:
+                logMsg("All prompts already completed in the checkpoint.", batch_id_process)
+
+        if not llm_prompt:
+            llm_results = []
+        elif exec_mode == "batch":
+            llm_results = llm_handle_prompts_batch(llm_prompt, batch_id_process, config_process, config_api, checkpoint)
+        elif exec_mode == "concurrent":
+            llm_results = llm_handle_prompts_concurrent(llm_prompt, batch_id_process, config_process, config_api, checkpoint)
+        else:
+            llm_results = llm_handle_prompts(llm_prompt, batch_id_process, config_process, config_api, checkpoint)
 
-        write_output_file(llm_results, out_folder, out_file_prefix, out_type, batch_id_process, timestamp)
+        if checkpoint:
+            checkpoint.close(completed=True)
+            checkpoint = None
+        else:
+            write_output_file(llm_results, out_folder, out_file_prefix, out_type, batch_id_process, timestamp)
     except Exception as e:
         logMsg(f"Error during LLM processing: {e}", batch_id_process)
         sys.exit(1)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        if response_cache:
+            response_cache.close()
 
     logMsg("BKDS LLM Process Flow completed successfully.", batch_id_process)
 
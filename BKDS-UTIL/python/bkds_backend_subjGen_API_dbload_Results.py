@@ -3,8 +3,9 @@ Script Name: [Script Name]
 Description: This script automates the process of loading JSON data into a PostgreSQL database. 
 It supports different data sources like Flickr, YouTube, and Wiki. The script reads JSON files 
 from a specified directory, matches them against a given pattern, and then processes each file 
-according to its data source type. The data is then inserted into the appropriate database tables 
-based on a dynamic template mapping system.
+according to its data source type. Rows are deduplicated on resultID per file and bulk loaded 
+with COPY into the staging tables named by the template mapping system, one transaction per 
+--batch_rows rows.
 
 Author: [Your Name]
 Date: [Creation or Last Modification Date]
@@ -18,7 +19,7 @@ from datetime import datetime
 import time
 
 # Custom utility functions
-from bkds_Utilities import log_msg, getHash, getDBConn, closeDB, archiveData, load_column_mappings
+from bkds_Utilities import log_msg, getHash, db_cursor, db_copy_rows, archiveData, sql_templates
 
 
 ########################################################################
@@ -32,6 +33,7 @@ def logMsg(msg):
 parser = argparse.ArgumentParser(description="Load JSON data into PostgreSQL database.")
 parser.add_argument("directory", help="env dir")
 parser.add_argument("subj_type", help="data type (youtube, flickr, wiki, etc)")
+parser.add_argument("--batch_rows", type=int, default=50000, help="rows per COPY transaction")
 args = parser.parse_args()
 
 # Main variables setup
@@ -70,6 +72,8 @@ template_key = "bkds_subjGen_load"
 
 src_key = 'dataSource'
 api_key = 'api_results'
+result_id_index = 2  # resultID position in every staging row
+DEFAULT_BATCH_ROWS = 50000
 #templateKey = 'subjGen_insertData'
 
 ########################################################################
@@ -79,11 +83,11 @@ def logMsg(msg):
     log_msg(program_name, batch_id, msg)
     print(msg)
 
-def getInsertTemplate(dataSource):  
-    return load_column_mappings(f"{template_key}_{dataSource}")
+def getLoadTarget(dataSource):
+    return sql_templates.get_load_target(f"{template_key}_{dataSource}")
 
 def generateInsertStatements(json_data, data_source_type):
-    print(f"generateInsertStatements with: {data_source_type}")
+    """Build the staging row tuples for one api result item (no DB access)."""
     data_to_insert = []
     
     #api result fields to load
@@ -98,11 +102,10 @@ def generateInsertStatements(json_data, data_source_type):
     #load maintenance fields
     load_id = getHash((searchID or "") + (utcTime or ""))
 
-    load_date=timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    load_date = datetime.utcnow().strftime("%Y%m%d%H%M%S")
     load_job=f'{program_name}'
 
     for api_result in json_data.get("api_results", []):
-        logMsg(f"handling api_result {api_result}")
         if data_source_type == flickr_key:
             imageUrl = api_result
             resultID = getHash((api_result or "") + (resultID or ""))
@@ -115,18 +118,11 @@ def generateInsertStatements(json_data, data_source_type):
             extract = api_result.get("extract", "")
             images = api_result.get("images", [])
 
-
-            logMsg(f'wiki_result_id: {wiki_result_id}')
-            logMsg(f'subjTitle: {subjTitle}')
-            logMsg(f'pageURL: {pageURL}')
-            logMsg(f'extract: {extract}')
             if not images:  # Check if the images list is empty
-                logMsg(f"No images found for wiki_result_id: {wiki_result_id}")
                 resultID = getHash((resultID or "") + (wiki_result_id or ""))
                 data_to_insert.append((subjectID, searchID, resultID, insightID, category, searchTerm, wiki_result_id, subjTitle, pageURL, extract, "", utcTime, load_id, load_date, load_job))
             else:
                 for image_url in images:
-                    logMsg(f"handling image_url: {image_url}")
                     resultID = getHash((image_url or "") + (resultID or "") + (wiki_result_id or ""))
                     data_to_insert.append((subjectID, searchID, resultID, insightID, category, searchTerm, wiki_result_id, subjTitle, pageURL, extract, image_url, utcTime, load_id, load_date, load_job))
 
@@ -139,36 +135,91 @@ def generateInsertStatements(json_data, data_source_type):
             resultID = getHash((videoUrl or "") + (resultID or ""))
             data_to_insert.append((subjectID, searchID, resultID, insightID, category, searchTerm, title, description, thumbnail, videoUrl, timestamp, utcTime, load_id, load_date, load_job))
 
-    insert_query = getInsertTemplate(data_source_type)
-    print(f'insert_query: {insert_query}\n\n')  
-    
-    conn, cursor = getDBConn()
-    print(f'\n{data_to_insert}\n')
-    conn.executemany(insert_query, data_to_insert)
-    cursor.commit()
-    closeDB(cursor, conn)
-
     return data_to_insert
 
 
-def loadDB(directory, pattern):
+def readFileRows(file_path):
+    """Parse one api result file into {data_source: [rows]}, deduplicated on resultID."""
+    rows_by_source = {}
+    seen_result_ids = set()
+    duplicate_count = 0
+
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+
+    for item in data:
+        data_source_type = item.get(data_src_key, "").lower()
+        for row in generateInsertStatements(item, data_source_type):
+            result_id = row[result_id_index]
+            if result_id in seen_result_ids:
+                duplicate_count += 1
+                continue
+            seen_result_ids.add(result_id)
+            rows_by_source.setdefault(data_source_type, []).append(row)
+
+    if duplicate_count:
+        logMsg(f"Dropped {duplicate_count} duplicate resultIDs from {os.path.basename(file_path)}")
+    return rows_by_source
+
+
+def copyBatch(rows_by_source):
+    """COPY one batch of rows into the staging tables in a single transaction."""
+    row_count = 0
+    with db_cursor(commit=True) as (cursor, conn):
+        for data_source_type, rows in rows_by_source.items():
+            target_table, target_columns = getLoadTarget(data_source_type)
+            row_count += db_copy_rows(cursor, target_table, target_columns, rows)
+    return row_count
+
+
+def loadDB(directory, pattern, batch_rows=DEFAULT_BATCH_ROWS):
     logMsg(f"starting loadDB main in {program_name} for dir: {directory}")
     # Ensure pattern includes wildcard characters if needed
     wildcard_pattern = f'*{pattern}*' if '*' not in pattern else pattern
     logMsg(f'wildcard_pattern: {wildcard_pattern}\n directory: {directory}')
-    #print(f'Searching in directory: {directory} for pattern: {wildcard_pattern}')
-    processed_files = []  # List to keep track of processed files
-    for file_path in glob.glob(os.path.join(directory, wildcard_pattern)):
-        logMsg(f"handling: {file_path}")
+
+    processed_files = []  # Files whose rows have been committed
+    batch_files = []
+    batch_rows_by_source = {}
+    batch_row_count = 0
+    total_rows = 0
+    start_time = time.time()
+
+    def flush_batch():
+        nonlocal batch_files, batch_rows_by_source, batch_row_count, total_rows
+        if not batch_files:
+            return
         try:
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                for item in data:
-                    generateInsertStatements(item, item.get(data_src_key, "").lower())  
-            #print(f"Successfully processed file: {file_path}")
-            processed_files.append(file_path)  # Add file to the list of processed files
+            loaded = copyBatch(batch_rows_by_source)
+            total_rows += loaded
+            processed_files.extend(batch_files)
+            logMsg(f"Loaded {loaded} rows from {len(batch_files)} files")
+        except Exception as e:
+            logMsg(f"Error loading batch of {len(batch_files)} files ({batch_files[0]} ...): {e}")
+        batch_files = []
+        batch_rows_by_source = {}
+        batch_row_count = 0
+
+    for file_path in sorted(glob.glob(os.path.join(directory, wildcard_pattern))):
+        try:
+            rows_by_source = readFileRows(file_path)
         except Exception as e:
             logMsg(f"Error processing file {file_path}: {e}")
+            continue
+
+        for data_source_type, rows in rows_by_source.items():
+            batch_rows_by_source.setdefault(data_source_type, []).extend(rows)
+            batch_row_count += len(rows)
+        batch_files.append(file_path)
+
+        if batch_row_count >= batch_rows:
+            flush_batch()
+
+    flush_batch()
+
+    elapsed = time.time() - start_time
+    logMsg(f"Loaded {total_rows} rows from {len(processed_files)} files in {elapsed:.2f}s")
+
     # Archive processed files if there are any
     if processed_files:
         archiveData(processed_files, directory)
@@ -176,6 +227,6 @@ def loadDB(directory, pattern):
 if __name__ == "__main__":
     logMsg(f"starting main in {program_name}\nargs: {args}\nfile_pattern: {file_pattern}")
 
-    loadDB(data_dir, file_pattern)
+    loadDB(data_dir, file_pattern, args.batch_rows)
 
-    logMsg(f"finished main in {program_name} with {args}")
\ No newline at end of file
+    logMsg(f"finished main in {program_name} with {args}")
@@ -0,0 +1,211 @@
+"""
+Content Feed Aggregation Stage
+
+This module walks the content_feeds tree once, parses the per-insight JSON files in a pool with ujson,
+and groups the records by category and cluster in the same pass. Both feed generators consume the result:
+bkds_contentPostGen_Category builds the category batch files from it and bkds_contentPostGen_MainFeed
+samples the main feed from it, so running them together costs one tree traversal instead of two.
+
+Functionality:
+- Walk content_feeds once, skipping the main feed, page shard and archive folders and the generated
+  batch and filter index files (names containing 'main_feed', '_batch' or 'bkds_data_category_filter_index')
+- Read and parse the remaining *.json files (ujson) in a thread pool, in walk order; threads overlap the
+  file reads without pickling parsed records back from worker processes
+- Group records by data_category and cluster_id; records from suppressed files (e.g. launch_update)
+  are kept but flagged so each consumer can apply its own rule
+- With BKDS_INSIGHT_STORE=1, categories that have an InsightStore are read from it with one open; the
+  walk still lists their folders but skips the url_id folders the store covers, so files from other
+  writers (e.g. the rocket launch posts) are still picked up
+
+Usage:
+- As a library: aggregate = aggregate_content_feeds(content_path) and pass it to the main() of
+  bkds_contentPostGen_Category / bkds_contentPostGen_MainFeed; bkds_contentPipeline passes the insights it
+  just wrote as preloaded records, so their folders are not read back
+- As a script: python bkds_contentFeedAggregate.py [--workers N]
+  aggregates once, then writes the category batches and the main feed
+- Set environment variables BKDS_UTIL_DATA and BKDS_NODEJS_DATA to appropriate paths
+"""
+
+import os
+import time
+import ujson
+import argparse
+from multiprocessing import cpu_count
+from concurrent.futures import ThreadPoolExecutor
+from bkds_Utilities import log_msg, PAGE_DIR, InsightStore, insight_store_enabled
+
+PROGRAM_NAME = os.path.basename(__file__)
+BATCH_ID = 'BKDS_CONTENT_FEED_AGGREGATE'
+
+def logMsg(msg, program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """Log a message to the console and using a logging system, under the caller's program name and batch id."""
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+##################################
+# Setup and global variables
+
+nodejs_data = os.getenv('BKDS_NODEJS_DATA')
+content_root = 'content_feeds'
+
+# Folders and file names that hold generated output rather than insights
+exclude_dirs = {'main_feed', 'archive', PAGE_DIR}
+exclude_filenames = ['main_feed', '_batch', 'bkds_data_category_filter_index']
+suppression_strings = {'launch_update'}
+
+# Below parse_pool_min_files the files are parsed inline
+parse_pool_min_files = 256
+
+DEFAULT_CATEGORY = 'uncategorized'
+DEFAULT_CLUSTER = 'default_cluster'
+
+##################################
+# Main logic and functions
+
+class FeedAggregate:
+    """
+    Insight records from one walk of content_feeds, grouped as
+    groups[data_category][cluster_id] -> [(record, suppressed)] in walk order.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.file_count = 0
+        self.store_count = 0
+        self.preloaded_count = 0
+        self.record_count = 0
+
+    def add(self, record, suppressed):
+        insight_details = record.get('insight_details', {})
+        category = insight_details.get('data_category', DEFAULT_CATEGORY)
+        cluster_id = insight_details.get('cluster_id', DEFAULT_CLUSTER)
+        self.groups.setdefault(category, {}).setdefault(cluster_id, []).append((record, suppressed))
+        self.record_count += 1
+
+    def categories(self):
+        return list(self.groups)
+
+    def iter_records(self, category=None, cluster_id=None, include_suppressed=True):
+        """Yield (record, suppressed), optionally for one category and/or cluster only."""
+        categories = self.groups if category is None else {category: self.groups.get(category, {})}
+        for clusters in categories.values():
+            selected = clusters.values() if cluster_id is None else [clusters.get(cluster_id, [])]
+            for records in selected:
+                for record, suppressed in records:
+                    if include_suppressed or not suppressed:
+                        yield record, suppressed
+
+    def records(self, category=None, cluster_id=None, include_suppressed=True):
+        return [record for record, _ in self.iter_records(category, cluster_id, include_suppressed)]
+
+def gather_feed_files(directory, skip_dirs=frozenset()):
+    """One os.walk of the content tree; returns the insight files in walk order, pruning skip_dirs (normalised paths)."""
+    json_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in exclude_dirs and os.path.normpath(os.path.join(root, d)) not in skip_dirs]
+        for file in files:
+            if file.endswith('.json') and not any(exclude in file for exclude in exclude_filenames):
+                json_files.append(os.path.join(root, file))
+    return json_files
+
+def parse_feed_file(file_path):
+    """Parse one insight file; returns (file_path, records) with records None if unreadable."""
+    try:
+        with open(file_path, 'rb') as f:
+            data = ujson.loads(f.read())
+    except (OSError, ValueError):
+        return file_path, None
+    return file_path, data if isinstance(data, list) else []
+
+def read_insight_stores(directory, covered_dirs):
+    """
+    Rows of every category InsightStore under directory as (file_path, data), skipping
+    url_id folders already in covered_dirs and adding the ones they cover (to be pruned
+    from the walk).
+    """
+    stored = []
+    for entry in os.scandir(directory):
+        if not entry.is_dir() or entry.name in exclude_dirs or not InsightStore.exists(entry.path):
+            continue
+        store = InsightStore(entry.path)
+        try:
+            for _, _, rel_path, data in store.iter_rows():
+                file_path = os.path.join(entry.path, rel_path)
+                file_dir = os.path.normpath(os.path.dirname(file_path))
+                if file_dir in covered_dirs:
+                    continue
+                stored.append((file_path, data))
+                covered_dirs.add(file_dir)
+        finally:
+            store.close()
+    return stored
+
+def aggregate_content_feeds(directory=None, workers=None, use_store=None, preloaded=None,
+                            program_name=PROGRAM_NAME, batch_id=BATCH_ID):
+    """
+    Walk directory (default BKDS_NODEJS_DATA/content_feeds) once and return a FeedAggregate.
+    Files are read and parsed by workers threads (default cpu_count) and merged in walk order.
+    use_store (default BKDS_INSIGHT_STORE) reads category InsightStores first and skips
+    the files they cover. preloaded is a list of (file_path, record) for insights already
+    in memory; their folders are skipped in the stores and the walk. Messages are logged
+    under program_name and batch_id (the caller's).
+    """
+    directory = directory or os.path.join(nodejs_data, content_root)
+    use_store = insight_store_enabled if use_store is None else use_store
+    preloaded = preloaded or []
+    start_time = time.time()
+    covered_dirs = {os.path.normpath(os.path.dirname(file_path)) for file_path, _ in preloaded}
+    stored = read_insight_stores(directory, covered_dirs) if use_store else []
+    json_files = gather_feed_files(directory, covered_dirs)
+    workers = workers or cpu_count()
+
+    if workers > 1 and len(json_files) >= parse_pool_min_files:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(parse_feed_file, json_files))
+    else:
+        parsed = [parse_feed_file(file_path) for file_path in json_files]
+
+    aggregate = FeedAggregate()
+    for file_path, record in preloaded:
+        aggregate.preloaded_count += 1
+        aggregate.add(record, any(s in file_path.lower() for s in suppression_strings))
+
+    for file_path, data in stored:
+        aggregate.store_count += 1
+        suppressed = any(s in file_path.lower() for s in suppression_strings)
+        for record in ujson.loads(data):
+            if isinstance(record, dict):
+                aggregate.add(record, suppressed)
+
+    for file_path, data in parsed:
+        if data is None:
+            logMsg(f"Skipping invalid JSON file: {file_path}", program_name, batch_id)
+            continue
+        aggregate.file_count += 1
+        suppressed = any(s in file_path.lower() for s in suppression_strings)
+        for record in data:
+            if isinstance(record, dict):
+                aggregate.add(record, suppressed)
+
+    logMsg(f"Aggregated {aggregate.record_count} records from {aggregate.preloaded_count} preloaded and "
+           f"{aggregate.store_count} stored insights and {aggregate.file_count} files in "
+           f"{len(aggregate.groups)} categories ({time.time() - start_time:.1f}s)", program_name, batch_id)
+    return aggregate
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Aggregate content_feeds once and build the category batches and the main feed.")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="Threads used to read and parse the insight files.")
+    return parser.parse_args()
+
+def main():
+    # Imported here: both generators import this module
+    import bkds_contentPostGen_Category
+    import bkds_contentPostGen_MainFeed
+
+    args = parse_arguments()
+    aggregate = aggregate_content_feeds(workers=args.workers)
+    bkds_contentPostGen_Category.main(aggregate)
+    bkds_contentPostGen_MainFeed.main(aggregate)
+
+if __name__ == "__main__":
+    main()
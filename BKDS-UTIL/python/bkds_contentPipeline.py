@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import importlib
+import argparse
+from datetime import datetime
+from bkds_Utilities import log_msg, stream_data, get_sqlTemplate
+from bkds_contentFeedAggregate import aggregate_content_feeds
+
+"""
+BKDS Content Pipeline
+
+Purpose:
+    Runs the content refresh as one job: the master feed (bkds_contentGen_web_feed_master) is queried once
+    and its records are shared in memory by the stages that used to be separate scripts, each re-querying
+    the feed or re-reading the previous script's JSON from disk.
+
+Logical Flow:
+    1. **Fetch**: Streams the master feed once, batch by batch.
+    2. **transform** (bkds_contentPostGen_parallel.process_feed): Each batch is transformed and saved by the
+       worker pool; the saved insights come back to the parent instead of being read from disk again.
+    3. **images** (bkds_imgMasterIndex): The same batches feed collect_images as they stream past; the image
+       index, its page shards and per-category files are written once the feed is consumed.
+    4. **category** / **main_feed** (bkds_contentPostGen_Category / bkds_contentPostGen_MainFeed): One
+       aggregation of content_feeds, preloaded with the insights from the transform stage (only folders it
+       did not write are walked), drives both the category batches and the main feed.
+
+Usage:
+    python bkds_contentPipeline.py <batch_id> [--stages transform,images,category,main_feed]
+                                              [--chunk_rows 50] [--incremental] [--workers N]
+
+    - `--stages`: Comma separated subset of the stages to run (default all, always in the order above).
+    - `--chunk_rows` / `--incremental`: Passed to the transform stage (see bkds_contentPostGen_parallel).
+    - `--workers`: Threads for the content_feeds aggregation.
+
+    Every stage is still runnable on its own through its script.
+
+Prerequisites:
+    - Environment variables `BKDS_NODEJS_DATA`, `BKDS_NODEJS_PUBLIC` and `BKDS_UTIL_DATA` must be set.
+"""
+
+######################################################################
+# Configuration Constants and Defaults
+######################################################################
+program_name = os.path.basename(__file__)
+
+INSIGHT_QUERY_KEY = 'bkds_contentGen_web_feed_master'
+STREAM_BATCH_SIZE = 500
+TRANSFORM = 'transform'
+IMAGES = 'images'
+CATEGORY = 'category'
+MAIN_FEED = 'main_feed'
+STAGES = [TRANSFORM, IMAGES, CATEGORY, MAIN_FEED]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Run the content refresh stages over one query of the master feed.")
+    parser.add_argument("batch_id", help="Unique identifier for the batch processing session.")
+    parser.add_argument("--stages", default=','.join(STAGES), help=f"Comma separated stages to run, from {', '.join(STAGES)}.")
+    parser.add_argument("--chunk_rows", type=int, default=50, help="Maximum insights per transform worker task.")
+    parser.add_argument("--incremental", action="store_true", help="Only transform rows whose source hash changed since the last run.")
+    parser.add_argument("--workers", type=int, default=None, help="Threads for the content_feeds aggregation (default cpu_count).")
+    args = parser.parse_args()
+    args.stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    return args
+
+args = parse_arguments()
+batch_id = args.batch_id
+
+def logMsg(msg):
+    """ Log a message to the console and using a logging system. """
+    log_msg(program_name, batch_id, msg)
+    print(msg)
+
+######################################################################
+# Main logic and functions
+######################################################################
+
+def import_stage(module_name, stage_argv):
+    """Import a stage script; the scripts parse their own command line at import time."""
+    saved_argv = sys.argv
+    sys.argv = [f"{module_name}.py"] + stage_argv
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.argv = saved_argv
+
+def main():
+    """ Main execution function. """
+    logMsg(f"Starting main @ {datetime.now()} with stages {args.stages}")
+    start_time = time.time()
+    stages = set(args.stages)
+    feed_stages = {CATEGORY, MAIN_FEED} & stages
+
+    transform_stage = None
+    if TRANSFORM in stages:
+        transform_argv = [batch_id, '--chunk_rows', str(args.chunk_rows)] + (['--incremental'] if args.incremental else [])
+        transform_stage = import_stage('bkds_contentPostGen_parallel', transform_argv)
+    image_stage = import_stage('bkds_imgMasterIndex', [batch_id]) if IMAGES in stages else None
+
+    img_dict = {}
+    batch_count = 0
+
+    def feed_batches():
+        """One query of the master feed; the image stage sees each batch before the transform stage."""
+        nonlocal batch_count
+        for batch in stream_data(get_sqlTemplate(INSIGHT_QUERY_KEY), STREAM_BATCH_SIZE):
+            batch_count += 1
+            if image_stage:
+                image_stage.collect_images(batch, img_dict)
+            yield batch
+
+    collected = []
+    if transform_stage:
+        collected = transform_stage.process_feed(feed_batches(), collect=bool(feed_stages))
+    elif image_stage:
+        for _ in feed_batches():
+            pass
+    if transform_stage or image_stage:
+        logMsg(f"Fetch: {batch_count} batches from {INSIGHT_QUERY_KEY} ({time.time() - start_time:.1f}s)")
+
+    if image_stage:
+        image_stage.save_image_index(image_stage.build_image_index(img_dict))
+        logMsg(f"Images: {len(img_dict)} images indexed")
+
+    if feed_stages:
+        import bkds_contentPostGen_Category
+        import bkds_contentPostGen_MainFeed
+
+        aggregate = aggregate_content_feeds(workers=args.workers, preloaded=collected,
+                                            program_name=program_name, batch_id=batch_id)
+        if CATEGORY in stages:
+            bkds_contentPostGen_Category.main(aggregate)
+        if MAIN_FEED in stages:
+            bkds_contentPostGen_MainFeed.main(aggregate)
+
+    logMsg(f"Pipeline completed in {time.time() - start_time:.1f}s.")
+
+if __name__ == "__main__":
+    main()
@@ -12,26 +12,31 @@ datetime: For time and date operations
 zipfile: For creating zip archives
 Functionality:
 
-Load all JSON files from the specified directory, excluding certain filenames
-Process the JSON files to extract insights
+Load all JSON files from the specified directory, excluding certain filenames, through the shared
+aggregation stage (bkds_contentFeedAggregate: one tree walk, pooled ujson parsing, grouped by category)
+Process the aggregated records to extract insights
 Save the insights to category-specific batch files
+Write fixed-size page shards and a page index per category (pages/{category}_batch_page_NNNN.json,
+pages/{category}_batch_pages.json) so the Node routes read only the page they serve
 Archive old batch files to avoid redundancy
 Usage:
 
 Set environment variables BKDS_UTIL_DATA and BKDS_NODEJS_DATA to appropriate paths
 Ensure required modules are installed: json_minify, ujson
-Run the script to generate the category-level feeds
+Run the script to generate the category-level feeds, or bkds_contentFeedAggregate.py to build the
+category feeds and the main feed from a single aggregation
 Author: [Your Name]
 Date: [Date]
 
 """
 
 import os
-import json
 import ujson
 import zipfile
 import random
 from datetime import datetime
+from bkds_Utilities import write_page_shards
+from bkds_contentFeedAggregate import aggregate_content_feeds, DEFAULT_CATEGORY
 
 def log_msg(message):
     print(message)
@@ -46,8 +51,6 @@ target_root = "./public/data"
 content_root = 'content_feeds'
 content_dir = os.path.join(target_root, content_root)
 
-# List of filenames to exclude
-exclude_filenames = ['main_feed', '_batch']
 postLimit = 2500
 
 # Define a dictionary with categories and shuffle intervals
@@ -58,26 +61,6 @@ shuffle_intervals = {
 ##################################
 # Main logic and functions
 
-def gather_all_json_files(directory, exclude_folder='main_feed'):
-    json_files = []
-    for root, dirs, files in os.walk(directory):
-        # Exclude the specified folder
-        dirs[:] = [d for d in dirs if d != exclude_folder]
-        for file in files:
-            if file.endswith('.json') and not any(exclude in file for exclude in exclude_filenames):
-                json_files.append(os.path.join(root, file))
-    return json_files
-
-def read_json_file(file_path):
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        return data
-    except json.JSONDecodeError:
-        log_msg(f"Skipping invalid JSON file: {file_path}")
-        return None
-
-
 def save_category_batch_file(category, insights):
     target_dir = os.path.join(nodejs_data, content_root, category)
     os.makedirs(target_dir, exist_ok=True)
@@ -103,6 +86,9 @@ def save_category_batch_file(category, insights):
     insights = apply_special_rules(category, insights)
 
     try:
+        # Shards follow the final order and are refreshed even when the batch file is unchanged
+        write_page_shards(target_dir, f"{category}_batch", insights)
+
         new_data_serialized = ujson.dumps(insights)
 
         # Compare with existing file content if it exists
@@ -216,68 +202,65 @@ def save_index_file(index_data):
     except Exception as e:
         log_msg(f"Error during saving index file: {e}")
 
-def main():
-    log_msg("Gathering all JSON files from directory...")
-    json_files = gather_all_json_files(os.path.join(nodejs_data, content_root))
+def main(aggregate=None):
+    if aggregate is None:
+        log_msg("Aggregating all JSON files from directory...")
+        aggregate = aggregate_content_feeds(os.path.join(nodejs_data, content_root))
 
     all_insights = {}
     index_data_set = set()
 
-    log_msg("Reading and categorizing JSON files...")
-    for file_path in json_files:
-        data = read_json_file(file_path)
-        if data is None:
+    log_msg("Categorizing aggregated records...")
+    for category in aggregate.categories():
+        # Skip uncategorized entries
+        if category == DEFAULT_CATEGORY:
             continue
 
-        # Determine if the file should be excluded from index_data
-        exclude_from_index_data = "launch_update" in file_path
-
-        if isinstance(data, list):
-            for record in data:
-                insight_details = record.get('insight_details', {})
-                category = insight_details.get('data_category', 'uncategorized')
-                category_id = insight_details.get('data_category_id', 'uncategorized_id')
-                subject = insight_details.get('data_subject', 'uncategorized_subject')
-                subject_id = insight_details.get('data_subject_id', 'uncategorized_subject_id')
-
-                # Skip uncategorized entries
-                if category == 'uncategorized' or subject == 'uncategorized_subject':
-                    continue
-
-                # If the file should not be excluded from index_data, add to index_data_set
-                if not exclude_from_index_data:
-                    index_data_set.add(("category", category, category_id))
-                    index_data_set.add(("subject", subject, subject_id))
-
-                # Extract default image
-                default_image = record.get('media', {}).get('default_img') or record.get('default_img', 'default image Missing')
-
-                # Ensure text_block and its fields exist
-                text_block_content = record.get('text_block', {}).get('content', 'No data')[:postLimit]
-                text_block_description = record.get('text_block', {}).get('description', 'No description')
-
-                trimmed_record = {
-                    "insight_details": {
-                        "url_id": insight_details.get('url_id', 'Missing'),
-                        "cluster_id": insight_details.get('cluster_id', 'Missing'),
-                        "subject_id": insight_details.get('subject_id', 'Missing'),
-                        "subject_title": insight_details.get('subject_title', 'Missing'),
-                        "data_category": insight_details.get('data_category', 'Missing'),
-                        "data_category_id": insight_details.get('data_category_id', 'Missing'),
-                        "data_subject": insight_details.get('data_subject', 'Missing'),
-                        "data_subject_id": insight_details.get('data_subject_id', 'Missing'),
-                        "content_name": insight_details.get('content_name', 'Missing')
-                    },
-                    "default_img": default_image,
-                    "text_block": {
-                        "content": text_block_content,
-                        "description": text_block_description
-                    }
+        # Records from suppressed files (launch_update) are excluded from index_data only
+        for record, exclude_from_index_data in aggregate.iter_records(category):
+            insight_details = record.get('insight_details', {})
+            category_id = insight_details.get('data_category_id', 'uncategorized_id')
+            subject = insight_details.get('data_subject', 'uncategorized_subject')
+            subject_id = insight_details.get('data_subject_id', 'uncategorized_subject_id')
+
+            # Skip uncategorized entries
+            if subject == 'uncategorized_subject':
+                continue
+
+            # If the file should not be excluded from index_data, add to index_data_set
+            if not exclude_from_index_data:
+                index_data_set.add(("category", category, category_id))
+                index_data_set.add(("subject", subject, subject_id))
+
+            # Extract default image
+            default_image = record.get('media', {}).get('default_img') or record.get('default_img', 'default image Missing')
+
+            # Ensure text_block and its fields exist
+            text_block_content = record.get('text_block', {}).get('content', 'No data')[:postLimit]
+            text_block_description = record.get('text_block', {}).get('description', 'No description')
+
+            trimmed_record = {
+                "insight_details": {
+                    "url_id": insight_details.get('url_id', 'Missing'),
+                    "cluster_id": insight_details.get('cluster_id', 'Missing'),
+                    "subject_id": insight_details.get('subject_id', 'Missing'),
+                    "subject_title": insight_details.get('subject_title', 'Missing'),
+                    "data_category": insight_details.get('data_category', 'Missing'),
+                    "data_category_id": insight_details.get('data_category_id', 'Missing'),
+                    "data_subject": insight_details.get('data_subject', 'Missing'),
+                    "data_subject_id": insight_details.get('data_subject_id', 'Missing'),
+                    "content_name": insight_details.get('content_name', 'Missing')
+                },
+                "default_img": default_image,
+                "text_block": {
+                    "content": text_block_content,
+                    "description": text_block_description
                 }
+            }
 
-                if category not in all_insights:
-                    all_insights[category] = []
-                all_insights[category].append(trimmed_record)
+            if category not in all_insights:
+                all_insights[category] = []
+            all_insights[category].append(trimmed_record)
 
     # Create a list of unique index entries and sort them by type
     index_data = [{"type": t, "filter_name": name, "filter_id": id} for (t, name, id) in sorted(index_data_set, key=lambda x: x[0])]
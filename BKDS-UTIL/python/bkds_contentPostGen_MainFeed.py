@@ -15,15 +15,18 @@ Modules Used:
 
 Functionality:
 - Load configuration from a JSON file
-- Gather insights from JSON files in specified directories
-- Filter insights based on configuration settings
+- Gather insights from JSON files in specified directories through the shared aggregation stage
+  (bkds_contentFeedAggregate: one tree walk, pooled ujson parsing, grouped by category and cluster)
+- Filter insights based on configuration settings, reading each configured category's group directly
 - Save the filtered insights to a main feed file, with raw data and minified JSON data
+- Write fixed-size page shards and a page index next to the main feed file (see write_page_shards)
 - Archive old batch files to avoid redundancy
 
 Usage:
 - Set environment variables BKDS_UTIL_DATA and BKDS_NODEJS_DATA to appropriate paths
 - Ensure required modules are installed: json_minify, ujson
-- Run the script to generate the content feqed
+- Run the script to generate the content feqed, or bkds_contentFeedAggregate.py to build the
+  category feeds and the main feed from a single aggregation
 
 Author: [Your Name]
 Date: [Date]
@@ -36,7 +39,8 @@ import ujson
 import zipfile
 from datetime import datetime
 import random
-from bkds_Utilities import logMsg
+from bkds_Utilities import write_page_shards
+from bkds_contentFeedAggregate import aggregate_content_feeds
 
 #####################################################################
 # Main Setup / Variables
@@ -58,42 +62,11 @@ def logMsg(msg):
     print(msg)
 
 config_path = os.path.join(util_data, 'config', 'bkds_contentGen_main_feed_config.json')
-suppression_strings = {"launch_update"}  # Add more suppression strings as needed
 
 #####################################################################
 # Main logic and functions
 
-def gather_insights_from_directory(directory):
-    logMsg(f'Working with directory: {directory}')
-    insights = []
-    for category_dir in os.listdir(directory):
-        category_path = os.path.join(directory, category_dir)
-        if os.path.isdir(category_path):
-            for root, _, files in os.walk(category_path):
-                json_files = [file for file in files if file.endswith('.json')]
-                for json_file in json_files:
-                    # Check if the file should be skipped based on suppression strings
-                    if any(s.lower() in json_file.lower() for s in suppression_strings):
-                        logMsg(f"Skipping suppressed file: {json_file}")
-                        continue
-                    
-                    file_path = os.path.join(root, json_file)
-                    with open(file_path, 'r') as f:
-                        try:
-                            data = json.load(f)
-                        except json.JSONDecodeError:
-                            logMsg(f"Skipping invalid JSON file: {file_path}")
-                            continue
-                        
-                        # Add data if it's a non-empty list
-                        if isinstance(data, list) and data:
-                            insights.extend(data)
-                        else:
-                            logMsg(f"No valid records found in {file_path}. Skipping file.")
-    return insights
-
-
-def filter_insights(config, insights):
+def filter_insights(config, aggregate):
     logMsg(f'filter_insights: {config}')
     if not isinstance(config, dict):
         raise TypeError("config must be a dictionary")
@@ -107,16 +80,8 @@ def filter_insights(config, insights):
         if not isinstance(details, dict):
             continue  # Skip if details is not a dictionary
 
-        category_insights = [
-            insight for insight in insights 
-            if insight.get('insight_details', {}).get('data_category') == category
-        ]
-
-        if 'cluster_id' in details:
-            category_insights = [
-                insight for insight in category_insights 
-                if insight.get('insight_details', {}).get('cluster_id') == details['cluster_id']
-            ]
+        # Suppressed files (launch_update) never feed the main feed
+        category_insights = aggregate.records(category, details.get('cluster_id'), include_suppressed=False)
 
         max_records = int(details.get('records_to_get', len(category_insights)))
         random.shuffle(category_insights)
@@ -153,6 +118,9 @@ def save_main_feed(filtered_insights, target_folder, target_file_name):
             ujson.dump(filtered_insights_sorted, f)
         logMsg(f"Main feed raw batch file saved successfully at {raw_output_path}")
 
+        # Shards are refreshed even when the batch file is unchanged
+        write_page_shards(target_dir, os.path.splitext(target_file_name)[0], filtered_insights_sorted)
+
         # Check for existing data
         existing_data = None
         if os.path.exists(final_output_path):
@@ -206,15 +174,16 @@ def normalize_for_json(data):
     else:
         return str(data)  # Convert unsupported types to string
 
-def main():
+def main(aggregate=None):
     logMsg("Loading configuration...")
     config = load_config(config_path)
     
-    logMsg("Gathering insights from directory...")
-    insights = gather_insights_from_directory(os.path.join(nodejs_data, content_root))
+    if aggregate is None:
+        logMsg("Aggregating insights from directory...")
+        aggregate = aggregate_content_feeds(os.path.join(nodejs_data, content_root))
     
     logMsg("Filtering insights based on configuration...")
-    filtered_insights = filter_insights(config, insights)  # Correct order of parameters
+    filtered_insights = filter_insights(config, aggregate)
 
     trimmed_insights = []
     skipped_count = 0  # Counter for skipped records
@@ -7,7 +7,7 @@ import zipfile
 import argparse
 from datetime import datetime
 import time
-from bkds_Utilities import log_msg, fetch_data, get_sqlTemplate, split_text_into_spans
+from bkds_Utilities import log_msg, close_db_pool, stream_data, get_sqlTemplate, split_text_into_spans, atomic_write, content_hash, ContentManifest, UrlMapper, ImageIndex, InsightStore, insight_store_enabled
 
 """
 BKDS Content Processor
@@ -23,20 +23,32 @@ Logical Flow:
        - Extracting and categorizing images, videos, and metadata.
        - Splitting text content into manageable spans.
        - Associating related topics and default media items.
-    3. **Output Generation**: Saves processed data as minimized JSON files while archiving older versions
-       for backup.
+    3. **Output Generation**: Saves processed data as minimized JSON files, writing only insights whose content
+       hash differs from the per-category manifest (atomically, via temp file + rename) and archiving the
+       replaced versions for backup. With BKDS_INSIGHT_STORE=1 the same JSON is also upserted into the
+       category's InsightStore (SQLite), which the feed aggregation reads instead of the per-insight files.
     4. **Media Handling**: Resolves URLs for media content, ensuring compatibility with local paths or 
-       predefined mappings.
+       predefined mappings. Local image checks use an ImageIndex of `images/full_size` built by one scandir
+       sweep before the pool starts (workers inherit it read-only); remote images are HEAD-checked by a
+       RemoteImageChecker with bounded concurrency and a per-process result cache.
     5. **Error Handling**: Captures and logs issues in data transformation, file writing, and archiving.
 
 Usage:
-    python bkds_content_processor.py <batch_id> [--gen_type {all,details,sample}]
+    python bkds_content_processor.py <batch_id> [--gen_type {all,details,sample}] [--incremental]
 
     - `batch_id`: Unique identifier for the batch processing session.
     - `--gen_type`: Specifies the type of output to generate:
         - 'all' (default): Generates all data types.
         - 'details': Generates detailed JSON output.
         - 'sample': Generates a random sample of the data.
+    - `--chunk_rows`: Maximum insights per worker task (default 50). Each streamed batch is split into
+      cluster-aligned chunks that are spread over the pool with imap_unordered; a per-worker utilisation
+      report is logged at the end.
+    - `--incremental`: Skips rows whose source hash matches the category manifest (and whose output still
+      exists), then deletes the outputs of url_ids that no longer appear in the feed. Every run records
+      source hashes, so a full run can be followed by incremental ones.
+    - BKDS_INSIGHT_STORE=1 (environment): also populate the per-category InsightStore. Turn it on with a
+      full run, since incremental runs only store the rows they transform.
 
 Example:
     python bkds_content_processor.py example_batch123 --gen_type details
@@ -97,6 +109,10 @@ ARCHIVE_FOLDER_PATH = os.path.join(util_dir, data_type, archive_folder)
 
 # Query and data keys
 INSIGHT_QUERY_KEY = 'bkds_contentGen_web_feed_master'
+# Feed rows pulled from the server-side cursor per batch; bounds peak memory
+STREAM_BATCH_SIZE = 500
+# Insights per worker task; chunks keep clusters together so one large category no longer pins a core
+DEFAULT_CHUNK_ROWS = 50
 DATA_CATEGORY = 'data_category'
 DATA_CATEGORY_ID='data_category_id'
 DATA_SUBJECT = 'data_subject'
@@ -142,20 +158,41 @@ URL_PATTERNS = {
     '_flickr_': 'flickr',
     '_wiki_': 'wiki'
 }
+# Shared, cached mapper behind process_url
+url_mapper = UrlMapper(PRODUCTION_BASE_PATH, URL_PATTERNS)
+
+# Local image tree indexed once per run (under BKDS_NODEJS_PUBLIC) and remote HEAD checks
+IMAGE_INDEX_DIR = os.path.join('images', 'full_size')
+REMOTE_CHECK_WORKERS = 16
+REMOTE_CHECK_TIMEOUT = 5
+image_index = None
+remote_checker = None
+
+# Per-category manifest of written insights (url_id -> source_hash, output_path, content_hash, last_write)
+MANIFEST_FILE = '.bkds_content.manifest'  # not *.json, so feed gatherers skip it
+SOURCE_HASH = 'source_hash'
+OUTPUT_PATH = 'output_path'
+CONTENT_HASH = 'content_hash'
+LAST_WRITE = 'last_write'
 
 # Date and timestamp formats
 TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
 HARD_CODED_DEFAULT_IMG = "/data/img/bkds_desktop_rockets.png"
+IMAGE_EXT_REGEX = re.compile(r'\.(jpg|png|gif|jpeg)$', re.IGNORECASE)
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Process insights and related media content into JSON files based on batch ID.")
     parser.add_argument("batch_id", help="Unique identifier for the batch processing session.")
     parser.add_argument("--gen_type", choices=['all', 'details', 'sample'], default='all', help="Type of output file to generate: 'details' for detailed data, 'sample' for random samples, 'all' for both.")
+    parser.add_argument("--chunk_rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Maximum insights per worker task.")
+    parser.add_argument("--incremental", action="store_true", help="Only transform rows whose source hash changed since the last run and delete outputs of vanished url_ids.")
     return parser.parse_args()
 
 args = parse_arguments()
 batch_id = args.batch_id
 gen_type = args.gen_type
+incremental = args.incremental
+chunk_rows = max(1, args.chunk_rows)
 output_type = 'json'
 output_prefix = 'bkds_' 
 subjType = 'contentPostGen'
@@ -180,12 +217,24 @@ def safely_parse_json(json_data):
     return json_data
 
 def case_insensitive_exists(local_path):
-    directory, file_name = os.path.split(local_path)
-    if not os.path.isdir(directory):
-        return False  # Directory does not exist
-    
-    # Check for a matching file in the directory
-    return file_name.lower() in (f.lower() for f in os.listdir(directory))
+    return get_image_index().find(local_path) is not None
+
+def get_image_index():
+    """
+    The run's ImageIndex, built on first use. main builds it before the pool is
+    created so forked workers share the parent's copy instead of sweeping again.
+    """
+    global image_index
+    if image_index is None:
+        image_index = ImageIndex(os.path.join(os.getenv('BKDS_NODEJS_PUBLIC', ''), IMAGE_INDEX_DIR))
+    return image_index
+
+def get_remote_checker():
+    """Per-process RemoteImageChecker; created lazily so no HTTP session crosses a fork."""
+    global remote_checker
+    if remote_checker is None:
+        remote_checker = RemoteImageChecker()
+    return remote_checker
 
 
 ######################################################################
@@ -193,6 +242,43 @@ def case_insensitive_exists(local_path):
 ######################################################################
 
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class RemoteImageChecker:
+    """
+    HEAD checks for remote image URLs: at most max_workers requests in flight over
+    one keep-alive session, each distinct URL checked once per process.
+    """
+
+    def __init__(self, max_workers=REMOTE_CHECK_WORKERS, timeout=REMOTE_CHECK_TIMEOUT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def head(self, url):
+        try:
+            response = self.session.head(url, timeout=self.timeout)
+            return response.status_code == 200
+        except requests.RequestException as e:
+            logMsg(f"HTTP image check failed ({e}): {url}")
+            return False
+
+    def check_all(self, urls):
+        """Return {url: available} for urls, issuing HEAD requests only for uncached ones."""
+        with self.lock:
+            pending = list({url for url in urls if url not in self.results})
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                checked = dict(zip(pending, executor.map(self.head, pending)))
+            with self.lock:
+                self.results.update(checked)
+        return {url: self.results[url] for url in urls}
 
 def verify_images(images, batch_id):
     """
@@ -215,13 +301,19 @@ def verify_images(images, batch_id):
         logMsg("Environment variable BKDS_NODEJS_PUBLIC is not set.")
         return []
 
-    directory_cache = {}  # Cache directory listings and mappings
+    index = get_image_index()
+
+    # Check every remote image up front, concurrently and through the result cache
+    remote_status = get_remote_checker().check_all([
+        img[IMG_URL] for img in images
+        if img[IMG_URL].startswith(('http://', 'https://')) and IMAGE_EXT_REGEX.search(img[IMG_URL])
+    ])
 
     for img in images:
         original_url = img[IMG_URL]
 
         # Check file extension validity
-        if not re.search(r'\.(jpg|png|gif|jpeg)$', original_url, re.IGNORECASE):
+        if not IMAGE_EXT_REGEX.search(original_url):
             logMsg(f"Invalid extension for image: {original_url}")
             filtered_out_images.append(original_url)
             continue
@@ -231,52 +323,22 @@ def verify_images(images, batch_id):
 
         # Check for HTTP URL
         if original_url.startswith(('http://', 'https://')):
-            try:
-                response = requests.head(original_url, timeout=5)
-                if response.status_code == 200:
-                    img[IMG_URL] = process_url(original_url)  # Apply process_url after verification
-                    verified_images.append(img)
-                else:
-                    filtered_out_images.append(original_url)
-            except requests.RequestException as e:
-                logMsg(f"HTTP image check failed ({e}): {original_url}")
+            if remote_status[original_url]:
+                img[IMG_URL] = process_url(original_url)  # Apply process_url after verification
+                verified_images.append(img)
+            else:
                 filtered_out_images.append(original_url)
             continue
 
         # Check for local file existence using a case-insensitive check
         directory, file_name = os.path.split(local_path)
-        if not os.path.isdir(directory):
+        if not index.isdir(directory):
             logMsg(f"Directory does not exist: {directory}")
             filtered_out_images.append(original_url)
             continue
 
-        # Use cached directory data if available
-        if directory in directory_cache:
-            dir_data = directory_cache[directory]
-        else:
-            # Cache the directory listing once and pre-process
-            dir_files = os.listdir(directory)
-            file_map = {f.lower(): f for f in dir_files}  # Map lowercase names to actual names
-
-            # Build a base name to files mapping for acceptable extensions
-            base_file_map = {}
-            for f in dir_files:
-                f_base, f_ext = os.path.splitext(f)
-                f_ext_lower = f_ext.lower()
-                if f_ext_lower in {'.jpg', '.jpeg', '.png', '.gif'}:
-                    base_file_map.setdefault(f_base.lower(), []).append(f)
-
-            dir_data = {
-                'file_map': file_map,
-                'base_file_map': base_file_map,
-            }
-            directory_cache[directory] = dir_data
-
-        file_map = dir_data['file_map']
-        base_file_map = dir_data['base_file_map']
-
         # Step 1: Check for an exact match (case-insensitive)
-        matched_file = file_map.get(file_name.lower())
+        matched_file = index.find(local_path)
         if matched_file:
             actual_path = os.path.join(directory, matched_file)
             # Rename file to match the expected case if needed
@@ -286,8 +348,9 @@ def verify_images(images, batch_id):
                 new_path = os.path.join(directory, new_file_name)
 
                 # Check if a file with the lowercase extension already exists
-                if not os.path.exists(new_path):
+                if not index.exists(new_path):
                     os.rename(actual_path, new_path)
+                    index.rename(actual_path, new_path)
                     logMsg(f"Renamed file: {actual_path} -> {new_path}")
                     local_path = new_path  # Update local_path to reflect the renamed file
                 else:
@@ -296,8 +359,7 @@ def verify_images(images, batch_id):
                 local_path = actual_path  # Update local_path to the actual file
         else:
             # Step 2: Attempt to find an equivalent file with a different extension
-            base_name, _ = os.path.splitext(file_name)
-            matched_files = base_file_map.get(base_name.lower())
+            matched_files = index.find_equivalent(local_path)
             if matched_files:
                 # Use the first matching file
                 actual_path = os.path.join(directory, matched_files[0])
@@ -310,7 +372,7 @@ def verify_images(images, batch_id):
                 continue
 
         # If the file exists after renaming or matching, process it
-        if os.path.exists(local_path):
+        if index.exists(local_path):
             img[IMG_URL] = process_url(local_path)  # Apply process_url after verification
             verified_images.append(img)
         else:
@@ -367,12 +429,15 @@ def process_images(gallery_images, featured_images, data_subject, data_category,
             return f"{base}{ext.lower()}"  # Convert extension to lowercase
         return img_url
 
+    # Normalise extensions, then map every image URL in one call
+    gallery_urls = url_mapper.map_urls([normalize_extension(img[IMG_URL]) for img in gallery_images])
+    featured_urls = url_mapper.map_urls([normalize_extension(img[IMG_URL]) for img in featured_images])
+
     # Add gallery images
-    for img in gallery_images:
-        img_url = normalize_extension(img[IMG_URL])
+    for img, img_url in zip(gallery_images, gallery_urls):
         images_dict[img[IMG_URL_ID]] = {
             IMG_URL_ID: img[IMG_URL_ID],
-            IMG_URL: process_url(img_url),  # Replace base path
+            IMG_URL: img_url,  # Replace base path
             IMG_TITLE: img[IMG_TITLE],
             IMG_SRC: img[IMG_SRC],
             IMG_DESC1: img[IMG_TITLE],
@@ -382,11 +447,10 @@ def process_images(gallery_images, featured_images, data_subject, data_category,
         }
 
     # Add or update featured images
-    for img in featured_images:
-        img_url = normalize_extension(img[IMG_URL])
+    for img, img_url in zip(featured_images, featured_urls):
         images_dict[img[IMG_URL_ID]] = {
             IMG_URL_ID: img[IMG_URL_ID],
-            IMG_URL: process_url(img_url),  # Replace base path
+            IMG_URL: img_url,  # Replace base path
             IMG_TITLE: img[IMG_TITLE],
             IMG_SRC: img[IMG_SRC],
             IMG_DESC1: img[IMG_TITLE],
@@ -408,14 +472,16 @@ def process_images(gallery_images, featured_images, data_subject, data_category,
 
 def select_default_image(default_image_url, gallery_images, featured_images, media_images, batch_id):
     #logMsg('select_default_image()')
+    index = get_image_index()
+
     # Validate provided default image URL
-    if default_image_url and os.path.exists(default_image_url):
+    if default_image_url and index.exists(default_image_url):
         return process_url(default_image_url)
 
     # Helper function to find the first valid 'wiki' image
     def find_first_wiki_image(images):
         for img in images:
-            if img.get(IMG_SRC) == 'wiki' and os.path.exists(img.get(IMG_URL)):
+            if img.get(IMG_SRC) == 'wiki' and index.exists(img.get(IMG_URL)):
                 return process_url(img[IMG_URL])  # Process URL directly
 
     # Search for the first 'wiki' image
@@ -454,35 +520,7 @@ def process_url(url):
     Returns:
         str: Mapped production-ready path or URL.
     """
-    #logMsg(f"Processing URL: {url}")
-
-    # Regular expression to validate a complete URL
-    url_regex = re.compile(
-        r'^(?:http|ftp)s?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # IPv4
-        r'\[?[A-F0-9]*:[A-F0-9:]+\]?)'  # IPv6
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE
-    )
-
-    # If the URL is valid (web URL), return it as is
-    if re.match(url_regex, url):
-        return url
-
-    # Map local file paths
-    file_name = os.path.basename(url)
-    for pattern, folder in URL_PATTERNS.items():
-        if pattern in url:
-            mapped_path = os.path.join(PRODUCTION_BASE_PATH, folder, file_name)
-            #logMsg(f"Mapped local path: {mapped_path}")
-            return mapped_path
-
-    # Default fallback for unmapped paths
-    fallback_path = os.path.join(PRODUCTION_BASE_PATH, file_name)
-    #logMsg(f"Default mapped path: {fallback_path}")
-    return fallback_path
+    return url_mapper.map_url(url)
 
 
 def transform_data(insights):
@@ -554,147 +592,324 @@ def transform_data(insights):
     return transformed_data
 
 
-def save_to_json(transformed_data, out_dir):
+def get_manifest(manifests, out_dir, category):
+    """Return the category's ContentManifest, loading it into manifests on first use."""
+    if category not in manifests:
+        manifests[category] = ContentManifest(os.path.join(out_dir, content_root, category, MANIFEST_FILE))
+    return manifests[category]
+
+def source_row_hash(record):
+    """Hash of a feed row, used to detect rows that changed since the last run."""
+    return content_hash(json.dumps(record, sort_keys=True, default=str))
+
+def insight_output_path(category_output_dir, url_id, item):
+    """Output path of one insight, based on its content_name and cluster_id."""
+    content_name = item[INSIGHT_DETAILS].get(CONTENT_NAME, DEFAULT_CONTENT_NAME)
+    if content_name == MAIN_FEED:
+        return os.path.join(category_output_dir, f"bkds_main_feed.json")
+    cluster_id = item[INSIGHT_DETAILS].get(CLUSTER_ID, DEFAULT_CLUSTER)
+    return os.path.join(category_output_dir, cluster_id, url_id, f"{url_id}_{content_name}.json")
+
+def save_to_json(transformed_data, out_dir, manifests=None, source_hashes=None, save_manifests=True):
+    """
+    Write each insight as minimized JSON, touching disk only when its content changed.
+
+    Every item is serialised once and its hash compared with the category manifest,
+    so an unchanged insight costs one stat and one dict lookup. Changed outputs are
+    written with a temp file + rename after the previous version is zipped to the
+    category archive folder. Outputs from before the manifest existed are hashed once
+    on first sight.
+
+    manifests (dict, optional): category -> ContentManifest already loaded by the caller.
+    source_hashes (dict, optional): url_id -> source row hash recorded with each entry.
+    save_manifests (bool): False when the caller merges and saves the manifests itself.
+
+    With insight_store_enabled, every insight whose output matches (written or unchanged)
+    is also upserted into the category InsightStore unless the store already holds that
+    content hash.
+    """
     logMsg("Starting save_to_json")
+    manifests = {} if manifests is None else manifests
+    source_hashes = source_hashes or {}
 
     for category, items in transformed_data.items():
-        logMsg(f"Saving category: {category}")
         category_output_dir = os.path.join(out_dir, content_root, category)
-        os.makedirs(category_output_dir, exist_ok=True)
         archive_dir = os.path.join(category_output_dir, ARCHIVE)
-        os.makedirs(archive_dir, exist_ok=True)
+        manifest = get_manifest(manifests, out_dir, category)
+        written = unchanged = failed = 0
+        store = InsightStore(category_output_dir) if insight_store_enabled else None
+        store_hashes = store.hashes(items) if store else {}
+        store_rows = []
 
         for url_id, item in items.items():
-            logMsg(f"Saving URL_ID: {url_id}")
-            # The rest of the function remains the same...
-
+            # Recorded only once the output is known to match, so a failed write is retried next run
+            source_fields = {SOURCE_HASH: source_hashes[url_id]} if url_id in source_hashes else {}
             content_name = item[INSIGHT_DETAILS].get(CONTENT_NAME, DEFAULT_CONTENT_NAME)
             cluster_id = item[INSIGHT_DETAILS].get(CLUSTER_ID, DEFAULT_CLUSTER)
-
-            # Determine the output path for each URL_ID based on content_name and cluster_id
-            if content_name == 'main_feed':
-                logMsg(f" content_name main_feed: {content_name}")
-                subject_output_path = os.path.join(category_output_dir, f"bkds_main_feed.json")
-            else:
-                logMsg(f"NOT MAIN FEED os.path.join(category_output_dir, cluster_id, url_id):\n {os.path.join(category_output_dir, cluster_id, url_id)}")
-                content_dir = os.path.join(category_output_dir, cluster_id, url_id)
-                os.makedirs(content_dir, exist_ok=True)
-                subject_output_path = os.path.join(content_dir, f"{url_id}_{content_name}.json")
-
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            raw_output_path = os.path.join(content_dir, f"{url_id}_{content_name}_raw_{timestamp}.json")
-            archive_path = os.path.join(archive_dir, f"{url_id}_{content_name}_{timestamp}.zip")
+            subject_output_path = insight_output_path(category_output_dir, url_id, item)
 
             try:
-                logMsg(f"minimizing: {raw_output_path}")
-                # Write minimized JSON data directly
-                with open(raw_output_path, 'w') as f:
-                    ujson.dump([item], f)  # Save directly as minimized JSON
-
-                #logMsg(f"Raw JSON file for {url_id} in content {content_name} saved successfully at {raw_output_path}")
-
-                # Read the raw JSON data using ujson
-                with open(raw_output_path, 'r') as f:
-                    raw_json_data = ujson.load(f)
-
-                # Minify the JSON data without extra spaces or line breaks
-                minimized_json = ujson.dumps(raw_json_data)
-
-                # Compare with existing file content if it exists
-                logMsg(f"checking existence: {subject_output_path}")
-                if os.path.exists(subject_output_path):
+                # Serialise once; the hash is what gets compared from here on
+                minimized_json = ujson.dumps([item])
+                payload_hash = content_hash(minimized_json)
+
+                entry = manifest.get(url_id)
+                output_exists = os.path.exists(subject_output_path)
+                if output_exists and entry and entry.get(OUTPUT_PATH) == subject_output_path:
+                    existing_hash = entry.get(CONTENT_HASH)
+                elif output_exists:
+                    # Written before the manifest existed; hash it once
                     with open(subject_output_path, 'r') as f:
-                        existing_data = ujson.load(f)
-
-                    # Serialize both datasets for comparison
-                    existing_data_serialized = ujson.dumps(existing_data)
-                    new_data_serialized = minimized_json
-
-                    # Compare the existing data with the new data
-                    if existing_data_serialized == new_data_serialized:
-                        #logMsg(f"No changes detected for {subject_output_path}. Skipping write.")
-                        os.remove(raw_output_path)  # Clean up raw file
-                        continue
-
-                    timestamped_output_path = f"{subject_output_path}_{timestamp}"
-                    os.rename(subject_output_path, timestamped_output_path)
-                    #logMsg(f"Renamed existing JSON file to {timestamped_output_path}")
-
-                    with zipfile.ZipFile(archive_path, 'w') as archive:
-                        archive.write(raw_output_path, os.path.basename(raw_output_path))
-                        archive.write(timestamped_output_path, os.path.basename(timestamped_output_path))
-                        #logMsg(f"Archive created successfully at {archive_path}")
-
-                    # Delete the previous batch file after archiving
-                    os.remove(timestamped_output_path)
-                    #logMsg(f"Deleted previous batch file after archiving")
+                        existing_hash = content_hash(ujson.dumps(ujson.load(f)))
                 else:
+                    existing_hash = None
+
+                # Main feed items are not insight files; the aggregation skips them
+                store_row = None
+                if store and content_name != MAIN_FEED and store_hashes.get(str(url_id)) != payload_hash:
+                    store_row = (url_id, cluster_id, os.path.relpath(subject_output_path, category_output_dir),
+                                 payload_hash, minimized_json)
+
+                if existing_hash == payload_hash:
+                    if store_row:
+                        store_rows.append(store_row)
+                    if not entry or entry.get(CONTENT_HASH) != payload_hash:
+                        manifest.update(url_id, **{OUTPUT_PATH: subject_output_path, CONTENT_HASH: payload_hash,
+                                                   LAST_WRITE: int(os.path.getmtime(subject_output_path))}, **source_fields)
+                    elif source_fields and entry.get(SOURCE_HASH) != source_fields[SOURCE_HASH]:
+                        manifest.update(url_id, **source_fields)
+                    unchanged += 1
+                    continue
+
+                if output_exists:
+                    # Keep the replaced version, as before
+                    os.makedirs(archive_dir, exist_ok=True)
+                    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+                    archive_path = os.path.join(archive_dir, f"{url_id}_{content_name}_{timestamp}.zip")
                     with zipfile.ZipFile(archive_path, 'w') as archive:
-                        archive.write(raw_output_path, os.path.basename(raw_output_path))
-                        #logMsg(f"Archive created successfully at {archive_path}")
-                
-                logMsg(f"finished checking existence: {subject_output_path}")
-
-                # Write the minified JSON data
-                with open(subject_output_path, 'w') as f:
-                    f.write(minimized_json)
-
-                #logMsg(f"JSON file for {url_id} in content {content_name} saved successfully at {subject_output_path}")
+                        archive.write(subject_output_path, f"{os.path.basename(subject_output_path)}_{timestamp}")
+                else:
+                    os.makedirs(os.path.dirname(subject_output_path), exist_ok=True)
 
-                # Delete the raw file after archiving
-                os.remove(raw_output_path)
-                #logMsg(f"Deleted raw batch file after archiving")
+                atomic_write(subject_output_path, minimized_json)
+                manifest.update(url_id, **{OUTPUT_PATH: subject_output_path, CONTENT_HASH: payload_hash,
+                                           LAST_WRITE: int(time.time())}, **source_fields)
+                if store_row:
+                    store_rows.append(store_row)
+                written += 1
 
             except Exception as e:
+                failed += 1
                 logMsg(f"Failed to save JSON file for {url_id} at {subject_output_path}: {e}")
 
+        if save_manifests:
+            manifest.save()
+        if store:
+            try:
+                store.put_many(store_rows)
+            except Exception as e:
+                logMsg(f"Failed to update insight store for {category}: {e}")
+            finally:
+                store.close()
+        logMsg(f"Saved category {category}: {written} written, {unchanged} unchanged, {failed} failed"
+               + (f", {len(store_rows)} stored" if store else ""))
+
 
 from multiprocessing import Pool, cpu_count
-def process_category_data(category_item):
-    category_id, category_insights = category_item
-    logMsg(f"Processing category {category_id} with {len(category_insights)} insights.")
-    try:
-        # Transform data for this category
-        transformed_data = transform_data(category_insights)
-        # Save the transformed data to JSON
-        save_to_json(transformed_data, out_dir)
-    except Exception as e:
-        logMsg(f"Error processing category {category_id}: {e}")
-    logMsg(f"Finished processing category {category_id}")
 
-def process_cluster_data(cluster_item):
-    cluster_id, cluster_insights = cluster_item
-    logMsg(f"Processing cluster {cluster_id} with {len(cluster_insights)} insights.")
+def init_worker():
+    """
+    Pool initialiser, run once per worker. Workers never touch the database: the
+    parent streams the feed, owns the manifests and hands out self-contained chunks.
+    Drop the DB pool reference and HTTP session inherited from the parent (their
+    sockets stay the parent's) so each worker starts with its own state.
+    """
+    global remote_checker
+    close_db_pool()
+    remote_checker = None
+
+def process_chunk(chunk):
+    """
+    Transform and save one chunk of insights in a worker.
+
+    chunk is (records, source_hashes, manifest_entries, collect) where manifest_entries
+    holds the current manifest entries of the chunk's url_ids by category. Returns the
+    changed manifest entries for the parent to merge, plus timing for the
+    utilisation report. With collect, also returns the insights as (output_path, item)
+    so later pipeline stages can use them without reading the files back.
+    """
+    records, source_hashes, manifest_entries, collect = chunk
+    start_time = time.time()
+    manifests = {category: ContentManifest(os.path.join(out_dir, content_root, category, MANIFEST_FILE), entries)
+                 for category, entries in manifest_entries.items()}
+    error = None
+    items = []
     try:
-        # Transform data for this cluster
-        transformed_data = transform_data(cluster_insights)
-        # Save the transformed data to JSON
-        save_to_json(transformed_data, out_dir)
+        transformed_data = transform_data(records)
+        save_to_json(transformed_data, out_dir, manifests, source_hashes, save_manifests=False)
+        if collect:
+            items = [(insight_output_path(os.path.join(out_dir, content_root, category), url_id, item), item)
+                     for category, category_items in transformed_data.items()
+                     for url_id, item in category_items.items()
+                     if item[INSIGHT_DETAILS].get(CONTENT_NAME, DEFAULT_CONTENT_NAME) != MAIN_FEED]
     except Exception as e:
-        logMsg(f"Error processing cluster {cluster_id}: {e}")
-    logMsg(f"Finished processing cluster {cluster_id}")
+        error = str(e)
+        logMsg(f"Error processing chunk of {len(records)} insights: {e}")
+    return {
+        'pid': os.getpid(),
+        'busy': time.time() - start_time,
+        'records': len(records),
+        'error': error,
+        'updates': {category: manifest.changed_entries() for category, manifest in manifests.items()},
+        'items': items,
+    }
+
+def build_chunks(records, chunk_rows):
+    """
+    Split records into chunks of at most chunk_rows, keeping each cluster together
+    where it fits. Large clusters come first so stragglers start early.
+    """
+    clusters = {}
+    for record in records:
+        cluster_key = (record.get(DATA_CATEGORY, ''), record.get(CLUSTER_ID, DEFAULT_CLUSTER))
+        clusters.setdefault(cluster_key, []).append(record)
+
+    parts = [cluster_records[start:start + chunk_rows]
+             for cluster_records in clusters.values()
+             for start in range(0, len(cluster_records), chunk_rows)]
+
+    # First-fit decreasing: cluster slices fill chunks without splitting further
+    chunks = []
+    for part in sorted(parts, key=len, reverse=True):
+        for chunk in chunks:
+            if len(chunk) + len(part) <= chunk_rows:
+                chunk.extend(part)
+                break
+        else:
+            chunks.append(list(part))
+    return chunks
+
+def report_utilisation(worker_stats, wall_secs, num_workers):
+    """Log records, chunks and busy time per worker against the pool's wall time."""
+    total_busy = sum(stats['busy'] for stats in worker_stats.values())
+    for pid, stats in sorted(worker_stats.items()):
+        logMsg(f"Worker {pid}: {stats['chunks']} chunks, {stats['records']} insights, "
+               f"busy {stats['busy']:.1f}s ({100 * stats['busy'] / wall_secs:.0f}% of {wall_secs:.1f}s)")
+    logMsg(f"Pool utilisation: {100 * total_busy / (wall_secs * num_workers):.0f}% across {num_workers} workers")
+
+def remove_vanished_outputs(seen_ids):
+    """
+    Delete outputs (and manifest entries) of url_ids that are no longer in the feed.
+
+    seen_ids is the set of (data_category, url_id) pairs from a complete run. A
+    path still referenced by a live entry (the shared main feed file) is kept.
+    """
+    content_path = os.path.join(out_dir, content_root)
+    if not os.path.isdir(content_path):
+        return
+    removed = 0
+    for category_entry in os.scandir(content_path):
+        if not category_entry.is_dir():
+            continue
+        manifest = ContentManifest(os.path.join(category_entry.path, MANIFEST_FILE))
+        vanished = [url_id for url_id in manifest.entries if (category_entry.name, url_id) not in seen_ids]
+        if not vanished:
+            continue
+        live_paths = {entry.get(OUTPUT_PATH) for url_id, entry in manifest.entries.items() if url_id not in vanished}
+        for url_id in vanished:
+            output_path = manifest.get(url_id).get(OUTPUT_PATH)
+            manifest.remove(url_id)
+            if not output_path or output_path in live_paths or not os.path.exists(output_path):
+                continue
+            os.remove(output_path)
+            removed += 1
+            # Drop the now empty url_id / cluster folders
+            output_dir = os.path.dirname(output_path)
+            while output_dir != category_entry.path and not os.listdir(output_dir):
+                os.rmdir(output_dir)
+                output_dir = os.path.dirname(output_dir)
+        manifest.save()
+        # Keep an existing store in step even when this run did not enable it
+        if InsightStore.exists(category_entry.path):
+            store = InsightStore(category_entry.path)
+            store.delete(vanished)
+            store.close()
+    logMsg(f"Removed {removed} outputs of vanished url_ids.")
+
+def process_feed(batches, collect=False):
+    """
+    Transform and save the feed given as an iterable of record batches: filter
+    (incremental), chunk, run the pool, merge and save the manifests, report, and
+    sweep vanished outputs. Returns the saved insights as (output_path, item) when
+    collect is set (used by bkds_contentPipeline), else an empty list.
+    """
+    num_workers = cpu_count()
+    logMsg(f"Using {num_workers} worker processes (incremental={incremental}, chunk_rows={chunk_rows}).")
+    seen_ids = set()
+    manifests = {}
+    worker_stats = {}
+    start_time = time.time()
+
+    # Sweep images/full_size once; forked workers inherit the index read-only
+    get_image_index()
+
+    collected = []
+
+    # Create the pool before the feed cursor opens so workers fork without DB state
+    with Pool(processes=num_workers, initializer=init_worker) as pool:
+        # Batches are consumed lazily; stream_data opens its cursor on the first one
+        for batch_num, insights in enumerate(batches):
+            source_hashes = {}
+            changed_insights = []
+            for record in insights:
+                url_id = record.get(URL_ID, '')
+                seen_ids.add((record.get(DATA_CATEGORY, ''), str(url_id)))
+                source_hashes[url_id] = source_row_hash(record)
+                entry = get_manifest(manifests, out_dir, record.get(DATA_CATEGORY, '')).get(url_id)
+                if (incremental and entry and entry.get(SOURCE_HASH) == source_hashes[url_id]
+                        and os.path.exists(entry.get(OUTPUT_PATH, ''))):
+                    continue
+                changed_insights.append(record)
+
+            chunks = []
+            for chunk_records in build_chunks(changed_insights, chunk_rows):
+                manifest_entries = {}
+                for record in chunk_records:
+                    category = record.get(DATA_CATEGORY, '')
+                    entry = manifests[category].get(record.get(URL_ID, ''))
+                    manifest_entries.setdefault(category, {})
+                    if entry:
+                        manifest_entries[category][str(record.get(URL_ID, ''))] = entry
+                chunk_hashes = {record.get(URL_ID, ''): source_hashes[record.get(URL_ID, '')] for record in chunk_records}
+                chunks.append((chunk_records, chunk_hashes, manifest_entries, collect))
+
+            logMsg(f"Batch {batch_num}: {len(changed_insights)} of {len(insights)} insights to process in {len(chunks)} chunks.")
+            imap_chunksize = max(1, len(chunks) // (num_workers * 4))
+            for result in pool.imap_unordered(process_chunk, chunks, chunksize=imap_chunksize):
+                for category, entries in result['updates'].items():
+                    manifests[category].merge(entries)
+                stats = worker_stats.setdefault(result['pid'], {'chunks': 0, 'records': 0, 'busy': 0.0})
+                stats['chunks'] += 1
+                stats['records'] += result['records']
+                stats['busy'] += result['busy']
+                collected.extend(result['items'])
+
+    for manifest in manifests.values():
+        manifest.save()
+
+    if worker_stats:
+        report_utilisation(worker_stats, max(time.time() - start_time, 1e-6), num_workers)
+
+    # Only a complete, non-empty feed can tell which url_ids vanished
+    if incremental and seen_ids:
+        remove_vanished_outputs(seen_ids)
+    return collected
 
 def main():
     """ Main execution function. """
     logMsg(f"Starting main @ {datetime.now()}")
-
-    insights = fetch_data(get_sqlTemplate(INSIGHT_QUERY_KEY))
-
-    # Partition the data by data_category_id
-    insights_by_category = {}
-    for record in insights:
-        category_id = record.get(DATA_CATEGORY_ID, DEFAULT_CLUSTER)
-        insights_by_category.setdefault(category_id, []).append(record)
-
-    # Determine the number of worker processes
-    num_workers = min(cpu_count(), len(insights_by_category))
-    logMsg(f"Using {num_workers} worker processes.")
-
-    # Create a pool of worker processes
-    with Pool(processes=num_workers) as pool:
-        # Process each category in parallel
-        pool.map(process_category_data, insights_by_category.items())
-
+    # Stream the feed in bounded batches instead of loading it all up front
+    process_feed(stream_data(get_sqlTemplate(INSIGHT_QUERY_KEY), STREAM_BATCH_SIZE))
     logMsg("Script execution completed.")
 
 
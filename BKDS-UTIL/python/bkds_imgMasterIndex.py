@@ -9,6 +9,8 @@
 #   URLs, handles missing images, and saves the processed data into a master
 #   JSON file and category-specific JSON files. It also archives existing JSON
 #   files if changes are detected, ensuring that only updated data is stored.
+#   Each category file is also split into fixed-size page shards plus a page
+#   index under images/pages, which the imageGrid route reads page by page.
 #
 # Usage:
 #   python image_processor.py <batch_id>
@@ -23,7 +25,7 @@
 #   - Python 3.x
 #   - Modules: os, re, ujson, time, random, argparse, zipfile, datetime
 #     collections.defaultdict
-#   - Custom modules: bkds_Utilities (providing log_msg, fetch_data, get_sqlTemplate)
+#   - Custom modules: bkds_Utilities (providing log_msg, stream_data, get_sqlTemplate)
 #
 # Author:
 #   [Your Name]
@@ -44,7 +46,7 @@ import argparse
 import zipfile
 from datetime import datetime
 from collections import defaultdict
-from bkds_Utilities import log_msg, fetch_data, get_sqlTemplate
+from bkds_Utilities import log_msg, stream_data, get_sqlTemplate, UrlMapper, write_page_shards
 
 ##########################################
 # Main setup and variables
@@ -52,6 +54,24 @@ from bkds_Utilities import log_msg, fetch_data, get_sqlTemplate
 out_dir = os.getenv('BKDS_NODEJS_DATA')
 production_base_path = os.path.join(out_dir, "images/full_size/")
 target_base_path = '/data/images/full_size/'
+# Mapping of patterns to folders for local image paths
+pattern_to_folder = {
+    'yt': 'youtube',
+    'youtube': 'youtube',
+    'flickr': 'flickr',
+    'wiki': 'wiki'
+}
+# This script's web-URL check also accepts a '/' straight after an IPv6 host
+# (before the port), which WEB_URL_REGEX does not; kept so its mapping is unchanged
+web_url_regex = re.compile(
+    r'^(?:http|ftp)s?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # ...or IPv4
+    r'\[?[A-F0-9]*:[A-F0-9:]+\]?)/?'  # ...or IPv6
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+url_mapper = UrlMapper(production_base_path, pattern_to_folder, url_regex=web_url_regex)
 program_name = os.path.basename(__file__)
 
 def parse_arguments():
@@ -62,6 +82,9 @@ def parse_arguments():
 args = parse_arguments()
 batch_id = args.batch_id
 insight_query_key = 'bkds_contentGen_web_feed_master'
+stream_batch_size = 500
+# Images per page shard read by the imageGrid route
+image_page_size = 100
 output_file = os.path.join(out_dir, "images", "master_image_photos_index.json")
 archive_dir = os.path.join(out_dir, "archive")
 
@@ -84,32 +107,7 @@ def safely_parse_json(json_data):
     return json_data
 
 def process_url(url):
-    # Mapping of patterns to folders
-    pattern_to_folder = {
-        'yt': 'youtube',
-        'youtube': 'youtube',
-        'flickr': 'flickr',
-        'wiki': 'wiki'
-    }
-
-    # Regex to check if the URL is an actual URL
-    url_regex = re.compile(
-        r'^(?:http|ftp)s?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
-        r'localhost|'  # localhost...
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # ...or IPv4
-        r'\[?[A-F0-9]*:[A-F0-9:]+\]?)/?'  # ...or IPv6
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-
-    # If the URL is not a valid URL, assume it's a local path
-    if not re.match(url_regex, url):
-        file_name = os.path.basename(url)
-        for pattern, folder in pattern_to_folder.items():
-            if pattern in url:
-                return os.path.join(production_base_path, folder, file_name)
-        return os.path.join(production_base_path, file_name)
-    return url
+    return url_mapper.map_url(url)
 
 def sanitize_input(input_str):
     return re.sub(r'[,\-:&\/.\s?]', '_', input_str)
@@ -164,10 +162,8 @@ def process_images(gallery_images, featured_images, data_category, data_subject,
 
     logMsg(f"Images processed: Written={written_count}, Skipped={skipped_count}, Substituted Thumbnails={substituted_count}")
 
-def transform_data(insights):
-    logMsg(f"Starting transform_data @ {datetime.now()}")
-    img_dict = {}
-
+def collect_images(insights, img_dict):
+    """Add the gallery and featured images of insights to img_dict; callable batch by batch."""
     for record in insights:
         data_category = record.get('data_category', '')
         data_subject = record.get('data_subject', '')
@@ -175,6 +171,8 @@ def transform_data(insights):
         featured_images = safely_parse_json(record.get('featured_images', '[]'))
         process_images(gallery_images, featured_images, data_category, data_subject, img_dict)
 
+def build_image_index(img_dict):
+    """Turn the collected img_dict into the shuffled, indexed image list."""
     # Convert sets to lists
     images = [
         {
@@ -191,7 +189,13 @@ def transform_data(insights):
     # Assign data_src_index starting from 0
     for index, image in enumerate(images):
         image['data_src_index'] = index
+    return images
 
+def transform_data(insights):
+    logMsg(f"Starting transform_data @ {datetime.now()}")
+    img_dict = {}
+    collect_images(insights, img_dict)
+    images = build_image_index(img_dict)
     logMsg(f"Completed transform_data @ {datetime.now()}")
     return images
 
@@ -236,18 +240,27 @@ def save_category_subject_files(images, base_path, archive_dir):
             sanitized_category = sanitize_input(category)
             category_dict[sanitized_category].append(img)
 
-    # Save category files
+    # Save category files, plus page shards in the same data_src_index order
     for category, images_list in category_dict.items():
         file_path = os.path.join(base_path, f"master_image_{category}_index.json")
         save_to_json(images_list, file_path, archive_dir)
+        write_page_shards(base_path, f"master_image_{category}_index",
+                          sorted(images_list, key=lambda x: x['data_src_index']), image_page_size)
+
+def save_image_index(images_data):
+    """Write the master image index, its page shards and the per-category files."""
+    save_to_json(images_data, output_file, archive_dir)
+    write_page_shards(os.path.dirname(output_file), os.path.splitext(os.path.basename(output_file))[0],
+                      sorted(images_data, key=lambda x: x['data_src_index']), image_page_size)
+    save_category_subject_files(images_data, os.path.join(out_dir, "images"), archive_dir)
 
 def main():
     """Main execution function."""
     logMsg(f"Starting main @ {datetime.now()}")
-    insights = fetch_data(get_sqlTemplate(insight_query_key))
+    # Consume the feed batch by batch; only the image index itself is kept in memory
+    insights = (record for batch in stream_data(get_sqlTemplate(insight_query_key), stream_batch_size) for record in batch)
     images_data = transform_data(insights)
-    save_to_json(images_data, output_file, archive_dir)
-    save_category_subject_files(images_data, os.path.join(out_dir, "images"), archive_dir)
+    save_image_index(images_data)
     logMsg("Script execution completed.")
 
 if __name__ == "__main__":